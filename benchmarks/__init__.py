@@ -0,0 +1 @@
+"""Benchmark suite tracking runtime and solution quality of all scheduler implementations."""
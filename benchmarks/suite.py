@@ -0,0 +1,373 @@
+"""Runs every scheduler implementation on seeded fixture task sets, stores the results as JSON together with machine
+metadata and compares them against a stored baseline.
+"""
+
+import dataclasses
+import datetime
+import functools
+import importlib
+import json
+import logging
+import math
+import os
+import pathlib
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Iterable
+
+import numpy as np
+
+from melon.scheduler.base import DAY_LENGTH, START_OF_DAY, AbstractScheduler, Task
+
+BENCHMARKS = pathlib.Path(__file__).parent
+BASELINE = BENCHMARKS / "baseline.json"
+SIZES = (10, 30, 80)
+SCALING_SIZES = (100, 250, 500, 1000, 2000)
+DUE_DATE_DENSITIES = (0.0, 0.5, 1.0)
+IMPLEMENTATIONS = {  # name -> (module, class)
+    "MCMCScheduler": ("melon.scheduler.purepython", "MCMCScheduler"),
+    "NumbaMCMCScheduler": ("melon.scheduler.numba", "NumbaMCMCScheduler"),
+    "RustyMCMCScheduler": ("melon.scheduler.rust", "RustyMCMCScheduler"),
+    "CppMCMCScheduler": ("melon.scheduler.cpp", "CppMCMCScheduler"),
+    "NumpyMCMCScheduler": ("melon.scheduler.vectorised", "NumpyMCMCScheduler"),
+    "ParallelTemperingScheduler": ("melon.scheduler.tempering", "ParallelTemperingScheduler"),
+    "DecomposedScheduler": ("melon.scheduler.decomposed", "DecomposedScheduler"),
+}
+
+
+@dataclasses.dataclass
+class Fixture:
+    """Slim struct describing a reproducible set of demo tasks."""
+
+    N: int  # number of tasks
+    dueDateDensity: float  # proportion of tasks with a due date
+    seed: int
+
+    @property
+    def key(self) -> str:
+        """
+        Returns:
+            str: unique name of this fixture
+        """
+        return f"N={self.N},due={self.dueDateDensity}"
+
+    def tasks(self) -> list[Task]:
+        """Generates the tasks of this fixture. Unlike generateManyDemoTasks(), due dates are relative to the start of
+        today's working slot, so that the fixture does not depend on the time of day.
+
+        Returns:
+            list[Task]: the tasks
+        """
+        rng = random.Random(self.seed)
+        start = datetime.datetime.combine(datetime.date.today(), START_OF_DAY)
+        return [
+            Task(
+                uid=str(i),
+                duration=rng.randint(1, 2 * DAY_LENGTH) / 2,
+                priority=rng.randint(1, 9),
+                location=rng.randint(0, 2),
+                due=(
+                    start + datetime.timedelta(hours=rng.randint(10, self.N * 5))
+                    if rng.random() < self.dueDateDensity
+                    else None
+                ),
+            )
+            for i in range(self.N)
+        ]
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    """Slim struct holding the measurements of one implementation on one fixture."""
+
+    implementation: str
+    fixture: str
+    runtimeMedian: float  # in seconds
+    runtimeIQR: float  # interquartile range of the runtime, in seconds
+    stepsPerSecond: float  # nominal number of Metropolis steps (15 sweeps of N² steps) per second
+    energy: float  # median final energy
+    quality: float  # lower bound of the energy divided by the final energy, 1 is optimal
+    coldStart: float | None = None  # import and first run in a fresh interpreter, in seconds
+
+
+@dataclasses.dataclass
+class ScalingPoint:
+    """Slim struct holding the measurement of one implementation on one size of the scaling curve."""
+
+    implementation: str
+    N: int  # number of tasks
+    runtime: float  # in seconds, of a single run
+    energy: float
+    quality: float  # lower bound of the energy divided by the final energy, 1 is optimal
+
+
+def defaultFixtures() -> list[Fixture]:
+    """
+    Returns:
+        list[Fixture]: the fixtures of the suite, one per size and due date density
+    """
+    return [Fixture(N, density, seed=1000 * N + int(100 * density)) for N in SIZES for density in DUE_DATE_DENSITIES]
+
+
+def availableImplementations(names: Iterable[str] | None = None) -> dict[str, type[AbstractScheduler]]:
+    """Imports the requested implementations, skipping those whose extension module or dependency is not installed.
+
+    Args:
+        names (Iterable[str] | None, optional): names of the implementations. Defaults to all of them.
+
+    Returns:
+        dict[str, type[AbstractScheduler]]: the importable scheduler classes, by name
+    """
+    implementations = {}
+    for name in names if names is not None else IMPLEMENTATIONS:
+        module, className = IMPLEMENTATIONS[name]
+        try:
+            implementations[name] = getattr(importlib.import_module(module), className)
+        except ImportError as error:
+            logging.warning(f"Skipping {name}: {error}")
+    return implementations
+
+
+def energyLowerBound(tasks: list[Task]) -> float:
+    """A lower bound of the energy: all tasks packed into as few working slots as possible, without any commute or
+    missed due date, in the order of decreasing priority, which minimises the priority penalty.
+
+    Args:
+        tasks (list[Task]): the tasks
+
+    Returns:
+        float: the lower bound
+    """
+    priorities = sorted((task.priority for task in tasks), reverse=True)
+    totalDuration = sum(task.duration for task in tasks)
+    nights = max(math.ceil(totalDuration / DAY_LENGTH) - 1, 0)  # each one adds the gap between two working slots
+    return totalDuration + nights * (24 - DAY_LENGTH) + sum(position * p for position, p in enumerate(priorities))
+
+
+def machineMetadata() -> dict[str, str | int | None]:
+    """
+    Returns:
+        dict[str, str | int | None]: description of the machine and revision that produced a set of results
+    """
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=BENCHMARKS, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+
+
+def measureColdStart(name: str, fixture: Fixture) -> float | None:
+    """Measures the latency a user sees on the first call: importing the implementation and scheduling the fixture once
+    in a fresh interpreter. For Numba, this includes either the just-in-time compilation or loading the on-disk cache.
+
+    Args:
+        name (str): name of the implementation, a key of IMPLEMENTATIONS
+        fixture (Fixture): the fixture
+
+    Returns:
+        float | None: the latency in seconds, None if the subprocess failed
+    """
+    module, className = IMPLEMENTATIONS[name]
+    script = (
+        "import time; start = time.perf_counter(); "
+        "from benchmarks.suite import Fixture; "
+        f"from {module} import {className}; "
+        f"{className}(Fixture({fixture.N}, {fixture.dueDateDensity}, {fixture.seed}).tasks()).schedule(); "
+        "print(time.perf_counter() - start)"
+    )
+    process = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=BENCHMARKS.parent)
+    if process.returncode != 0:
+        logging.warning(f"Cold start of {name} failed: {process.stderr.strip()}")
+        return None
+    return float(process.stdout.strip().splitlines()[-1])
+
+
+def benchmark(Scheduler: type[AbstractScheduler], fixture: Fixture, repeats: int = 5) -> BenchmarkResult:
+    """Runs one implementation repeatedly on a fixture. The chain seeds are derived from the fixture seed, such that
+    the pure Python, Numba, Rust and C++ implementations follow identical trajectories, and a first,
+    untimed run pays for any just-in-time compilation, so that the runtime reflects the warm latency.
+
+    Args:
+        Scheduler (type[AbstractScheduler]): the implementation
+        fixture (Fixture): the fixture
+        repeats (int, optional): number of timed runs. Defaults to 5.
+
+    Returns:
+        BenchmarkResult: the measurements
+    """
+    tasks = fixture.tasks()
+    Scheduler(tasks).schedule()  # warm-up
+    runtimes, energies = [], []
+    for repeat in range(repeats):
+        scheduler = Scheduler(tasks, seed=fixture.seed + repeat)
+        start = time.perf_counter()
+        scheduler.schedule()
+        runtimes.append(time.perf_counter() - start)
+        energies.append(min(scheduler.chainEnergies))
+    runtimeMedian = float(np.median(runtimes))
+    energy = float(np.median(energies))
+    return BenchmarkResult(
+        implementation=Scheduler.__name__,
+        fixture=fixture.key,
+        runtimeMedian=runtimeMedian,
+        runtimeIQR=float(np.subtract(*np.percentile(runtimes, [75, 25]))),
+        stepsPerSecond=15 * fixture.N**2 / runtimeMedian,
+        energy=energy,
+        quality=energyLowerBound(tasks) / energy,
+    )
+
+
+def runSuite(
+    implementations: dict[str, type[AbstractScheduler]] | None = None,
+    fixtures: list[Fixture] | None = None,
+    repeats: int = 5,
+    coldStart: bool = True,
+) -> dict:
+    """Benchmarks every implementation on every fixture.
+
+    Args:
+        implementations (dict[str, type[AbstractScheduler]] | None, optional): Defaults to all available ones.
+        fixtures (list[Fixture] | None, optional): Defaults to defaultFixtures().
+        repeats (int, optional): number of timed runs per measurement. Defaults to 5.
+        coldStart (bool, optional): whether to also measure the cold start on the first fixture. Defaults to True.
+
+    Returns:
+        dict: JSON-serialisable report with the keys "metadata" and "results"
+    """
+    implementations = implementations if implementations is not None else availableImplementations()
+    fixtures = fixtures if fixtures is not None else defaultFixtures()
+    results = []
+    for fixture in fixtures:
+        for name, Scheduler in implementations.items():
+            result = benchmark(Scheduler, fixture, repeats)
+            if coldStart and fixture is fixtures[0]:
+                result.coldStart = measureColdStart(name, fixture)
+            logging.info(
+                f"{result.implementation:30} {result.fixture:20} {result.runtimeMedian:.4f}s q={result.quality:.3f}"
+            )
+            results.append(dataclasses.asdict(result))
+    return {"metadata": machineMetadata(), "results": results}
+
+
+def scalingCurve(
+    implementations: dict[str, Callable[..., AbstractScheduler]] | None = None,
+    sizes: Iterable[int] = SCALING_SIZES,
+    dueDateDensity: float = 0.5,
+    timeLimit: float = 60.0,
+) -> dict:
+    """Measures how the runtime and quality of each implementation grow with the number of tasks, up to the size of
+    large shared calendars. Once a run takes longer than timeLimit, the larger sizes of that implementation are skipped.
+
+    Args:
+        implementations (dict[str, Callable[..., AbstractScheduler]] | None, optional): scheduler factories taking
+            the tasks and a seed, by name. Defaults to the fastest available backend, with and without decomposition.
+        sizes (Iterable[int], optional): the numbers of tasks. Defaults to SCALING_SIZES.
+        dueDateDensity (float, optional): proportion of tasks with a due date. Defaults to 0.5.
+        timeLimit (float, optional): runtime in seconds after which an implementation is not run on larger sizes.
+            Defaults to 60.0.
+
+    Returns:
+        dict: JSON-serialisable report with the keys "metadata" and "scaling"
+    """
+    if implementations is None:
+        from melon.scheduler.decomposed import DecomposedScheduler
+
+        backends = availableImplementations(["CppMCMCScheduler", "RustyMCMCScheduler", "MCMCScheduler"])
+        name, Backend = next(iter(backends.items()))
+        implementations = {
+            name: Backend,
+            f"DecomposedScheduler({name})": functools.partial(DecomposedScheduler, Backend=Backend),
+        }
+    points = []
+    for name, Scheduler in implementations.items():
+        for N in sizes:
+            fixture = Fixture(N, dueDateDensity, seed=N)
+            tasks = fixture.tasks()
+            scheduler = Scheduler(tasks, seed=fixture.seed)
+            start = time.perf_counter()
+            scheduler.schedule()
+            runtime = time.perf_counter() - start
+            energy = min(scheduler.chainEnergies)
+            points.append(ScalingPoint(name, N, runtime, energy, energyLowerBound(tasks) / energy))
+            logging.info(f"{name:40} N={N:<6} {runtime:.3f}s q={points[-1].quality:.3f}")
+            if runtime > timeLimit:
+                logging.info(f"Skipping {name} on more than {N} tasks.")
+                break
+    return {"metadata": machineMetadata(), "scaling": [dataclasses.asdict(point) for point in points]}
+
+
+def saveReport(report: dict, path: pathlib.Path):
+    """Writes a report to a JSON file.
+
+    Args:
+        report (dict): the report, as returned by runSuite()
+        path (pathlib.Path): the file
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def loadReport(path: pathlib.Path) -> dict:
+    """Reads a report from a JSON file.
+
+    Args:
+        path (pathlib.Path): the file
+
+    Returns:
+        dict: the report
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def compareReports(
+    report: dict, baseline: dict, runtimeTolerance: float = 0.25, qualityTolerance: float = 0.02
+) -> list[str]:
+    """Flags the measurements of a report that are slower or of worse quality than the baseline. A faster
+    implementation that returns worse schedules is a regression as well.
+
+    Args:
+        report (dict): the current report
+        baseline (dict): the stored baseline report
+        runtimeTolerance (float, optional): allowed relative increase of the median runtime. Defaults to 0.25.
+        qualityTolerance (float, optional): allowed absolute decrease of the quality score. Defaults to 0.02.
+
+    Returns:
+        list[str]: a description of each regression, empty if there are none
+    """
+    reference = {(result["implementation"], result["fixture"]): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = (result["implementation"], result["fixture"])
+        if key not in reference:
+            continue
+        base = reference[key]
+        name = f"{result['implementation']} on {result['fixture']}"
+        allowedRuntime = base["runtimeMedian"] * (1 + runtimeTolerance) + base["runtimeIQR"]
+        if result["runtimeMedian"] > allowedRuntime:
+            regressions.append(
+                f"{name}: runtime {result['runtimeMedian']:.4f}s exceeds baseline {base['runtimeMedian']:.4f}s"
+            )
+        if result.get("coldStart") and base.get("coldStart"):
+            if result["coldStart"] > base["coldStart"] * (1 + runtimeTolerance):
+                regressions.append(
+                    f"{name}: cold start {result['coldStart']:.2f}s exceeds baseline {base['coldStart']:.2f}s"
+                )
+        if result["quality"] < base["quality"] - qualityTolerance:
+            regressions.append(f"{name}: quality {result['quality']:.3f} below baseline {base['quality']:.3f}")
+    return regressions
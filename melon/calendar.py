@@ -1,12 +1,11 @@
 """This module contains the Calendar class."""
 
 import logging
+import re
 from typing import Iterable
 
 import caldav
 import caldav.lib.url
-import icalendar
-import vobject
 
 from .config import CONFIG_FOLDER
 from .todo import NEW_TASK_TEXT, Todo
@@ -35,18 +34,12 @@ class Calendar(caldav.Calendar):
         )
         self.syncable: Syncable | None = None
 
-    def storeToFile(self):
-        """Save the calendar objects to a local file on disk, in iCal format."""
-        ical = vobject.iCalendar()
-        assert self.syncable is not None
-        for task in self.syncable:
-            ical.add(task.vobject_instance)
-        with open(CONFIG_FOLDER / f"{self.name}.dav", "w") as f:
-            ical.serialize(f)  # type: ignore
-
     @staticmethod
     def loadFromFile(client: caldav.DAVClient, principal: caldav.Principal, name: str, sync_token: str, url: str):
-        """
+        """Loads a calendar from the .dav file of earlier versions, which stored each calendar in full, see
+        melon.store.LocalStore for the current local store. The file is only split into the raw data of its objects,
+        which are parsed lazily.
+
         Args:
             client (caldav.DAVClient): Argument
             principal (caldav.Principal): Argument
@@ -56,14 +49,16 @@ class Calendar(caldav.Calendar):
         """
         cal_url = caldav.lib.url.URL(url)
         with open(CONFIG_FOLDER / f"{name}.dav") as f:
-            ical = icalendar.Calendar.from_ical(f.read())
+            lines = f.read().splitlines(keepends=True)
         objects = []
         cal = Calendar(caldav.Calendar(client, parent=principal.calendar_home_set, name=name, url=url))
-        for task in ical.subcomponents:
-            todo = Todo.upgrade(caldav.Todo(client, parent=cal), name)
-            todo.icalendar_instance = task
-            todo.url = cal_url.join(str(task.subcomponents[0].get("uid")) + ".ics")
-            objects.append(todo)
+        starts = [i for i, line in enumerate(lines) if line.rstrip("\r\n") == "BEGIN:VCALENDAR"][1:]
+        ends = [i for i, line in enumerate(lines) if line.rstrip("\r\n") == "END:VCALENDAR"][:-1]
+        for start, end in zip(starts, ends):  # each object is a VCALENDAR nested in the VCALENDAR of the file
+            data = "".join(lines[start : end + 1])
+            uid = re.search(r"^UID:(.*?)\r?$", data, re.MULTILINE)
+            objectUrl = cal_url.join((uid.group(1) if uid else "None") + ".ics")
+            objects.append(Todo(client, objectUrl, data, cal, calendarName=name))
         cal.syncable = Syncable(cal, objects, sync_token)
         logging.info(f"Calendar {name}: loaded {len(objects)} objects.")
         return cal
@@ -81,27 +76,21 @@ class Calendar(caldav.Calendar):
             calendarName=self.name,
         )
 
-    def storageObject(self) -> dict:
-        """
+    def sync(self) -> tuple[list[Todo], list[str]]:
+        """Synchronise me
+
         Returns:
-            (dict):
+            tuple[list[Todo], list[str]]: the objects that were updated or created, and the URLs of deleted objects
         """
-        assert self.syncable is not None
-        return {
-            "url": str(self.url),
-            "token": self.syncable.sync_token,
-        }
-
-    def sync(self):
-        """Synchronise me"""
         assert self.name is not None
         assert self.syncable is not None
         updated, deleted = self.syncable.sync()
-        self.syncable.upgradeObjects(self.name)
+        upgraded = self.syncable.upgradeObjects(self.name)
         logging.info(
             f"Synced {self.name:48} ({len(updated)} updated and {len(deleted)} deleted entries.) "
             f"In total, we have {len(self.syncable)} objects."
         )
+        return upgraded, [str(object.url) for object in deleted]
 
 
 class Syncable(caldav.SynchronizableCalendarObjectCollection):
@@ -111,9 +100,21 @@ class Syncable(caldav.SynchronizableCalendarObjectCollection):
     objects: Iterable[Todo]
     sync_token: str
 
-    def upgradeObjects(self, calendarName: str):
-        """Converts all objects in self.objects to Todos."""
-        self.objects = [todo if isinstance(todo, Todo) else Todo.upgrade(todo, calendarName) for todo in self.objects]
+    def upgradeObjects(self, calendarName: str) -> list[Todo]:
+        """Converts all objects in self.objects to Todos.
+
+        Returns:
+            list[Todo]: the objects that were converted, i.e. those that were fetched since the last conversion
+        """
+        upgraded = []
+        objects = []
+        for todo in self.objects:
+            if not isinstance(todo, Todo):
+                todo = Todo.upgrade(todo, calendarName)
+                upgraded.append(todo)
+            objects.append(todo)
+        self.objects = objects
+        return upgraded
 
     @staticmethod
     def upgrade(synchronisable: caldav.SynchronizableCalendarObjectCollection, calendarName: str) -> "Syncable":
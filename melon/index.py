@@ -0,0 +1,190 @@
+"""This module contains the TaskIndex, Melon's in-memory index of todos by UID and by their scheduling properties."""
+
+import bisect
+import dataclasses
+import datetime
+from typing import Iterable
+
+from .search import SearchIndex
+from .todo import Todo
+
+
+@dataclasses.dataclass(frozen=True)
+class IndexEntry:
+    """Slim struct holding the keys under which a todo is indexed, so that its entries can be removed again."""
+
+    calendarName: str | None
+    url: str | None
+    due: datetime.datetime | None  # naive local time
+    priority: int
+    incomplete: bool
+
+
+class TaskIndex:
+    """In-memory index of todos, maintained incrementally as todos are fetched, synced, added or removed. Looking up a
+    todo by UID is O(1), and the sorted secondary indexes answer range queries on due date and priority in
+    O(log N + k). Insertion into a sorted index shifts its tail, which is a fast memory move even for many thousands of
+    todos. The text of each todo is kept in a full-text SearchIndex.
+    """
+
+    def __init__(self, search: SearchIndex | None = None) -> None:
+        """Initialises an empty index.
+
+        Args:
+            search (SearchIndex | None, optional): the full-text index, e.g. a persisted one, whose todos are only
+                re-indexed if their text changed. Defaults to an empty index.
+        """
+        self.search = search if search is not None else SearchIndex()
+        self.todos: dict[str, Todo] = {}
+        self.entries: dict[str, IndexEntry] = {}
+        self.calendars: dict[str | None, dict[str, None]] = {}  # calendar name to UIDs, dicts being ordered sets
+        self.urls: dict[str, str] = {}  # URL to UID, as deleted objects are only known by their URL
+        self.incomplete: dict[str, None] = {}
+        self.due: list[tuple[datetime.datetime, str]] = []  # sorted, only todos with due date
+        self.priority: list[tuple[int, str]] = []  # sorted, 1 being the highest priority
+
+    def __len__(self) -> int:
+        """
+        Returns:
+            int: the number of indexed todos
+        """
+        return len(self.todos)
+
+    def __contains__(self, uid: str) -> bool:
+        """
+        Args:
+            uid (str): the Unique Identifier
+
+        Returns:
+            bool: whether a todo with this UID is indexed
+        """
+        return uid in self.todos
+
+    @staticmethod
+    def dueKey(todo: Todo) -> datetime.datetime | None:
+        """
+        Args:
+            todo (Todo): the todo
+
+        Returns:
+            datetime.datetime | None: its due date as naive local time, dates becoming midnight
+        """
+        due = todo.dueDateTime
+        if due is not None and due.tzinfo is not None:
+            return due.astimezone().replace(tzinfo=None)
+        return due
+
+    def add(self, todo: Todo) -> None:
+        """Adds a todo to the index, replacing the todo with the same UID if there is one. Objects that are not todos
+        or do not have a UID are ignored.
+
+        Args:
+            todo (Todo): the todo
+        """
+        uid = todo.uid
+        if uid is None or not todo.isTodo():
+            return
+        self.remove(uid)
+        url = str(todo.url) if todo.url is not None else None
+        entry = IndexEntry(todo.calendarName, url, self.dueKey(todo), todo.priority, todo.isIncomplete())
+        self.todos[uid] = todo
+        self.entries[uid] = entry
+        self.calendars.setdefault(entry.calendarName, {})[uid] = None
+        if url is not None:
+            self.urls[url] = uid
+        if entry.incomplete:
+            self.incomplete[uid] = None
+        if entry.due is not None:
+            bisect.insort(self.due, (entry.due, uid))
+        bisect.insort(self.priority, (entry.priority, uid))
+        self.search.add(uid, todo.searchFields)
+
+    def remove(self, uid: str) -> Todo | None:
+        """Removes the todo with the given UID from the index.
+
+        Args:
+            uid (str): the Unique Identifier
+
+        Returns:
+            Todo | None: the removed todo, None if it was not indexed
+        """
+        todo = self.todos.pop(uid, None)
+        if todo is None:
+            return None
+        entry = self.entries.pop(uid)
+        del self.calendars[entry.calendarName][uid]
+        if entry.url is not None and self.urls.get(entry.url) == uid:
+            del self.urls[entry.url]
+        self.incomplete.pop(uid, None)
+        if entry.due is not None:
+            del self.due[bisect.bisect_left(self.due, (entry.due, uid))]
+        del self.priority[bisect.bisect_left(self.priority, (entry.priority, uid))]
+        self.search.remove(uid)
+        return todo
+
+    def removeUrl(self, url: str) -> Todo | None:
+        """Removes the todo stored at the given URL, which is all we know about objects deleted on the server.
+
+        Args:
+            url (str): the URL of the object
+
+        Returns:
+            Todo | None: the removed todo, None if it was not indexed
+        """
+        uid = self.urls.get(url)
+        return self.remove(uid) if uid is not None else None
+
+    def removeCalendar(self, calendarName: str | None) -> None:
+        """Removes all todos of a calendar, before it is fetched or loaded anew.
+
+        Args:
+            calendarName (str | None): the name of the calendar
+        """
+        for uid in list(self.calendars.get(calendarName, {})):
+            self.remove(uid)
+
+    def get(self, uid: str) -> Todo | None:
+        """
+        Args:
+            uid (str): the Unique Identifier
+
+        Returns:
+            Todo | None: the todo with this UID, None if there is none
+        """
+        return self.todos.get(uid)
+
+    def ofCalendar(self, calendarName: str) -> Iterable[Todo]:
+        """
+        Args:
+            calendarName (str): the name of the calendar
+
+        Returns:
+            Iterable[Todo]: the todos of the calendar
+        """
+        return [self.todos[uid] for uid in self.calendars.get(calendarName, {})]
+
+    def dueBetween(self, start: datetime.datetime, end: datetime.datetime) -> list[Todo]:
+        """
+        Args:
+            start (datetime.datetime): start of the range, naive local time, inclusive
+            end (datetime.datetime): end of the range, naive local time, exclusive
+
+        Returns:
+            list[Todo]: the todos due within the range, earliest first
+        """
+        low = bisect.bisect_left(self.due, (start,))
+        high = bisect.bisect_left(self.due, (end,))
+        return [self.todos[uid] for _, uid in self.due[low:high]]
+
+    def withPriority(self, highest: int = 0, lowest: int = 9) -> list[Todo]:
+        """
+        Args:
+            highest (int, optional): the highest priority, inclusive. Defaults to 0, which is undefined priority.
+            lowest (int, optional): the lowest priority, inclusive. Defaults to 9.
+
+        Returns:
+            list[Todo]: the todos with a priority within the range, highest priority first
+        """
+        low = bisect.bisect_left(self.priority, (highest,))
+        high = bisect.bisect_left(self.priority, (lowest + 1,))
+        return [self.todos[uid] for _, uid in self.priority[low:high]]
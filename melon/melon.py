@@ -5,22 +5,32 @@ melon = Melon()
 melon.autoInit()
 """
 
+import concurrent.futures
+import dataclasses
 import datetime
 import json
 import logging
 import uuid
-from typing import Iterable, Mapping
+from typing import Callable, Iterable, Mapping, TypeVar
 
 import caldav
 import caldav.lib.url
 import icalendar
+import numpy as np
+import recurring_ical_events
+import requests.adapters
 
 from .calendar import Calendar, Syncable
 from .config import CONFIG, CONFIG_FOLDER
-from .scheduler.base import AbstractScheduler, Task, TimeSlot
-from .scheduler.purepython import MCMCScheduler
+from .index import TaskIndex
+from .scheduler.base import AbstractScheduler, CancelToken, Locations, Task, TimeSlot
+from .scheduler.purepython import AvailabilityManager, MCMCScheduler
+from .search import SearchIndex
+from .store import LocalStore
 from .todo import Todo
 
+T = TypeVar("T")
+
 
 class Melon:
     """The Melon class, wrapping a caldav client and principal, loading specifics from the config.
@@ -29,6 +39,8 @@ class Melon:
     """
 
     HIDDEN_CALENDARS = ("calendar", None)
+    BUSY_HORIZON = datetime.timedelta(days=120)  # how far ahead recurring events are expanded into busy times
+    WORKERS = 8  # default number of calendars fetched or synced at once, and of pooled keep-alive connections
 
     def __init__(
         self,
@@ -36,6 +48,8 @@ class Melon:
         username=CONFIG["client"]["username"],
         password=CONFIG["client"]["password"],
         maxCalendars: int | None = None,
+        workers: int = CONFIG["client"].get("workers", WORKERS),
+        timeout: float | None = CONFIG["client"].get("timeout"),
     ) -> None:
         """Initialises the Melon client
 
@@ -44,11 +58,24 @@ class Melon:
             username (str, optional): Username. Defaults to CONFIG["client"]["username"].
             password (str, optional): Password. Defaults to CONFIG["client"]["password"].
             maxCalendars (int, optional): the highest number of calendars to load. Useful for testing.
+            workers (int, optional): the number of calendars fetched or synced concurrently, which is also the size
+                of the pool of keep-alive connections to the server. Defaults to CONFIG["client"]["workers"] or 8.
+            timeout (float | None, optional): timeout of each request in seconds, bounding how long a single
+                unresponsive calendar can hold up a fetch or sync. Defaults to CONFIG["client"]["timeout"] or None.
         """
-        self.client = caldav.DAVClient(url=url, username=username, password=password)
+        self.client = caldav.DAVClient(url=url, username=username, password=password, timeout=timeout)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.client.session.mount("http://", adapter)
+        self.client.session.mount("https://", adapter)
         self.calendars: dict[str, Calendar] = {}
         self.principal = None
         self.maxCalendars: int | None = maxCalendars
+        self.workers = workers
+        self.errors: dict[str, Exception] = {}  # calendars that failed during the last fetch or sync
+        self.index = TaskIndex()  # all todos of all calendars, updated through addOrUpdateTask() and removeTask()
+        self.persistSearch: bool = CONFIG.get("search", {}).get("persist", False)  # store the full-text index too
+        self.localStore = LocalStore(CONFIG_FOLDER / "melon.sqlite")  # changes are staged until store()
+        self.locations = Locations()  # the sites of the tasks of the last call of tasksToSchedule()
 
     def connect(self):
         """
@@ -63,45 +90,113 @@ class Melon:
         self.calendars = {cal.name: Calendar(cal) for cal in all_calendars if cal.name not in self.HIDDEN_CALENDARS}
         logging.info(f"Obtained {len(self.calendars)} calendars")
 
-    def _load_syncable_tasks(self, calendar):
+    def _load_syncable_tasks(self, calendar, objects: Iterable[Todo] | None = None):
         """
         Args:
             calendar: Argument
+            objects (Iterable[Todo] | None, optional): the objects of the calendar that changed.
+                Defaults to all objects of the calendar, replacing what was indexed for it before.
         """
-        for object in calendar.syncable:
-            if "vtodo" in object.vobject_instance.contents:
-                assert isinstance(object, Todo)
+        if objects is None:
+            self.index.removeCalendar(calendar.name)
+            objects = calendar.syncable
+        for object in objects:
+            assert isinstance(object, Todo)
+            if object.isTodo():
                 self.addOrUpdateTask(object)
 
-    def fetch(self):
+    def _applySyncDelta(self, calendar: Calendar, updated: list[Todo], deleted: list[str]):
+        """Updates the index with the changes of a sync.
+
+        Args:
+            calendar (Calendar): the synced calendar
+            updated (list[Todo]): the objects that were updated or created
+            deleted (list[str]): the URLs of the objects that were deleted
         """
+        self.localStore.stageSync(calendar, updated, deleted)
+        for url in deleted:
+            uid = self.index.urls.get(url)
+            if uid is not None:
+                self.removeTask(uid)
+        self._load_syncable_tasks(calendar, updated)
+
+    def _forEachCalendar(self, work: Callable[[Calendar], T]) -> dict[str, T]:
+        """Runs the given work, usually network round trips, for all calendars concurrently on a pool of self.workers
+        threads, which share the keep-alive connections of the client. A calendar whose work raises is logged and
+        recorded in self.errors, without affecting the others.
+
         Args:
+            work (Callable[[Calendar], T]): the work for a single calendar, executed within a worker thread
+
+        Returns:
+            dict[str, T]: the result for each calendar that succeeded, in the order of self.calendars
+        """
+        self.errors = {}
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            futures = {name: executor.submit(work, calendar) for name, calendar in self.calendars.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as error:
+                logging.warning(f"Calendar {name} failed: {error!r}")
+                self.errors[name] = error
+        return results
+
+    def fetch(self):
+        """Fetches all objects of all calendars concurrently, see _forEachCalendar(). Calendars that failed are left
+        without objects and are listed in self.errors.
         """
         if not self.calendars:
             self.connect()
-        for calendar in self.calendars.values():
+
+        def fetchCalendar(calendar: Calendar) -> Syncable:
             assert calendar.name is not None
-            calendar.syncable = Syncable.upgrade(calendar.objects_by_sync_token(load_objects=True), calendar.name)
+            return Syncable.upgrade(calendar.objects_by_sync_token(load_objects=True), calendar.name)
+
+        for name, syncable in self._forEachCalendar(fetchCalendar).items():
+            calendar = self.calendars[name]
+            calendar.syncable = syncable
+            self.localStore.stageCalendar(calendar)
             self._load_syncable_tasks(calendar)
             logging.info(f"Fetched {len(calendar.syncable)} full objects!")
 
     def store(self):
+        """Writes the objects that changed since the last store() to the local store, in a single transaction,
+        together with the sync tokens of the calendars.
         """
-        Args:
-        """
-        for calendar in self.calendars.values():
-            calendar.storeToFile()
-        with open(CONFIG_FOLDER / "synctokens.json", "w") as f:
-            json.dump({cal.name: cal.storageObject() for cal in self.calendars.values()}, f)
-        logging.info(f"Stored {len(self.calendars)} calendars to disk.")
+        written = self.localStore.commit(self.calendars)
+        if self.persistSearch:
+            self.index.search.save(CONFIG_FOLDER / "search.json")
+        logging.info(f"Stored {written} changed objects of {len(self.calendars)} calendars to disk.")
 
     def load(self):
-        """
-        Args:
+        """Loads the calendars from the local store. Their objects are only parsed when they are accessed. The .dav
+        files of earlier versions are loaded if there is no local store yet, and migrated by the next store().
         """
         if self.principal is None:
             self.principal = self.client.principal()
             logging.info("Obtained principal")
+        searchFile = CONFIG_FOLDER / "search.json"
+        if self.persistSearch and searchFile.exists() and not self.index:
+            self.index = TaskIndex(SearchIndex.load(searchFile))
+        if self.localStore.exists():
+            for name, url, token in self.localStore.storedCalendars()[: self.maxCalendars]:
+                calendar = Calendar(
+                    caldav.Calendar(self.client, parent=self.principal.calendar_home_set, name=name, url=url)
+                )
+                objects = [stored.toObject(calendar) for stored in self.localStore.query("calendar = ?", (name,))]
+                calendar.syncable = Syncable(calendar, objects, token)
+                self.calendars[name] = calendar
+        else:
+            self._loadDavFiles()
+        logging.info(f"Loaded {len(self.calendars)} calendars from disk.")
+        for calendar in self.calendars.values():
+            self._load_syncable_tasks(calendar)
+        self.index.search.retain(self.index.todos)  # drops todos of the persisted index that no longer exist
+
+    def _loadDavFiles(self):
+        """Loads the calendars from the .dav files and sync tokens of earlier versions, and stages them for store()."""
         with open(CONFIG_FOLDER / "synctokens.json") as f:
             data = json.load(f)
         for file in CONFIG_FOLDER.glob("*.dav"):
@@ -109,60 +204,60 @@ class Melon:
             self.calendars[name] = Calendar.loadFromFile(
                 self.client, self.principal, name, data[name]["token"], data[name]["url"]
             )
+            self.localStore.stageCalendar(self.calendars[name])
             if self.maxCalendars is not None and len(self.calendars) >= self.maxCalendars:
                 break
-        logging.info(f"Loaded {len(self.calendars)} calendars from disk.")
-        for calendar in self.calendars.values():
-            self._load_syncable_tasks(calendar)
 
     def autoInit(self):
         """
         Args:
         """
-        tokensfile = CONFIG_FOLDER / "synctokens.json"
-        if not tokensfile.exists():
-            self.fetch()
-        else:
+        if self.localStore.exists() or (CONFIG_FOLDER / "synctokens.json").exists():
             self.load()
+        else:
+            self.fetch()
 
     def syncCalendar(self, calendar: Calendar):
         """
         Args:
             calendar: Argument
         """
-        calendar.sync()
-        self._load_syncable_tasks(calendar)
+        self._applySyncDelta(calendar, *calendar.sync())
 
     def syncAll(self):
+        """Syncs all calendars concurrently, see _forEachCalendar(). Calendars that failed keep their previous objects
+        and are listed in self.errors.
         """
-        Args:
-        """
-        for calendar in self.calendars.values():
-            self.syncCalendar(calendar)
+        for name, delta in self._forEachCalendar(lambda calendar: calendar.sync()).items():
+            self._applySyncDelta(self.calendars[name], *delta)
 
     def allTasks(self) -> Iterable[Todo]:
         """Returns an iterable of all tasks in all calendars as a single list
 
-        Yields:
-            Iterator[Iterable[Todo]]: iterator of all tasks
+        Returns:
+            Iterable[Todo]: all tasks
         """
-        for calendar in self.calendars.values():
-            if calendar.syncable is None:
-                continue
-            for object in calendar.syncable.objects:
-                if object.uid is None or not object.isTodo():
-                    continue
-                yield object
+        return self.index.todos.values()
 
     def allIncompleteTasks(self) -> Iterable[Todo]:
         """Returns all incomplete todos
 
-        Yields:
-            Iterator[Iterable[Todo]]: incomplete todos
+        Returns:
+            Iterable[Todo]: incomplete todos
+        """
+        return [self.index.todos[uid] for uid in self.index.incomplete]
+
+    def tasksDueBetween(self, start: datetime.datetime, end: datetime.datetime) -> list[Todo]:
+        """Returns the tasks due within a time range, such as this week, in O(log N + k).
+
+        Args:
+            start (datetime.datetime): start of the range, naive local time, inclusive
+            end (datetime.datetime): end of the range, naive local time, exclusive
+
+        Returns:
+            list[Todo]: the tasks, earliest due date first
         """
-        for todo in self.allTasks():
-            if todo.isIncomplete():
-                yield todo
+        return self.index.dueBetween(start, end)
 
     def getTask(self, uid: str) -> Todo:
         """Returns task with given UID
@@ -176,29 +271,39 @@ class Melon:
         Returns:
             Todo: the Todo with given uid
         """
-        for object in self.allTasks():
-            if object.uid == uid:
-                return object
-        raise ValueError(f"Task with UID {uid} not found.")
+        todo = self.index.get(uid)
+        if todo is None:
+            raise ValueError(f"Task with UID {uid} not found.")
+        return todo
 
-    def findTask(self, string: str) -> Iterable[Todo]:
-        """Finds a task given a search query
+    def findTask(self, string: str, limit: int | None = None) -> Iterable[Todo]:
+        """Finds tasks whose SUMMARY, DESCRIPTION, CATEGORIES or LOCATION contain all words of a search query, as a
+        whole word, the start of a word or any substring, see melon.search.SearchIndex.
 
         Args:
             string (str): the search query.
+            limit (int | None, optional): the largest number of results. Defaults to no limit.
 
-        Yields:
-            Iterator[Iterable[Todo]]: the generated search results.
+        Returns:
+            Iterable[Todo]: the search results, best matches first.
         """
-        for object in self.allTasks():
-            if string in object.data and object.isTodo():
-                yield object
+        return [self.index.todos[uid] for uid, _ in self.index.search.search(string, limit)]
 
     def addOrUpdateTask(self, todo: Todo):
-        """
+        """Called for every todo that was fetched, loaded or changed by a sync. Subclasses extending this must call it.
+
         Args:
             todo (Todo): Argument
         """
+        self.index.add(todo)
+
+    def removeTask(self, uid: str):
+        """Called for every todo that was deleted on the server. Subclasses extending this must call it.
+
+        Args:
+            uid (str): the Unique Identifier
+        """
+        self.index.remove(uid)
 
     def exportScheduleAsCalendar(self, scheduling: Mapping[str, TimeSlot]) -> icalendar.Calendar:
         """A read-only ICS calendar containing scheduled tasks. Can be stored to disk using schedule.to_ical().
@@ -212,9 +317,8 @@ class Melon:
         schedule = icalendar.Calendar()
         schedule.add("prodid", "-//Melon//example.org//")
         schedule.add("version", "2.0")
-        todos = {t.uid: t for t in self.allTasks()}
         for uid, slot in scheduling.items():
-            event = icalendar.Event(summary=todos[uid].summary)
+            event = icalendar.Event(summary=self.index.todos[uid].summary)
             event.add("dtstart", slot.timestamp)
             event.add("dtend", slot.end)
             event.add("dtstamp", datetime.datetime.now())
@@ -222,24 +326,149 @@ class Melon:
             schedule.add_component(event)
         return schedule
 
+    def busySlots(self, start: datetime.datetime, end: datetime.datetime) -> Iterable[TimeSlot]:
+        """The times between start and end at which the user is busy, according to the events in all calendars.
+        Recurring events are expanded into their occurrences, and transparent events (TRANSP:TRANSPARENT) are skipped.
+
+        Args:
+            start (datetime.datetime): start of the time range, naive local time
+            end (datetime.datetime): end of the time range, naive local time
+
+        Yields:
+            Iterator[Iterable[TimeSlot]]: the busy times, in no particular order
+        """
+        for calendar in self.calendars.values():
+            if calendar.syncable is None:
+                continue
+            for object in calendar.syncable.objects:
+                if object.isTodo():
+                    continue
+                for event in recurring_ical_events.of(object.icalendar_instance).between(start, end):
+                    if event.name != "VEVENT" or str(event.get("transp", "OPAQUE")).upper() == "TRANSPARENT":
+                        continue
+                    eventStart, eventEnd = event.get("dtstart"), event.get("dtend") or event.get("dtstart")
+                    eventStart, eventEnd = self._localTime(eventStart.dt), self._localTime(eventEnd.dt)
+                    if eventEnd == eventStart and not isinstance(event["dtstart"].dt, datetime.datetime):
+                        eventEnd += datetime.timedelta(days=1)  # a date without DTEND lasts the whole day
+                    yield TimeSlot(eventStart, (eventEnd - eventStart).total_seconds() / 3600)
+
+    @staticmethod
+    def _localTime(value: datetime.date) -> datetime.datetime:
+        """
+        Args:
+            value (datetime.date): a date, or a naive or aware datetime
+
+        Returns:
+            datetime.datetime: the naive local time, dates becoming midnight
+        """
+        if not isinstance(value, datetime.datetime):
+            return datetime.datetime.combine(value, datetime.time())
+        if value.tzinfo is not None:
+            return value.astimezone().replace(tzinfo=None)
+        return value
+
+    def availability(self, start: datetime.datetime | None = None) -> AvailabilityManager:
+        """The availability of the user: the default working hours minus the busy times from all calendars.
+
+        Args:
+            start (datetime.datetime | None, optional): the earliest time to consider. Defaults to now.
+
+        Returns:
+            AvailabilityManager: the availability, with busy times up to BUSY_HORIZON after start
+        """
+        start = start if start is not None else datetime.datetime.now()
+        return AvailabilityManager(busy=self.busySlots(start, start + self.BUSY_HORIZON))
+
     def tasksToSchedule(self) -> list[Task]:
-        """Returns all incomplete tasks as scheduler.Task objects
+        """Returns all incomplete tasks as scheduler.Task objects. A todo depends on the todos it names with
+        RELTYPE=DEPENDS-ON or CHILD, and a parent todo depends on its children, which name it with RELTYPE=PARENT.
+        The sites of the tasks are interned into self.locations, see travelCosts().
 
         Returns:
-            list[Task]: _description_
+            list[Task]: the tasks, with their dependencies among each other
         """
-        return list(map(Todo.toTask, self.allIncompleteTasks()))
+        todos = list(self.allIncompleteTasks())
+        self.locations = Locations()
+        children: dict[str, list[str]] = {}
+        for todo in todos:
+            for reltype, uid in todo.relations:
+                if reltype == "PARENT":
+                    children.setdefault(uid, []).append(todo.uid)
+        tasks = []
+        for todo in todos:
+            task = todo.toTask(self.locations)
+            extra = [uid for uid in children.get(task.uid, []) if uid not in task.dependsOn]
+            tasks.append(dataclasses.replace(task, dependsOn=task.dependsOn + tuple(extra)))
+        return tasks
+
+    def travelCosts(self) -> np.ndarray:
+        """Builds the travel cost matrix between the sites of the last call of tasksToSchedule(), from the travel times
+        in the [travel] table of the configuration, or estimated from the coordinates of the sites.
 
-    def scheduleAllAndExport(self, file: str, Scheduler: type[AbstractScheduler] = MCMCScheduler):
+        Returns:
+            np.ndarray: (L, L) travel cost matrix, see Locations.travelCosts()
+        """
+        return self.locations.travelCosts(CONFIG.get("travel"))
+
+    def storeSchedule(self, schedule: Mapping[str, TimeSlot]):
+        """Stores the order of a schedule next to the sync tokens, to warm-start the next scheduler run from it.
+
+        Args:
+            schedule (Mapping[str, TimeSlot]): Mapping of task UID to TimeSlot
+        """
+        ordering = sorted(schedule, key=lambda uid: schedule[uid].timestamp)
+        with open(CONFIG_FOLDER / "schedule.json", "w") as f:
+            json.dump({"ordering": ordering}, f)
+
+    def loadSchedule(self) -> list[str]:
+        """Loads the order of the last stored schedule.
+
+        Returns:
+            list[str]: UIDs of the scheduled tasks in chronological order, empty if no schedule was stored yet
+        """
+        file = CONFIG_FOLDER / "schedule.json"
+        if not file.exists():
+            return []
+        with open(file) as f:
+            return json.load(f)["ordering"]
+
+    def scheduleAllAndExport(
+        self,
+        file: str,
+        Scheduler: type[AbstractScheduler] = MCMCScheduler,
+        warmStart: bool = True,
+        timeBudget: float | None = None,
+        cancelToken: CancelToken | None = None,
+        fastMode: bool = False,
+    ):
         """Runs the scheduler on all tasks and exports as an ICS file.
 
         Args:
             file (str): filesystem path that the ics file should be exported to
+            Scheduler (type[AbstractScheduler], optional): the scheduler implementation. Defaults to MCMCScheduler.
+            warmStart (bool, optional): whether to refine the last stored schedule instead of annealing from scratch.
+                Defaults to True.
+            timeBudget (float | None, optional): seconds after which the best schedule found so far is exported.
+                Defaults to no budget.
+            cancelToken (CancelToken | None, optional): token to stop the scheduler early from another thread, which
+                also exports the best schedule found so far. Defaults to None.
+            fastMode (bool, optional): whether to skip the MCMC and export the best greedy ordering right away.
+                Defaults to False.
         """
         logging.info("Initialising scheduler.")
         scheduler = Scheduler(self.tasksToSchedule())
+        scheduler.setAvailability(self.availability(scheduler.table.start))
+        scheduler.setTravelCosts(self.travelCosts())
+        previous = self.loadSchedule() if warmStart else []
+        if previous:
+            scheduler.warmStart(previous)
         logging.info(f"Scheduling {len(scheduler.tasks)} tasks now.")
-        schedule = scheduler.schedule()
+        if fastMode:
+            schedule = scheduler.scheduleGreedy()
+        else:
+            schedule = scheduler.schedule(timeBudget=timeBudget, cancelToken=cancelToken, greedy=True)
+        logging.info(f"Scheduler stopped after {scheduler.steps} steps ({scheduler.stopReason}).")
+        self.storeSchedule(schedule)
         logging.info("Exporting.")
         export = self.exportScheduleAsCalendar(schedule)
         logging.info("Export calendar created.")
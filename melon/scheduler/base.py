@@ -1,14 +1,43 @@
 """The scheduler algorithm"""
 
+import asyncio
+import bisect
+import concurrent.futures
 import dataclasses
+import heapq
+import json
+import logging
+import math
+import multiprocessing
+import os
+import queue
 import random
-from datetime import datetime, time, timedelta
-from typing import Mapping
+import time as clock
+from datetime import date, datetime, time, timedelta
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Generator, Iterator, Mapping, Sequence
+
+import graphlib
+import numpy as np
+
+if TYPE_CHECKING:
+    from .purepython import AvailabilityManager
 
 START_OF_DAY = time(10, 0)
 DAY_LENGTH = 14
 INITIAL_TEMPERATURE = 0.4
 SWEEP_EXPONENT = -2.0
+SWEEPS = 15  # sweeps of the annealing schedule, at temperatures INITIAL_TEMPERATURE * k**SWEEP_EXPONENT, k = 1, 2, ...
+WARM_START_SWEEPS = 3  # number of final, low-temperature sweeps run when refining a previous schedule
+COMMUTE_PENALTY = 30.0  # per hour of travel between two sites, and for every change of site of unknown distance
+TRAVEL_SPEED = 30.0  # in km/h, to estimate the travel time between two sites from their coordinates
+EARTH_RADIUS = 6371.0  # in km
+ON_TIME_PENALTY = 100.0
+SPLITMIX_GAMMA = 0x9E3779B97F4A7C15  # increment and multipliers of the SplitMix64 generator shared by all backends
+SPLITMIX_MULTIPLIERS = (0xBF58476D1CE4E5B9, 0x94D049BB133111EB)
+CHECK_INTERVAL = 1024  # number of Metropolis steps between two checks of the time budget and the cancel token
+CANCEL_POLL_INTERVAL = 0.05  # seconds between two checks of the cancel token while schedule() waits for chains
+STOP_REASONS = ("finished", "timeBudget", "maxSteps", "cancelled")  # indexed by the codes of the native backends
+MOVE_TYPES = ("swap", "insertion", "blockMove", "reversal")  # indexed by the move codes of the native backends
 
 
 @dataclasses.dataclass
@@ -18,8 +47,9 @@ class Task:
     uid: str  # unique identifier of the task
     duration: float  # estimated, in hours
     priority: int  # between 1 and 9
-    location: int  # number indicating the location, where 0 is "hybrid"
+    location: int  # number indicating the location, where 0 is "hybrid", see Locations
     due: datetime | None  # when the task is due
+    dependsOn: tuple[str, ...] = ()  # UIDs of the tasks that have to be done before this one
 
     def asTuple(self, start: datetime) -> tuple[str, float, int, int, float]:
         """Returns a low-level representation of this instance.
@@ -36,7 +66,7 @@ class Task:
             self.duration,
             self.priority,
             self.location,
-            (self.due - start).total_seconds() / 3600 if self.due is not None else 0,
+            (self.due - start).total_seconds() / 3600 if self.due is not None else 0.0,
         )
 
 
@@ -64,16 +94,1380 @@ class TimeSlot:
         return self.timestamp + self.timedelta
 
 
+class Locations:
+    """Interns the sites at which tasks are done to small integers, which index the rows and columns of a travel cost
+    matrix. Location 0 is "hybrid", such tasks can be done from anywhere. The sites "home" and "work" are always 1 and
+    2, as they used to be the only ones.
+    """
+
+    def __init__(self) -> None:
+        """Initialises the registry with the hybrid location and the default sites."""
+        self.names: list[str] = ["", "home", "work"]  # location -> site name
+        self.indices = {name: location for location, name in enumerate(self.names)}
+        self.coordinates: dict[int, tuple[float, float]] = {}  # location -> (latitude, longitude), in degrees
+
+    def intern(self, name: str | None, coordinates: tuple[float, float] | None = None) -> int:
+        """Looks up the location of a site, registering it the first time it is seen.
+
+        Args:
+            name (str | None): name of the site, compared case-insensitively. None or empty for a hybrid task.
+            coordinates (tuple[float, float] | None, optional): latitude and longitude of the site. Defaults to None.
+
+        Returns:
+            int: the location
+        """
+        if not name or not name.strip():
+            return 0
+        key = name.strip().casefold()
+        location = self.indices.get(key)
+        if location is None:
+            location = self.indices[key] = len(self.names)
+            self.names.append(key)
+        if coordinates is not None:
+            self.coordinates.setdefault(location, coordinates)
+        return location
+
+    def travelHours(self, origin: int, destination: int, known: Mapping[tuple[str, str], float]) -> float:
+        """Estimates the travel time between two sites.
+
+        Args:
+            origin (int): location of the first site
+            destination (int): location of the second site
+            known (Mapping[tuple[str, str], float]): known travel times in hours, by pair of site names
+
+        Returns:
+            float: the travel time in hours, if known in either direction, else from the great-circle distance of the
+                coordinates at TRAVEL_SPEED, else one hour
+        """
+        a, b = self.names[origin], self.names[destination]
+        if (a, b) in known or (b, a) in known:
+            return known.get((a, b), known.get((b, a), 1.0))
+        if origin in self.coordinates and destination in self.coordinates:
+            latitudeA, longitudeA = map(math.radians, self.coordinates[origin])
+            latitudeB, longitudeB = map(math.radians, self.coordinates[destination])
+            haversine = (
+                math.sin((latitudeB - latitudeA) / 2) ** 2
+                + math.cos(latitudeA) * math.cos(latitudeB) * math.sin((longitudeB - longitudeA) / 2) ** 2
+            )
+            return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(haversine, 1.0))) / TRAVEL_SPEED
+        return 1.0
+
+    def travelCosts(self, travelTimes: Mapping[str, Mapping[str, float]] | None = None) -> np.ndarray:
+        """Builds the travel cost matrix of all sites registered so far, once all tasks are interned.
+
+        Args:
+            travelTimes (Mapping[str, Mapping[str, float]] | None, optional): known travel times in hours, by origin
+                and destination site, e.g. {"home": {"office": 0.5}}. A time given for one direction is used for both,
+                unless the other one is given too. Defaults to estimating all of them.
+
+        Returns:
+            np.ndarray: (L, L) float64 matrix, COMMUTE_PENALTY per hour of travel from location i to location j
+        """
+        known = {
+            (origin.strip().casefold(), destination.strip().casefold()): float(hours)
+            for origin, destinations in (travelTimes or {}).items()
+            for destination, hours in destinations.items()
+        }
+        L = len(self.names)
+        travel = np.zeros((L, L))
+        for origin in range(1, L):
+            for destination in range(1, L):
+                if origin != destination:
+                    travel[origin, destination] = COMMUTE_PENALTY * self.travelHours(origin, destination, known)
+        return travel
+
+
+def flatTravelCosts(size: int) -> np.ndarray:
+    """The travel cost matrix charging COMMUTE_PENALTY for every change between two different sites.
+
+    Args:
+        size (int): number of locations L, including the hybrid location 0
+
+    Returns:
+        np.ndarray: (L, L) float64 matrix, zero on the diagonal and in row and column 0
+    """
+    travel = np.full((size, size), COMMUTE_PENALTY)
+    np.fill_diagonal(travel, 0.0)
+    travel[0, :] = travel[:, 0] = 0.0
+    return travel
+
+
+class SlotTable:
+    """Sorted, non-overlapping free working slots, in hours relative to TaskTable.start, shared by all backends.
+    Each task is placed at the earliest time after the end of the previous task at which it fits into a free slot.
+    Next to the start and end of each slot, a sparse table holds the length of the longest slot in every block of 2^k
+    consecutive slots, which finds the next slot of at least a given length by binary lifting, in O(log S).
+    """
+
+    def __init__(self, starts: Sequence[float], ends: Sequence[float]) -> None:
+        """Initialises the table and precomputes its sparse table.
+
+        Args:
+            starts (Sequence[float]): start of each slot, in hours, sorted in ascending order
+            ends (Sequence[float]): end of each slot, in hours, at most the start of the next slot
+        """
+        self.starts = np.ascontiguousarray(starts, dtype=np.float64)
+        self.ends = np.ascontiguousarray(ends, dtype=np.float64)
+        S = len(self.starts)
+        if len(self.ends) != S or np.any(self.ends < self.starts) or np.any(self.starts[1:] < self.ends[:-1]):
+            raise ValueError("Slots must be sorted, non-overlapping intervals.")
+        levels = [self.ends - self.starts]
+        while 2 ** len(levels) <= S:
+            width, previous = 2 ** (len(levels) - 1), levels[-1]
+            levels.append(np.concatenate((np.maximum(previous[:-width], previous[width:]), previous[-width:])))
+        # row 0 holds the starts, row 1 the ends, row 2 + k the longest slot among slots i, ..., i + 2^k - 1
+        self.array = np.ascontiguousarray(np.vstack([self.starts, self.ends, *levels]))
+        self.longest = float(levels[0].max()) if S else 0.0
+        self._starts, self._ends = self.starts.tolist(), self.ends.tolist()
+        self._levels = [level.tolist() for level in levels]
+
+    @staticmethod
+    def daily(count: int, dayLength: float = DAY_LENGTH) -> "SlotTable":
+        """The default availability: a working slot of dayLength hours at the same time every day, starting at t = 0.
+
+        Args:
+            count (int): the number of days
+            dayLength (float, optional): the length of each slot, in hours. Defaults to DAY_LENGTH.
+
+        Returns:
+            SlotTable: the table
+        """
+        starts = 24.0 * np.arange(count)
+        return SlotTable(starts, starts + dayLength)
+
+    def __len__(self) -> int:
+        """
+        Returns:
+            int: the number of slots
+        """
+        return len(self._starts)
+
+    def firstLongEnough(self, slot: int, duration: float) -> int:
+        """Finds the first slot at or after the given one that is at least duration hours long, by binary lifting.
+
+        Args:
+            slot (int): index of the first slot to consider
+            duration (float): the required length, in hours
+
+        Returns:
+            int: index of the slot, or len(self) if there is none
+        """
+        levels, S = self._levels, len(self._starts)
+        for k in range(len(levels) - 1, -1, -1):
+            if slot + 2**k <= S and levels[k][slot] < duration:
+                slot += 2**k
+        return slot
+
+    def nextSlot(self, stamp: float, duration: float) -> tuple[float, float]:
+        """Places a task that cannot start before stamp at the earliest time at which it fits into a free slot.
+
+        Args:
+            stamp (float): earliest start of the task, in hours
+            duration (float): duration of the task, in hours
+
+        Raises:
+            RuntimeError: when the task does not fit into any slot of the table
+
+        Returns:
+            tuple[float, float]: the start of the task and the end of its slot, in hours
+        """
+        slot = bisect.bisect_right(self._ends, stamp)  # the slot containing stamp, or the next one
+        if slot < len(self._starts) and max(stamp, self._starts[slot]) + duration <= self._ends[slot]:
+            return max(stamp, self._starts[slot]), self._ends[slot]
+        slot = self.firstLongEnough(slot + 1, duration)
+        if slot >= len(self._starts):
+            raise RuntimeError("The tasks do not fit into the free slots of the calendar, extend the slot table.")
+        return self._starts[slot], self._ends[slot]
+
+    def nextSlots(self, stamps: np.ndarray, durations: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Vectorised nextSlot(), placing a batch of tasks at once.
+
+        Args:
+            stamps (np.ndarray): earliest start of each task, in hours
+            durations (np.ndarray): duration of each task, in hours
+
+        Raises:
+            RuntimeError: when a task does not fit into any slot of the table
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: the start of each task and the end of its slot, in hours
+        """
+        S, levels = len(self.starts), self.array[2:]
+        if S == 0:
+            raise RuntimeError("The tasks do not fit into the free slots of the calendar, extend the slot table.")
+        slots = np.searchsorted(self.ends, stamps, side="right")
+        current = np.minimum(slots, S - 1)
+        starts = np.maximum(stamps, self.starts[current])
+        fits = (slots < S) & (starts + durations <= self.ends[current])
+        slots = np.where(fits, slots, slots + 1)
+        for k in range(len(levels) - 1, -1, -1):
+            jump = ~fits & (slots + 2**k <= S)
+            jump[jump] &= levels[k][slots[jump]] < durations[jump]
+            slots = np.where(jump, slots + 2**k, slots)
+        if np.any(slots >= S):
+            raise RuntimeError("The tasks do not fit into the free slots of the calendar, extend the slot table.")
+        return np.where(fits, starts, self.starts[slots]), self.ends[slots]
+
+
+def packBits(matrix: np.ndarray) -> np.ndarray:
+    """Packs the rows of a boolean matrix into bitsets.
+
+    Args:
+        matrix (np.ndarray): (N, M) boolean matrix
+
+    Returns:
+        np.ndarray: C-contiguous uint64 (N, W) array, W = max(ceil(M / 64), 1), bit j of row i being entry (i, j)
+    """
+    N, M = matrix.shape
+    words = max(-(-M // 64), 1)
+    padded = np.zeros((N, 64 * words), dtype=np.uint8)
+    padded[:, :M] = matrix
+    return np.ascontiguousarray(np.packbits(padded, axis=1, bitorder="little").view(np.uint64))
+
+
+def checkTravelCosts(travel: np.ndarray, location: np.ndarray) -> np.ndarray:
+    """Validates a travel cost matrix against the locations of the tasks.
+
+    Args:
+        travel (np.ndarray): (L, L) travel cost matrix
+        location (np.ndarray): location of each task
+
+    Raises:
+        ValueError: if the matrix is not square, has negative costs or does not cover every location
+
+    Returns:
+        np.ndarray: the matrix as a C-contiguous float64 array, as taken by the native backends
+    """
+    travel = np.ascontiguousarray(travel, dtype=np.float64)
+    if travel.ndim != 2 or travel.shape[0] != travel.shape[1] or np.any(travel < 0):
+        raise ValueError("The travel cost matrix must be a square matrix of non-negative costs.")
+    if len(location) > 0 and (location.min() < 0 or location.max() >= len(travel)):
+        raise ValueError("Every location must index a row of the travel cost matrix.")
+    return travel
+
+
+def precedenceClosure(tasks: Sequence[Task]) -> np.ndarray:
+    """Builds the precedence DAG from the dependencies of the tasks and its transitive closure, such that a single bit
+    test tells whether one task has to be done before another. Dependencies on UIDs outside the given tasks, e.g.
+    completed ones, are ignored.
+
+    Args:
+        tasks (Sequence[Task]): the tasks
+
+    Raises:
+        ValueError: when the dependencies form a cycle
+
+    Returns:
+        np.ndarray: uint64 (N, W) bitset, bit j of row i is set if task j has to be done before task i
+    """
+    indices = {task.uid: index for index, task in enumerate(tasks)}
+    graph = {index: {indices[uid] for uid in task.dependsOn if uid in indices} for index, task in enumerate(tasks)}
+    try:
+        order = list(graphlib.TopologicalSorter(graph).static_order())
+    except graphlib.CycleError as error:
+        raise ValueError(f"The dependencies of tasks {[tasks[i].uid for i in error.args[1]]} form a cycle.")
+    closure = [0] * len(tasks)  # Python integers as bitsets
+    for index in order:
+        for dependency in graph[index]:
+            closure[index] |= closure[dependency] | 1 << dependency
+    words = max(-(-len(tasks) // 64), 1)
+    return np.array(
+        [[bits >> (64 * word) & 0xFFFFFFFFFFFFFFFF for word in range(words)] for bits in closure], dtype=np.uint64
+    ).reshape(len(tasks), words)
+
+
+@dataclasses.dataclass
+class TaskTable:
+    """Columnar representation of a list of tasks, shared by all scheduler backends.
+    Each column is a contiguous NumPy array indexed by task, which the native backends read through the buffer protocol
+    without copying. UIDs never leave Python: they are kept in a side table mapping index to UID.
+    """
+
+    uids: list[str]  # index -> UID
+    duration: np.ndarray  # float64, in hours
+    priority: np.ndarray  # int64, between 1 and 9
+    location: np.ndarray  # int64, where 0 is "hybrid", see Locations
+    due: np.ndarray  # float64, in hours relative to start, 0 if there is no due date
+    start: datetime  # time reference, equivalent to t = 0
+    slots: SlotTable  # the free working slots the tasks are spread across
+    before: np.ndarray  # uint64 (N, W) bitset, bit j of row i is set if task j has to be done before task i
+    travel: np.ndarray  # float64 (L, L), cost of doing a task at location j right after one at location i
+
+    @staticmethod
+    def fromTasks(
+        tasks: Sequence[Task],
+        start: datetime | None = None,
+        slots: SlotTable | None = None,
+        travel: np.ndarray | None = None,
+    ) -> "TaskTable":
+        """Builds the table from a list of tasks.
+
+        Args:
+            tasks (Sequence[Task]): the tasks
+            start (datetime, optional): time reference for the due dates. Defaults to the start of today's working slot.
+            slots (SlotTable | None, optional): the free working slots. Defaults to a slot of DAY_LENGTH hours every
+                day, beginning at start, enough to hold all tasks.
+            travel (np.ndarray | None, optional): the travel cost matrix, see Locations.travelCosts(). Defaults to
+                COMMUTE_PENALTY for every change of site (see flatTravelCosts()).
+
+        Returns:
+            TaskTable: the table, indexed in the order of the given tasks
+        """
+        if start is None:
+            start = datetime.combine(date.today(), START_OF_DAY)
+        if slots is None:
+            slots = SlotTable.daily(len(tasks) + 1)  # every task fits into a fresh day, so we never need more
+        location = np.fromiter((task.location for task in tasks), dtype=np.int64, count=len(tasks))
+        if travel is None:
+            travel = flatTravelCosts(int(location.max(initial=0)) + 1)
+        return TaskTable(
+            uids=[task.uid for task in tasks],
+            duration=np.fromiter((task.duration for task in tasks), dtype=np.float64, count=len(tasks)),
+            priority=np.fromiter((task.priority for task in tasks), dtype=np.int64, count=len(tasks)),
+            location=location,
+            due=np.fromiter((task.asTuple(start)[4] for task in tasks), dtype=np.float64, count=len(tasks)),
+            start=start,
+            slots=slots,
+            before=precedenceClosure(tasks),
+            travel=checkTravelCosts(travel, location),
+        )
+
+    def columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]: the columns
+                (duration, priority, location, due), followed by the flat array form of the slot table (see SlotTable),
+                the travel cost matrix and the precedence bitset, as taken by the native backends
+        """
+        return self.duration, self.priority, self.location, self.due, self.slots.array, self.travel, self.before
+
+    def precedence(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: (N, N) boolean matrix, entry (i, j) is True if task j has to be done before task i
+        """
+        bits = np.unpackbits(self.before.view(np.uint8), axis=1, bitorder="little")
+        return bits[:, : len(self)].astype(bool)
+
+    @property
+    def constrained(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: (N,) boolean array, whether each task has to be done before or after any other task
+        """
+        precedence = self.precedence()
+        return precedence.any(axis=0) | precedence.any(axis=1)
+
+    def feasibleOrder(self, ordering: Sequence[int]) -> list[int]:
+        """Reorders the given tasks as little as possible, such that every task comes after the tasks it depends on.
+        Among the tasks whose dependencies are all placed, the one coming first in the given ordering is placed next.
+
+        Args:
+            ordering (Sequence[int]): task indices, possibly only some of the tasks
+
+        Returns:
+            list[int]: the same task indices, in an order respecting the precedence among them
+        """
+        if not self.before.any():
+            return list(ordering)
+        precedence = self.precedence()
+        rank = {index: position for position, index in enumerate(ordering)}
+        waiting = {index: int(precedence[index, list(rank)].sum()) for index in rank}
+        ready = [(rank[index], index) for index, count in waiting.items() if count == 0]
+        heapq.heapify(ready)
+        result = []
+        while ready:
+            _, index = heapq.heappop(ready)
+            result.append(index)
+            for successor in np.flatnonzero(precedence[:, index]).tolist():
+                if successor in waiting:
+                    waiting[successor] -= 1
+                    if waiting[successor] == 0:
+                        heapq.heappush(ready, (rank[successor], successor))
+        return result
+
+    def window(self, indices: Sequence[int], offset: float) -> "TaskTable":
+        """The sub-table of the given tasks, with its time reference moved offset hours later, such that they are
+        spread across the free slots as if they followed tasks ending at offset.
+
+        Args:
+            indices (Sequence[int]): the tasks of the window
+            offset (float): the new time reference, in hours relative to self.start
+
+        Returns:
+            TaskTable: the window, indexed in the order of the given indices
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        due = self.due[indices] - offset
+        due[due == 0] = np.nextafter(0.0, -1.0)  # still due, at the very start of the window
+        due[self.due[indices] == 0] = 0.0
+        keep = self.slots.ends > offset
+        return TaskTable(
+            uids=[self.uids[index] for index in indices],
+            duration=self.duration[indices],
+            priority=self.priority[indices],
+            location=self.location[indices],
+            due=due,
+            start=self.start + timedelta(hours=offset),
+            slots=SlotTable(np.maximum(self.slots.starts[keep] - offset, 0.0), self.slots.ends[keep] - offset),
+            before=packBits(self.precedence()[np.ix_(indices, indices)]),
+            travel=self.travel,
+        )
+
+    def __len__(self) -> int:
+        """
+        Returns:
+            int: the number of tasks
+        """
+        return len(self.uids)
+
+
+class EnergyEngine:
+    """Incremental evaluator of the MCMC energy of an ordering of tasks, in hours relative to the first working slot.
+
+    A full evaluation caches the end of each task and the end of the free slot it was placed into, per position.
+    A swap proposal then only touches the priority and commute terms around the two swapped positions, and re-spreads
+    the ordering from the first swapped position onward, stopping as soon as the new spread re-joins the cached one.
+    Insertions, block moves and reversals permute a window of positions and are evaluated the same way.
+    Moves that would put a task before one it depends on are rejected before any energy evaluation, with an infinite
+    energy difference.
+    """
+
+    def __init__(
+        self,
+        durations: Sequence[float],
+        priorities: Sequence[int],
+        locations: Sequence[int],
+        dues: Sequence[float],
+        slots: SlotTable | None = None,
+        before: Sequence[int] | None = None,
+        travel: Sequence[Sequence[float]] | None = None,
+    ) -> None:
+        """Initialises the engine on the columns of a low-level task representation.
+
+        Args:
+            durations (Sequence[float]): duration of each task, in hours
+            priorities (Sequence[int]): priority of each task
+            locations (Sequence[int]): location of each task, where 0 is "hybrid"
+            dues (Sequence[float]): due date of each task, in hours, or 0 if there is no due date
+            slots (SlotTable | None, optional): the free working slots. Defaults to SlotTable.daily().
+            before (Sequence[int] | None, optional): per task, the bitset of the tasks that have to be done before it,
+                as an integer, see TaskTable.before. Defaults to no dependencies.
+            travel (Sequence[Sequence[float]] | None, optional): the travel cost matrix, see TaskTable.travel.
+                Defaults to COMMUTE_PENALTY for every change of site.
+        """
+        self.durations = list(durations)
+        self.priorities = list(priorities)
+        self.locations = list(locations)
+        self.dues = list(dues)
+        self.slots = slots if slots is not None else SlotTable.daily(len(self.durations) + 1)
+        self.before = list(before) if before is not None else [0] * len(self.durations)
+        if travel is None:
+            travel = flatTravelCosts(max(self.locations, default=0) + 1)
+        self.travel = [list(row) for row in travel]
+        after = 0  # bitset of all tasks that some other task depends on
+        for bits in self.before:
+            after |= bits
+        self.constrained = [bits != 0 or after >> index & 1 == 1 for index, bits in enumerate(self.before)]
+        self.hasPrecedence = after != 0
+        self.state: list[int] = []
+        self.ends: list[float] = []
+        self.slotEnds: list[float] = []
+        self.energy = 0.0
+        self.respreads = 0  # number of task placements recomputed by incremental evaluations so far
+        self._proposal: tuple[float, int, int, list[int] | None, list[float], list[float]] | None = None
+
+    @staticmethod
+    def fromTable(table: TaskTable) -> "EnergyEngine":
+        """Builds an engine on the columns of a task table.
+
+        Args:
+            table (TaskTable): the tasks, indexed by the states passed to the engine
+
+        Returns:
+            EnergyEngine: the engine
+        """
+        columns = (table.duration, table.priority, table.location, table.due)
+        before = [int.from_bytes(row.tobytes(), "little") for row in table.before]
+        return EnergyEngine(*(column.tolist() for column in columns), table.slots, before, table.travel.tolist())
+
+    def commute(self, previous: int, current: int) -> float:
+        """Commute penalty for doing task `current` right after task `previous`, looked up in the travel cost matrix.
+
+        Args:
+            previous (int): index of the previous task
+            current (int): index of the current task
+
+        Returns:
+            float: the penalty, 0 if either task is hybrid or both are done at the same site
+        """
+        return self.travel[self.locations[previous]][self.locations[current]]
+
+    def reset(self, state: Sequence[int]) -> float:
+        """Fully evaluates the energy of the given state and caches its spread.
+
+        Args:
+            state (Sequence[int]): the ordering of task indices
+
+        Returns:
+            float: the energy / penalty for this state
+        """
+        self.state = list(state)
+        self.ends = [0.0] * len(self.state)
+        self.slotEnds = [0.0] * len(self.state)
+        self._proposal = None
+        slotEnd, stamp = -math.inf, 0.0
+        energy = 0.0
+        for position, index in enumerate(self.state):
+            duration = self.durations[index]
+            if duration > self.slots.longest:
+                raise RuntimeError(
+                    "You are trying to schedule a task longer than any working slot."
+                    "Split it into smaller chunks! Automatic splitting is not supported."
+                )
+            if stamp + duration > slotEnd:
+                stamp, slotEnd = self.slots.nextSlot(stamp, duration)
+            stamp += duration
+            self.ends[position] = stamp
+            self.slotEnds[position] = slotEnd
+            energy += position * self.priorities[index]
+            if position > 0:
+                due = self.dues[index]
+                if due != 0 and due < stamp:
+                    energy += ON_TIME_PENALTY
+                energy += self.commute(self.state[position - 1], index)
+        if self.state:
+            energy += self.ends[-1]
+        self.energy = energy
+        return energy
+
+    def terms(self, state: Sequence[int]) -> "EnergyTerms":
+        """Evaluates the energy of the given state term by term, for instrumentation. This does not touch the cache.
+
+        Args:
+            state (Sequence[int]): the ordering of task indices
+
+        Returns:
+            EnergyTerms: the terms, which add up to the energy computed by reset()
+        """
+        slotEnd, stamp = -math.inf, 0.0
+        priority = commute = onTime = 0.0
+        for position, index in enumerate(state):
+            if stamp + self.durations[index] > slotEnd:
+                stamp, slotEnd = self.slots.nextSlot(stamp, self.durations[index])
+            stamp += self.durations[index]
+            priority += position * self.priorities[index]
+            if position > 0:
+                if self.dues[index] != 0 and self.dues[index] < stamp:
+                    onTime += ON_TIME_PENALTY
+                commute += self.commute(state[position - 1], index)
+        return EnergyTerms(stamp if len(state) > 0 else 0.0, priority, commute, onTime)
+
+    def starts(self) -> list[float]:
+        """
+        Returns:
+            list[float]: start of the task at each position of the current state, in hours
+        """
+        return [end - self.durations[index] for end, index in zip(self.ends, self.state)]
+
+    def swapFeasible(self, low: int, high: int) -> bool:
+        """Checks whether swapping the tasks at two positions keeps every task after the tasks it depends on. A swap of
+        two unconstrained tasks is always feasible, and a swap of a task with one of its dependencies is rejected with
+        a single bit test. Otherwise, the tasks in between must not depend on the first or be a dependency of the last.
+
+        Args:
+            low (int): first position within the state
+            high (int): second position within the state, greater than low
+
+        Returns:
+            bool: whether the proposed state is feasible, given that the current one is
+        """
+        taskLow, taskHigh = self.state[low], self.state[high]
+        if not (self.constrained[taskLow] or self.constrained[taskHigh]):
+            return True
+        before = self.before
+        if before[taskHigh] >> taskLow & 1:
+            return False
+        return not any(
+            before[taskHigh] >> index & 1 or before[index] >> taskLow & 1 for index in self.state[low + 1 : high]
+        )
+
+    def windowFeasible(self, window: Sequence[int]) -> bool:
+        """Checks whether the tasks of a window are ordered such that no task comes before one it depends on. As tasks
+        outside of the window keep their position, this suffices for the whole proposed state to be feasible.
+
+        Args:
+            window (Sequence[int]): the task indices of the window, in their proposed order
+
+        Returns:
+            bool: whether the proposed state is feasible, given that the current one is
+        """
+        later = 0  # bitset of the tasks placed after the current one
+        for index in reversed(window):
+            if self.before[index] & later:
+                return False
+            later |= 1 << index
+        return True
+
+    def swapDelta(self, indexA: int, indexB: int) -> float:
+        """Computes the change in energy caused by swapping the tasks at two positions, without applying it.
+        Call accept() afterwards to apply the swap.
+
+        Args:
+            indexA (int): first position within the state
+            indexB (int): second position within the state
+
+        Returns:
+            float: the energy difference between the proposed and the current state, inf if it is infeasible
+        """
+        low, high = min(indexA, indexB), max(indexA, indexB)
+        self._proposal = None
+        if low == high:
+            return 0.0
+        if self.hasPrecedence and not self.swapFeasible(low, high):
+            return math.inf
+        state, N = self.state, len(self.state)
+        taskLow, taskHigh = state[low], state[high]
+
+        def taskAt(position: int) -> int:
+            """Returns the task index at the given position of the proposed state."""
+            if position == low:
+                return taskHigh
+            if position == high:
+                return taskLow
+            return state[position]
+
+        delta = float((high - low) * (self.priorities[taskLow] - self.priorities[taskHigh]))
+        for left in sorted({low - 1, low, high - 1, high}):
+            if 0 <= left < N - 1:
+                delta += self.commute(taskAt(left), taskAt(left + 1))
+                delta -= self.commute(state[left], state[left + 1])
+        return self._respread(low, high, taskAt, delta, None)
+
+    def windowDelta(self, low: int, window: Sequence[int]) -> float:
+        """Computes the change in energy caused by replacing the tasks at positions low, low + 1, ... with a permutation
+        of them, without applying it. All moves other than the swap are expressed this way.
+        Call accept() afterwards to apply the move.
+
+        Args:
+            low (int): first position of the window
+            window (Sequence[int]): the new task indices at the positions of the window
+
+        Returns:
+            float: the energy difference between the proposed and the current state, inf if it is infeasible
+        """
+        high = low + len(window) - 1
+        self._proposal = None
+        if high <= low:
+            return 0.0
+        if self.hasPrecedence and not self.windowFeasible(window):
+            return math.inf
+        state, N = self.state, len(self.state)
+
+        def taskAt(position: int) -> int:
+            """Returns the task index at the given position of the proposed state."""
+            return window[position - low] if low <= position <= high else state[position]
+
+        delta = 0.0
+        for offset, index in enumerate(window):
+            delta += (low + offset) * (self.priorities[index] - self.priorities[state[low + offset]])
+        for left in range(max(low - 1, 0), min(high, N - 2) + 1):
+            delta += self.commute(taskAt(left), taskAt(left + 1))
+            delta -= self.commute(state[left], state[left + 1])
+        return self._respread(low, high, taskAt, delta, list(window))
+
+    def insertionDelta(self, source: int, target: int) -> float:
+        """Proposes to take out the task at position source and re-insert it at position target.
+
+        Args:
+            source (int): current position of the task
+            target (int): position of the task in the proposed state
+
+        Returns:
+            float: the energy difference between the proposed and the current state
+        """
+        state = self.state
+        if source < target:
+            return self.windowDelta(source, state[source + 1 : target + 1] + [state[source]])
+        return self.windowDelta(target, [state[source]] + state[target:source])
+
+    def blockMoveDelta(self, start: int, length: int, target: int) -> float:
+        """Proposes to move the contiguous block of tasks at positions start, ..., start + length - 1, so that it begins
+        at position target.
+
+        Args:
+            start (int): current first position of the block
+            length (int): number of tasks in the block
+            target (int): first position of the block in the proposed state
+
+        Returns:
+            float: the energy difference between the proposed and the current state
+        """
+        state = self.state
+        block = state[start : start + length]
+        if start < target:
+            return self.windowDelta(start, state[start + length : target + length] + block)
+        return self.windowDelta(target, block + state[target:start])
+
+    def reversalDelta(self, indexA: int, indexB: int) -> float:
+        """Proposes to reverse the segment between two positions (both included), the 2-opt move of TSP heuristics.
+
+        Args:
+            indexA (int): first position within the state
+            indexB (int): second position within the state
+
+        Returns:
+            float: the energy difference between the proposed and the current state
+        """
+        low, high = min(indexA, indexB), max(indexA, indexB)
+        return self.windowDelta(low, self.state[low : high + 1][::-1])
+
+    def proposeMove(self, moves: "MoveSet", rng: "SplitMix64 | random.Random") -> tuple[str, float]:
+        """Draws a move type according to the move set and evaluates a random move of that type. The native backends
+        draw the same random numbers in the same order, so that their trajectories match.
+
+        Args:
+            moves (MoveSet): the proposal types and their probabilities
+            rng (SplitMix64 | random.Random): random number generator of the chain
+
+        Returns:
+            tuple[str, float]: the name of the move type and the energy difference of the proposal
+        """
+        N = len(self.state)
+        weights = moves.weights()
+        name = next(iter(weights)) if len(weights) == 1 else rng.choices(list(weights), list(weights.values()))[0]
+        if name == "blockMove":
+            length = rng.randint(1, min(moves.maxBlockLength, N - 1))
+            start, target = rng.randrange(N - length + 1), rng.randrange(N - length + 1)
+            return name, self.blockMoveDelta(start, length, target)
+        indexA = rng.randrange(N)
+        indexB = rng.randrange(N)
+        if name == "insertion":
+            return name, self.insertionDelta(indexA, indexB)
+        if name == "reversal":
+            return name, self.reversalDelta(indexA, indexB)
+        return name, self.swapDelta(indexA, indexB)
+
+    def _respread(
+        self, low: int, high: int, taskAt: Callable[[int], int], delta: float, window: list[int] | None
+    ) -> float:
+        """Re-spreads the proposed state from position low until the spread re-joins the cached one behind position
+        high, adds the on-time and total time differences to delta and remembers the proposal for accept().
+
+        Args:
+            low (int): first changed position
+            high (int): last changed position
+            taskAt (Callable[[int], int]): the task index at a given position of the proposed state
+            delta (float): the energy difference of the priority and commute terms
+            window (list[int] | None): the proposed tasks at the positions low to high, or None for a swap
+
+        Returns:
+            float: the energy difference between the proposed and the current state
+        """
+        state, N = self.state, len(self.state)
+        ends, slotEnds = self.ends, self.slotEnds
+        slotEnd = slotEnds[low - 1] if low > 0 else -math.inf
+        stamp = ends[low - 1] if low > 0 else 0.0
+        newEnds, newSlotEnds = [], []
+        position = low
+        while position < N:
+            index = taskAt(position)
+            duration = self.durations[index]
+            if stamp + duration > slotEnd:
+                stamp, slotEnd = self.slots.nextSlot(stamp, duration)
+            stamp += duration
+            newEnds.append(stamp)
+            newSlotEnds.append(slotEnd)
+            if position > 0:
+                due, oldDue = self.dues[index], self.dues[state[position]]
+                if due != 0 and due < stamp:
+                    delta += ON_TIME_PENALTY
+                if oldDue != 0 and oldDue < ends[position]:
+                    delta -= ON_TIME_PENALTY
+            if position >= high and stamp == ends[position] and slotEnd == slotEnds[position]:
+                break  # from here on, the proposed spread is identical to the cached one
+            position += 1
+        else:
+            delta += newEnds[-1] - ends[-1]
+        self.respreads += len(newEnds)
+        self._proposal = (delta, low, high, window, newEnds, newSlotEnds)
+        return delta
+
+    def accept(self) -> None:
+        """Applies the last proposal evaluated by swapDelta() or any of the other moves."""
+        if self._proposal is None:
+            return
+        delta, low, high, window, newEnds, newSlotEnds = self._proposal
+        if window is None:
+            self.state[low], self.state[high] = self.state[high], self.state[low]
+        else:
+            self.state[low : high + 1] = window
+        self.ends[low : low + len(newEnds)] = newEnds
+        self.slotEnds[low : low + len(newSlotEnds)] = newSlotEnds
+        self.energy += delta
+        self._proposal = None
+
+
+@dataclasses.dataclass
+class MoveSet:
+    """Slim struct holding the relative probability of each type of proposal of the Metropolis step."""
+
+    swap: float = 1.0  # exchange the tasks at two positions
+    insertion: float = 0.0  # take out a single task and re-insert it elsewhere
+    blockMove: float = 0.0  # relocate a contiguous block of tasks
+    reversal: float = 0.0  # reverse a segment, the 2-opt move
+    maxBlockLength: int = 5  # upper bound on the length of a relocated block
+
+    def weights(self) -> dict[str, float]:
+        """
+        Returns:
+            dict[str, float]: the probability weight of each move type that is enabled
+        """
+        weights = {
+            "swap": self.swap,
+            "insertion": self.insertion,
+            "blockMove": self.blockMove,
+            "reversal": self.reversal,
+        }
+        return {name: weight for name, weight in weights.items() if weight > 0}
+
+    def nativeArguments(self) -> tuple[np.ndarray, int]:
+        """
+        Returns:
+            tuple[np.ndarray, int]: the weight of each move type in the order of MOVE_TYPES, 0 if it is disabled, and
+                the maximum block length, in the form taken by the native backends
+        """
+        weights = self.weights()
+        return np.array([weights.get(name, 0.0) for name in MOVE_TYPES], dtype=np.float64), self.maxBlockLength
+
+
+@dataclasses.dataclass
+class MoveStats:
+    """Slim struct collecting the acceptance statistics of one type of move."""
+
+    proposedSteps: int = 0
+    acceptedSteps: int = 0
+
+    @property
+    def acceptanceRate(self) -> float:
+        """
+        Returns:
+            float: the fraction of accepted proposals of this type
+        """
+        return self.acceptedSteps / self.proposedSteps if self.proposedSteps else 0.0
+
+
+class SplitMix64:
+    """Counter-based pseudo-random number generator. The i-th number of the stream is a pure function of (seed, i), and
+    the pure Python, Numba, Rust and C++ schedulers implement it identically, so that a seed determines the whole
+    trajectory of a chain regardless of the backend. As there is no sequential state to advance, Python computes the
+    numbers in blocks with vectorised NumPy operations.
+    """
+
+    def __init__(self, seed: int, blockSize: int = 4096) -> None:
+        """Initialises the stream.
+
+        Args:
+            seed (int): the seed, selecting the stream
+            blockSize (int, optional): how many numbers to compute at once. Defaults to 4096.
+        """
+        self.seed = seed % 2**64
+        self.blockSize = blockSize
+        self.counter = 0  # index of the first number of the next block
+        self.block: list[float] = []
+        self.position = 0
+
+    @staticmethod
+    def uniforms(seed: int, first: int, size: int) -> np.ndarray:
+        """Computes a block of numbers of the stream.
+
+        Args:
+            seed (int): the seed, selecting the stream
+            first (int): index of the first number
+            size (int): number of numbers
+
+        Returns:
+            np.ndarray: float64 uniform numbers in [0, 1) with 53 random bits each
+        """
+        with np.errstate(over="ignore"):
+            counters = np.arange(first + 1, first + size + 1, dtype=np.uint64)
+            z = np.uint64(seed) + counters * np.uint64(SPLITMIX_GAMMA)
+            z = (z ^ (z >> np.uint64(30))) * np.uint64(SPLITMIX_MULTIPLIERS[0])
+            z = (z ^ (z >> np.uint64(27))) * np.uint64(SPLITMIX_MULTIPLIERS[1])
+            z ^= z >> np.uint64(31)
+        return (z >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+    def random(self) -> float:
+        """
+        Returns:
+            float: the next number, uniform in [0, 1)
+        """
+        if self.position == len(self.block):
+            self.block = self.uniforms(self.seed, self.counter, self.blockSize).tolist()
+            self.counter += self.blockSize
+            self.position = 0
+        self.position += 1
+        return self.block[self.position - 1]
+
+    def randrange(self, n: int) -> int:
+        """
+        Args:
+            n (int): the (exclusive) upper bound
+
+        Returns:
+            int: the next number, uniform in [0, n), computed as floor(random() * n) like in all other backends
+        """
+        return int(self.random() * n)
+
+    def randint(self, a: int, b: int) -> int:
+        """
+        Args:
+            a (int): the lower bound
+            b (int): the (inclusive) upper bound
+
+        Returns:
+            int: the next number, uniform in [a, b]
+        """
+        return a + self.randrange(b - a + 1)
+
+    def choices(self, population: Sequence, weights: Sequence[float]) -> list:
+        """Draws a single element with the given relative weights, like random.Random.choices() with k=1.
+
+        Args:
+            population (Sequence): the elements
+            weights (Sequence[float]): their relative weights
+
+        Returns:
+            list: a list containing the drawn element
+        """
+        threshold = self.random() * sum(weights)
+        for element, weight in zip(population, weights):
+            threshold -= weight
+            if threshold < 0:
+                return [element]
+        return [population[-1]]
+
+
+class CancelToken:
+    """Flag that lets another thread stop running schedulers early. It is backed by a one-element array, which the
+    native backends poll without holding the GIL. Chains running in worker processes only see a copy, so
+    AbstractScheduler.schedule() relays a cancel to them through a flag in shared memory, see runWorkerChain().
+    """
+
+    def __init__(self) -> None:
+        """Initialises the token, not cancelled."""
+        self.flag = np.zeros(1, dtype=np.uint8)
+
+    def cancel(self):
+        """Asks all schedulers holding this token to stop and return the best state seen so far."""
+        self.flag[0] = 1
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Returns:
+            bool: whether cancel() has been called
+        """
+        return bool(self.flag[0])
+
+
+@dataclasses.dataclass
+class Budget:
+    """Slim struct describing when a chain has to stop before finishing its annealing schedule."""
+
+    deadline: float | None = None  # time.time() after which to stop
+    maxSteps: int | None = None  # number of Metropolis steps after which to stop
+    cancelToken: CancelToken | None = None
+
+    def stepsLeft(self, steps: int) -> int | None:
+        """
+        Args:
+            steps (int): number of steps performed so far
+
+        Returns:
+            int | None: number of steps that may still be performed, None if unlimited
+        """
+        return None if self.maxSteps is None else max(self.maxSteps - steps, 0)
+
+    def stopReason(self, steps: int) -> str | None:
+        """Checks whether the chain has to stop now.
+
+        Args:
+            steps (int): number of steps performed so far
+
+        Returns:
+            str | None: one of STOP_REASONS, None if the chain may continue
+        """
+        if self.cancelToken is not None and self.cancelToken.cancelled:
+            return "cancelled"
+        if self.maxSteps is not None and steps >= self.maxSteps:
+            return "maxSteps"
+        if self.deadline is not None and clock.time() >= self.deadline:
+            return "timeBudget"
+        return None
+
+    def nativeArguments(self) -> tuple[int, float, np.ndarray]:
+        """
+        Returns:
+            tuple[int, float, np.ndarray]: the step limit, the deadline and the cancel flag, in the form taken by the
+                schedule() functions of the native backends
+        """
+        return (
+            self.maxSteps if self.maxSteps is not None else 2**64 - 1,
+            self.deadline if self.deadline is not None else float("inf"),
+            self.cancelToken.flag if self.cancelToken is not None else np.zeros(1, dtype=np.uint8),
+        )
+
+
+workerCancelFlag: np.ndarray | None = None  # in worker processes of schedule(), the flag shared with the parent
+
+
+def initialiseWorker(sharedFlag) -> None:
+    """Runs once in each worker process of AbstractScheduler.schedule(), keeping the flag it shares with the parent.
+
+    Args:
+        sharedFlag (multiprocessing.Array): one byte in shared memory, set by the parent to stop all chains
+    """
+    global workerCancelFlag
+    workerCancelFlag = np.frombuffer(sharedFlag, dtype=np.uint8)
+
+
+def runWorkerChain(runChain: Callable[[int, "Budget"], "ChainResult"], seed: int, budget: "Budget") -> "ChainResult":
+    """Runs a chain in a worker process of AbstractScheduler.schedule(), polling the flag shared with the parent
+    instead of the pickled copy of its cancel token.
+
+    Args:
+        runChain (Callable[[int, Budget], ChainResult]): the runChain() method of the scheduler
+        seed (int): seed of the random number generator of this chain
+        budget (Budget): when to stop early
+
+    Returns:
+        ChainResult: the result of the chain
+    """
+    token = CancelToken()
+    if workerCancelFlag is not None:
+        token.flag = workerCancelFlag
+    return runChain(seed, dataclasses.replace(budget, cancelToken=token))
+
+
+@dataclasses.dataclass
+class ChainResult:
+    """Slim struct holding the outcome of a single, independently seeded Markov chain."""
+
+    ordering: list[int]  # task indices, in chronological order
+    starts: list[float]  # start of each scheduled task, in hours relative to TaskTable.start
+    energy: float  # energy of the ordering, as computed by EnergyEngine.reset()
+    stopReason: str = "finished"  # one of STOP_REASONS
+    steps: int = 0  # number of Metropolis steps performed
+    respreads: int | None = None  # task placements recomputed by incremental evaluations, None if not counted
+    marshallingSeconds: float = 0.0  # time spent converting arguments and results of a native backend
+    sweeps: list["SweepStats"] = dataclasses.field(default_factory=list)  # filled in if statistics are enabled
+
+
+@dataclasses.dataclass
+class Snapshot:
+    """Slim struct describing the progress of a chain after one sweep."""
+
+    sweep: int  # number of sweeps performed by the chain so far
+    temperature: float
+    averageEnergy: float  # E_avg of the sweep, as in energyLog
+    acceptanceRate: float  # proportion of accepted proposals during the sweep
+    steps: int  # number of Metropolis steps performed by the chain so far
+    bestOrdering: list[int]  # best ordering seen at the end of a sweep so far
+    bestStarts: list[float]  # start of each task of the best ordering, see ChainResult
+    bestEnergy: float
+
+
+@dataclasses.dataclass
+class SweepStats:
+    """Slim struct holding the statistics of one sweep, i.e. of one temperature of the annealing schedule."""
+
+    sweep: int  # number of sweeps performed by the chain so far
+    temperature: float
+    averageEnergy: float  # E_avg of the sweep
+    acceptanceRate: float  # proportion of accepted proposals during the sweep
+    steps: int  # number of Metropolis steps performed by the chain so far
+
+    @staticmethod
+    def fromSnapshot(snapshot: Snapshot) -> "SweepStats":
+        """
+        Args:
+            snapshot (Snapshot): the progress of a chain after a sweep
+
+        Returns:
+            SweepStats: its statistics, without the best ordering
+        """
+        return SweepStats(
+            snapshot.sweep, snapshot.temperature, snapshot.averageEnergy, snapshot.acceptanceRate, snapshot.steps
+        )
+
+
+@dataclasses.dataclass
+class EnergyTerms:
+    """Slim struct splitting the energy of an ordering into its terms, see EnergyEngine.terms()."""
+
+    time: float  # end of the last task, in hours
+    priority: float  # sum of position times priority
+    commute: float  # travel costs between consecutive tasks
+    onTime: float  # ON_TIME_PENALTY for every late task
+
+    @property
+    def total(self) -> float:
+        """
+        Returns:
+            float: the energy, as computed by EnergyEngine.reset()
+        """
+        return self.time + self.priority + self.commute + self.onTime
+
+
+@dataclasses.dataclass
+class SchedulerStats:
+    """Instrumentation of the last run of a scheduler, collected only if enabled by AbstractScheduler.enableStats()."""
+
+    implementation: str  # name of the scheduler class
+    tasks: int  # number of scheduled tasks
+    chains: int  # number of chains that returned
+    steps: int  # number of Metropolis steps of the returned chain
+    seconds: float  # wall-clock time of the run
+    marshallingSeconds: float  # time the returned chain spent converting arguments and results of a native backend
+    respreads: int | None  # task placements recomputed by the returned chain, None if the backend does not count them
+    stopReason: str  # why the returned chain stopped, one of STOP_REASONS
+    energy: EnergyTerms  # terms of the energy of the returned ordering
+    sweeps: list[SweepStats]  # acceptance rate and average energy of the returned chain, per temperature
+
+    @property
+    def stepsPerSecond(self) -> float:
+        """
+        Returns:
+            float: Metropolis steps of the returned chain per second of the run
+        """
+        return self.steps / self.seconds if self.seconds > 0 else 0.0
+
+    def toJson(self) -> str:
+        """
+        Returns:
+            str: the statistics as a single line of JSON, including stepsPerSecond and the total energy
+        """
+        record = dataclasses.asdict(self)
+        record["stepsPerSecond"] = self.stepsPerSecond
+        record["energy"]["total"] = self.energy.total
+        return json.dumps(record)
+
+
+def earliestDueDate(table: TaskTable) -> list[int]:
+    """Constructive heuristic ordering the tasks by due date, tasks without one last, and by priority on ties.
+
+    Args:
+        table (TaskTable): the tasks
+
+    Returns:
+        list[int]: the ordering of task indices
+    """
+    due = np.where(table.due != 0, table.due, np.inf)
+    return np.lexsort((-table.priority, due)).tolist()
+
+
+def weightedShortestProcessingTime(table: TaskTable) -> list[int]:
+    """Constructive heuristic ordering the tasks by duration per priority (Smith's rule), which minimises the sum of
+    priority-weighted end times on a single machine.
+
+    Args:
+        table (TaskTable): the tasks
+
+    Returns:
+        list[int]: the ordering of task indices
+    """
+    return np.argsort(table.duration / table.priority, kind="stable").tolist()
+
+
+def locationGroupedEarliestDueDate(table: TaskTable) -> list[int]:
+    """Constructive heuristic grouping the tasks by location to avoid commutes, ordering the groups by their most urgent
+    task and each group by earliest due date. Hybrid tasks form a group of their own.
+
+    Args:
+        table (TaskTable): the tasks
+
+    Returns:
+        list[int]: the ordering of task indices
+    """
+    ordering = earliestDueDate(table)
+    urgency: dict[int, int] = {}  # location -> position of its most urgent task in the EDF ordering
+    for position, index in enumerate(ordering):
+        urgency.setdefault(int(table.location[index]), position)
+    return sorted(ordering, key=lambda index: urgency[int(table.location[index])])
+
+
+GREEDY_HEURISTICS: dict[str, Callable[[TaskTable], list[int]]] = {
+    "earliestDueDate": earliestDueDate,
+    "weightedShortestProcessingTime": weightedShortestProcessingTime,
+    "locationGroupedEarliestDueDate": locationGroupedEarliestDueDate,
+}
+
+
 class AbstractScheduler:
-    """Abstract Base Class (ABC) for schedulers."""
+    """Abstract Base Class (ABC) for schedulers. Implementations override either sweeps(), if they can pause after each
+    sweep, or runChain(), if the whole chain runs in native code.
+    """
+
+    releasesGIL = False  # whether runChain() runs without holding the GIL, so that chains can run on threads
+    supportedMoves: tuple[str, ...] = MOVE_TYPES  # the move types of a MoveSet that this implementation proposes
 
-    def __init__(self, tasks: list[Task]) -> None:
+    def __init__(self, tasks: list[Task], seed: int | None = None, moves: MoveSet | None = None) -> None:
         """Initialises the scheduler, working on a set of pre-defined tasks.
 
         Args:
             tasks (list[Task]): the tasks to be scheduled
+            seed (int | None, optional): seed of the first chain, the following chains use seed + 1, seed + 2, etc.
+                With the same seed and tasks, the pure Python, Numba, Rust and C++ implementations follow the same
+                trajectory. Defaults to a random seed.
+            moves (MoveSet | None, optional): the proposal types and their probabilities, which have to be among
+                self.supportedMoves. Defaults to swaps only.
+
+        Raises:
+            ValueError: if the move set enables a move type that this implementation does not propose
         """
+        self.moves = moves if moves is not None else MoveSet()
+        unsupported = [name for name in self.moves.weights() if name not in self.supportedMoves]
+        if unsupported:
+            supported = ", ".join(self.supportedMoves)
+            raise ValueError(f"{type(self).__name__} only proposes {supported} moves, not {', '.join(unsupported)}.")
+        self.moveStats = {name: MoveStats() for name in self.moves.weights()}
+        self.seed = seed
         self.tasks = tasks
+        self.table = TaskTable.fromTasks(tasks)
+        self.chainEnergies: list[float] = []
+        self.initialState: list[int] = self.table.feasibleOrder(range(len(tasks)))
+        self.firstSweep = 1  # index k of the first sweep of the annealing schedule
+        self.stopReason: str | None = None  # why the chain returned by the last call of schedule() stopped
+        self.steps = 0  # number of Metropolis steps performed by that chain
+        self.collectStats = False  # whether schedule() and iterate() record self.stats, see enableStats()
+        self.statsFile: str | os.PathLike | None = None
+        self.stats: SchedulerStats | None = None  # statistics of the last run, if enabled
+
+    def recordMoveCounts(self, counts: np.ndarray) -> None:
+        """Adds the proposals counted by a native kernel to the per-move statistics in self.moveStats.
+
+        Args:
+            counts (np.ndarray): (2, len(MOVE_TYPES)) integer array, the number of proposed and of accepted steps of
+                each move type
+        """
+        for name, stats in self.moveStats.items():
+            move = MOVE_TYPES.index(name)
+            stats.proposedSteps += int(counts[0, move])
+            stats.acceptedSteps += int(counts[1, move])
+
+    def setAvailability(self, availability: "AvailabilityManager") -> None:
+        """Spreads the tasks across the free slots of the given availability, instead of the default working slot of
+        DAY_LENGTH hours every day. Call this before warmStart().
+
+        Args:
+            availability (AvailabilityManager): the working hours, exclusions and busy times of the user
+        """
+        self.table.slots = availability.slotTable(self.table.start, self.tasks)
+
+    def enableStats(self, file: str | os.PathLike | None = None) -> None:
+        """Lets every following call of schedule() and iterate() record its statistics in self.stats, and optionally
+        append them as a line of JSON to a file. When disabled, only counters that cost next to nothing are kept.
+
+        Args:
+            file (str | os.PathLike | None, optional): the JSON lines file. Defaults to None.
+        """
+        self.collectStats = True
+        self.statsFile = file
+
+    def setTravelCosts(self, travel: np.ndarray) -> None:
+        """Charges the given travel costs for every change of site, instead of a flat COMMUTE_PENALTY. Call this before
+        warmStart().
+
+        Args:
+            travel (np.ndarray): (L, L) travel cost matrix covering the locations of all tasks, see
+                Locations.travelCosts()
+        """
+        self.setTable(dataclasses.replace(self.table, travel=checkTravelCosts(travel, self.table.location)))
+
+    def setTable(self, table: TaskTable) -> None:
+        """Replaces the task table, e.g. by a window of a larger table (see TaskTable.window()). Call this before
+        warmStart().
+
+        Args:
+            table (TaskTable): the table, holding the same tasks in the same order
+        """
+        self.table = table
+
+    def warmStart(self, previous: Sequence[str]):
+        """Starts the chains from a previous schedule instead of the identity ordering. Tasks that no longer exist are
+        dropped, new ones are greedily inserted where they increase the energy the least, and only the final
+        WARM_START_SWEEPS low-temperature sweeps of the annealing schedule are run.
+
+        Args:
+            previous (Sequence[str]): UIDs of the previously scheduled tasks, in chronological order
+        """
+        indices = {uid: index for index, uid in enumerate(self.table.uids)}
+        state = self.table.feasibleOrder([indices[uid] for uid in dict.fromkeys(previous) if uid in indices])
+        engine = EnergyEngine.fromTable(self.table)
+        for index in self.table.feasibleOrder(sorted(set(range(len(self.table))) - set(state))):
+            engine.reset(state + [index])
+            # between the last task it depends on and the first task depending on it, if any
+            first = max((p + 1 for p, other in enumerate(state) if engine.before[index] >> other & 1), default=0)
+            last = min((p for p, other in enumerate(state) if engine.before[other] >> index & 1), default=len(state))
+            deltas = [engine.insertionDelta(len(state), target) for target in range(first, last + 1)]
+            state.insert(first + deltas.index(min(deltas)), index)
+        self.initialState = state
+        self.firstSweep = SWEEPS - WARM_START_SWEEPS + 1
+
+    def greedyStart(self, heuristics: Sequence[str] | None = None) -> str:
+        """Starts the chains from the lowest-energy ordering among the constructive heuristics and the current initial
+        state, e.g. the one set by warmStart(). As every chain keeps the best state it has seen, the schedule is never
+        worse than this ordering.
+
+        Args:
+            heuristics (Sequence[str] | None, optional): names of the heuristics to try, see GREEDY_HEURISTICS.
+                Defaults to all of them.
+
+        Returns:
+            str: name of the chosen heuristic, or "initial" if the initial state was kept
+        """
+        engine = EnergyEngine.fromTable(self.table)
+        candidates = {"initial": self.initialState}
+        for name in heuristics if heuristics is not None else GREEDY_HEURISTICS:
+            candidates[name] = self.table.feasibleOrder(GREEDY_HEURISTICS[name](self.table))
+        energies = {name: engine.reset(ordering) for name, ordering in candidates.items()}
+        chosen = min(energies, key=energies.__getitem__)
+        logging.info(f"Starting from the {chosen} ordering with energy {energies[chosen]}.")
+        self.initialState = list(candidates[chosen])
+        return chosen
+
+    def scheduleGreedy(self, heuristics: Sequence[str] | None = None) -> Mapping[str, TimeSlot]:
+        """Fast mode: schedules the tasks by the best constructive heuristic alone, without any MCMC steps.
+
+        Args:
+            heuristics (Sequence[str] | None, optional): names of the heuristics to try, see GREEDY_HEURISTICS.
+                Defaults to all of them.
+
+        Returns:
+            Mapping[str, TimeSlot]: the resulting map of Tasks to TimeSlots
+        """
+        self.greedyStart(heuristics)
+        engine = EnergyEngine.fromTable(self.table)
+        self.chainEnergies = [engine.reset(self.initialState)]
+        self.stopReason, self.steps = "finished", 0
+        return self.timeSlots(self.initialState, engine.starts())
+
+    def timeSlots(self, ordering: Sequence[int], starts: Sequence[float]) -> Mapping[str, TimeSlot]:
+        """Converts the low-level result of a backend into time slots.
+
+        Args:
+            ordering (Sequence[int]): task indices, in chronological order
+            starts (Sequence[float]): start of each scheduled task, in hours relative to self.table.start
+
+        Returns:
+            Mapping[str, TimeSlot]: the resulting map of Tasks to TimeSlots
+        """
+        table = self.table
+        return {
+            table.uids[index]: TimeSlot(table.start + timedelta(hours=float(start)), float(table.duration[index]))
+            for index, start in zip(ordering, starts)
+        }
 
     def uidTaskMap(self) -> Mapping[str, Task]:
         """Generates a dictionary for task lookup by UID.
@@ -83,14 +1477,288 @@ class AbstractScheduler:
         """
         return {task.uid: task for task in self.tasks}
 
-    def schedule(self) -> Mapping[str, TimeSlot]:
-        """Schedules the tasks using an MCMC procedure.
+    def swapDelta(self, state: Sequence[int], indexA: int, indexB: int) -> float:
+        """Computes the energy difference caused by swapping two positions of the given state, using the incremental
+        energy engine of this implementation.
+
+        Args:
+            state (Sequence[int]): the ordering of task indices
+            indexA (int): first position within the state
+            indexB (int): second position within the state
 
         Returns:
-            Mapping[str, TimeSlot]: the resulting map of Tasks to TimeSlots
+            float: the energy difference between the swapped and the given state
         """
         raise NotImplementedError()
 
+    def energy(self, ordering: Sequence[int]) -> float:
+        """Evaluates the energy of an ordering, independently of the backend that produced it.
+
+        Args:
+            ordering (Sequence[int]): task indices, in chronological order
+
+        Returns:
+            float: the energy / penalty for this ordering
+        """
+        return EnergyEngine.fromTable(self.table).reset(ordering)
+
+    def sweeps(self, seed: int, budget: Budget | None = None) -> Generator[Snapshot, None, ChainResult]:
+        """Runs a single Markov chain like runChain(), yielding a snapshot after each sweep. This default runs
+        runChain() on a worker thread and forwards the snapshots it reports through a queue. Closing the generator
+        early cancels the chain through the cancel token of the budget.
+
+        Args:
+            seed (int): seed of the random number generator of this chain
+            budget (Budget | None, optional): when to stop early. Defaults to running the full schedule.
+
+        Yields:
+            Snapshot: the progress after each sweep
+
+        Returns:
+            ChainResult: the best ordering with its start times and energy
+        """
+        budget = budget if budget is not None else Budget()
+        if budget.cancelToken is None:
+            budget = dataclasses.replace(budget, cancelToken=CancelToken())
+        snapshots: queue.Queue[Snapshot | None] = queue.Queue()
+
+        def run() -> ChainResult:
+            try:
+                return self.runChain(seed, budget, snapshots.put)
+            finally:
+                snapshots.put(None)
+
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            future = executor.submit(run)
+            try:
+                while (snapshot := snapshots.get()) is not None:
+                    yield snapshot
+            except GeneratorExit:
+                budget.cancelToken.cancel()
+                raise
+            return future.result()
+
+    def runChain(
+        self, seed: int, budget: Budget | None = None, progress: Callable[[Snapshot], None] | None = None
+    ) -> ChainResult:
+        """Runs a single Markov chain of this implementation from self.initialState, starting with sweep self.firstSweep
+        of the annealing schedule. The chain keeps the best of the states it reaches at the end of each sweep, and
+        returns it when the schedule is complete or the budget is exhausted. This default drives sweeps().
+
+        Args:
+            seed (int): seed of the random number generator of this chain
+            budget (Budget | None, optional): when to stop early. Defaults to running the full schedule.
+            progress (Callable[[Snapshot], None] | None, optional): called after each sweep. Defaults to None.
+
+        Returns:
+            ChainResult: the best ordering with its start times and energy
+        """
+        generator = self.sweeps(seed, budget)
+        while True:
+            try:
+                snapshot = next(generator)
+            except StopIteration as stop:
+                return stop.value
+            if progress is not None:
+                progress(snapshot)
+
+    def instrumentedChain(self, seed: int, budget: Budget | None = None) -> ChainResult:
+        """Runs a single chain like runChain(), recording the statistics of each sweep in the result. This is executed
+        within a worker process or thread.
+
+        Args:
+            seed (int): seed of the random number generator of this chain
+            budget (Budget | None, optional): when to stop early. Defaults to running the full schedule.
+
+        Returns:
+            ChainResult: the best ordering with its start times and energy, and the statistics of the chain
+        """
+        sweeps: list[SweepStats] = []
+        result = self.runChain(seed, budget, lambda snapshot: sweeps.append(SweepStats.fromSnapshot(snapshot)))
+        return dataclasses.replace(result, sweeps=sweeps)
+
+    def recordStats(self, result: ChainResult, seconds: float, chains: int = 1) -> None:
+        """Records the statistics of a run in self.stats and appends them to self.statsFile, if given.
+
+        Args:
+            result (ChainResult): the returned chain, with the statistics of its sweeps
+            seconds (float): wall-clock time of the run
+            chains (int, optional): the number of chains that returned. Defaults to 1.
+        """
+        self.stats = SchedulerStats(
+            type(self).__name__,
+            len(self.table),
+            chains,
+            result.steps,
+            seconds,
+            result.marshallingSeconds,
+            result.respreads,
+            result.stopReason,
+            EnergyEngine.fromTable(self.table).terms(result.ordering),
+            result.sweeps,
+        )
+        logging.info(f"{self.stats.stepsPerSecond:.0f} steps/s, energy terms {self.stats.energy}.")
+        if self.statsFile is not None:
+            with open(self.statsFile, "a") as f:
+                f.write(self.stats.toJson() + "\n")
+
+    def iterate(
+        self, timeBudget: float | None = None, maxSteps: int | None = None, cancelToken: CancelToken | None = None
+    ) -> Iterator[Snapshot]:
+        """Runs a single chain like schedule(chains=1), yielding a snapshot after each sweep, such that callers can show
+        live progress and stop early by closing the iterator. scheduler.timeSlots(snapshot.bestOrdering,
+        snapshot.bestStarts) turns any snapshot into a schedule, and the last one holds the result of the chain.
+
+        Args:
+            timeBudget (float | None, optional): wall-clock budget in seconds. Defaults to no budget.
+            maxSteps (int | None, optional): maximum number of Metropolis steps. Defaults to no limit.
+            cancelToken (CancelToken | None, optional): token to stop the chain from another thread. Closing the
+                iterator also stops the chain. Defaults to None.
+
+        Yields:
+            Snapshot: the progress after each sweep
+        """
+        seed = self.seed if self.seed is not None else random.getrandbits(63)
+        started = clock.perf_counter()
+        deadline = clock.time() + timeBudget if timeBudget is not None else None
+        generator = self.sweeps(seed, Budget(deadline, maxSteps, cancelToken))
+        sweeps: list[SweepStats] = []
+        try:
+            while True:
+                try:
+                    snapshot = next(generator)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+                if self.collectStats:
+                    sweeps.append(SweepStats.fromSnapshot(snapshot))
+                yield snapshot
+        finally:
+            generator.close()  # closing this iterator early stops the chain
+        self.chainEnergies = [result.energy]
+        self.stopReason, self.steps = result.stopReason, result.steps
+        if self.collectStats:
+            self.recordStats(dataclasses.replace(result, sweeps=sweeps), clock.perf_counter() - started)
+
+    async def aschedule(
+        self, timeBudget: float | None = None, maxSteps: int | None = None, cancelToken: CancelToken | None = None
+    ) -> AsyncIterator[Snapshot]:
+        """Asynchronous variant of iterate(). Each sweep runs on a worker thread of the event loop, which thus stays
+        responsive while the chain anneals.
+
+        Args:
+            timeBudget (float | None, optional): wall-clock budget in seconds. Defaults to no budget.
+            maxSteps (int | None, optional): maximum number of Metropolis steps. Defaults to no limit.
+            cancelToken (CancelToken | None, optional): token to stop the chain from another thread. Defaults to None.
+
+        Yields:
+            Snapshot: the progress after each sweep
+        """
+        loop = asyncio.get_running_loop()
+        iterator = self.iterate(timeBudget, maxSteps, cancelToken)
+        finished = object()
+        try:
+            while (snapshot := await loop.run_in_executor(None, next, iterator, finished)) is not finished:
+                yield snapshot
+        finally:
+            iterator.close()
+
+    def schedule(
+        self,
+        chains: int = 1,
+        workers: int | None = None,
+        timeBudget: float | None = None,
+        maxSteps: int | None = None,
+        cancelToken: CancelToken | None = None,
+        greedy: bool = False,
+    ) -> Mapping[str, TimeSlot]:
+        """Schedules the tasks using an MCMC procedure. With chains > 1, independently seeded chains are run on a pool
+        of worker processes (or threads, if the implementation releases the GIL) and the lowest-energy result is kept.
+        The scheduler is anytime: each chain checks the budget while annealing and returns the best state seen so far
+        once it is exhausted. The energies of all finished chains are recorded in self.chainEnergies, and why and
+        after how many steps the returned chain stopped in self.stopReason and self.steps.
+
+        Args:
+            chains (int, optional): the number of independent chains. Defaults to 1.
+            workers (int | None, optional): the size of the pool. Defaults to one per CPU core.
+            timeBudget (float | None, optional): wall-clock budget in seconds shared by all chains. Chains that have not
+                returned by then are stopped and abandoned, but at least one chain is always waited for. Defaults to no
+                budget.
+            maxSteps (int | None, optional): maximum number of Metropolis steps of each chain. Defaults to no limit.
+            cancelToken (CancelToken | None, optional): token to stop the chains from another thread. Once it is
+                cancelled, no chain is waited for, and the initial state is returned if none has returned yet.
+                Defaults to None.
+            greedy (bool, optional): whether to start from the best constructive heuristic, see greedyStart().
+                Defaults to False.
+
+        Returns:
+            Mapping[str, TimeSlot]: the resulting map of Tasks to TimeSlots
+        """
+        if greedy:
+            self.greedyStart()
+        started = clock.perf_counter()
+        runChain = self.instrumentedChain if self.collectStats else self.runChain
+        first = self.seed if self.seed is not None else random.getrandbits(63)
+        seeds = [(first + chain) % 2**63 for chain in range(chains)]
+        deadline = clock.time() + timeBudget if timeBudget is not None else None
+        budget = Budget(deadline, maxSteps, cancelToken)
+        if chains == 1:
+            results = [runChain(seeds[0], budget)]
+        else:
+            stop = CancelToken()  # stops all chains once the caller cancels, and the abandoned ones after the budget
+            executor: concurrent.futures.Executor
+            if self.releasesGIL:
+                executor = concurrent.futures.ThreadPoolExecutor(workers)
+                futures = [executor.submit(runChain, seed, Budget(deadline, maxSteps, stop)) for seed in seeds]
+            else:  # chains in worker processes only see a copy of a token, so they poll a flag in shared memory
+                sharedFlag = multiprocessing.Array("B", 1, lock=False)
+                stop.flag = np.frombuffer(sharedFlag, dtype=np.uint8)
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    workers, initializer=initialiseWorker, initargs=(sharedFlag,)
+                )
+                futures = [
+                    executor.submit(runWorkerChain, runChain, seed, Budget(deadline, maxSteps)) for seed in seeds
+                ]
+            done, pending = set(), set(futures)
+            while pending and budget.stopReason(0) is None:
+                # the chains do not see the cancel token, so we poll it on their behalf
+                timeout = None if deadline is None else max(deadline - clock.time(), 0)
+                if cancelToken is not None:
+                    timeout = CANCEL_POLL_INTERVAL if timeout is None else min(timeout, CANCEL_POLL_INTERVAL)
+                finished, pending = concurrent.futures.wait(pending, timeout=timeout)
+                done |= finished
+            done |= {future for future in pending if future.done()}
+            if not done and budget.stopReason(0) != "cancelled":
+                # past the deadline, the chains return by themselves within CHECK_INTERVAL steps
+                done, pending = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            stop.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            results = [future.result() for future in futures if future in done]
+            if len(results) < chains:
+                logging.info(f"Budget exhausted, abandoning {chains - len(results)} of {chains} chains.")
+            if not results:  # cancelled before any chain returned
+                engine = EnergyEngine.fromTable(self.table)
+                energy = engine.reset(list(self.initialState))
+                results = [ChainResult(list(self.initialState), engine.starts(), energy, "cancelled")]
+        self.chainEnergies = [result.energy for result in results]
+        best = min(results, key=lambda result: result.energy)
+        self.stopReason, self.steps = best.stopReason, best.steps
+        logging.info(
+            f"Best of {len(results)} chains has energy {best.energy} (spread {self.energySpread}), "
+            f"stopped after {best.steps} steps ({best.stopReason})."
+        )
+        if self.collectStats:
+            self.recordStats(best, clock.perf_counter() - started, len(results))
+        return self.timeSlots(best.ordering, best.starts)
+
+    @property
+    def energySpread(self) -> float:
+        """
+        Returns:
+            float: difference between the highest and the lowest energy reached by the chains of the last schedule()
+        """
+        return max(self.chainEnergies) - min(self.chainEnergies) if self.chainEnergies else 0.0
+
 
 def generateDemoTasks() -> list[Task]:
     """Generates a fixed set of demo tasks.
@@ -0,0 +1,230 @@
+"""Decomposition (rolling horizon) implementation of the scheduler algorithm, for task sets of thousands of tasks."""
+
+import concurrent.futures
+import itertools
+import logging
+import math
+from typing import Callable
+
+from .base import (
+    SWEEPS,
+    WARM_START_SWEEPS,
+    AbstractScheduler,
+    Budget,
+    ChainResult,
+    EnergyEngine,
+    MoveSet,
+    Snapshot,
+    Task,
+    earliestDueDate,
+)
+from .purepython import MCMCScheduler
+
+
+def annealWindow(scheduler: AbstractScheduler, seed: int, budget: Budget | None) -> ChainResult:
+    """Runs a single chain of a window scheduler. This is executed within a worker process or thread.
+
+    Args:
+        scheduler (AbstractScheduler): the scheduler of the window
+        seed (int): seed of the random number generator of this chain
+        budget (Budget | None): when to stop early
+
+    Returns:
+        ChainResult: the best ordering of the window, in indices of the window
+    """
+    return scheduler.runChain(seed, budget)
+
+
+class DecomposedScheduler(AbstractScheduler):
+    """Rolling horizon scheduler. As one annealing run costs O(N³), large task sets are partitioned into windows of
+    consecutive tasks of a greedy ordering, either fixed-size chunks or due date horizons. Each window is annealed
+    independently by any other backend, all windows in parallel, as if it followed the previous windows of the greedy
+    ordering. The results are stitched together, and a short, low-temperature pass repairs the ordering across each
+    window edge. With a fixed window size, the runtime grows linearly with the number of windows.
+    """
+
+    def __init__(
+        self,
+        tasks: list[Task],
+        Backend: type[AbstractScheduler] = MCMCScheduler,
+        windowSize: int = 50,
+        horizon: float | None = None,
+        repairSize: int = 10,
+        workers: int | None = None,
+        moves: MoveSet | None = None,
+        seed: int | None = None,
+    ) -> None:
+        """Initialises the scheduler.
+
+        Args:
+            tasks (list[Task]): the tasks to be scheduled
+            Backend (type[AbstractScheduler], optional): the implementation annealing each window.
+                Defaults to MCMCScheduler.
+            windowSize (int, optional): the largest number of tasks per window. Defaults to 50.
+            horizon (float | None, optional): if given, the windows are due date horizons of this many hours, in
+                earliest due date order, and tasks without due date come last. Horizons holding more than windowSize
+                tasks are chunked further. Defaults to fixed-size chunks of the best greedy ordering.
+            repairSize (int, optional): the number of tasks on either side of a window edge that the repair pass
+                re-anneals. Defaults to 10.
+            workers (int | None, optional): the number of worker processes (or threads, if the backend releases the
+                GIL). Defaults to one per CPU core.
+            moves (MoveSet | None, optional): the proposal types of the window and repair chains, which have to be
+                supported by the backend. Defaults to swaps only.
+            seed (int | None, optional): seed of the first chain. Defaults to a random seed.
+        """
+        self.supportedMoves = Backend.supportedMoves
+        super().__init__(tasks, seed, moves)
+        self.Backend = Backend
+        self.windowSize = windowSize
+        self.horizon = horizon
+        self.repairSize = repairSize
+        self.workers = workers
+        self.windowEnergies: list[float] = []  # energy of each annealed window, relative to its offset
+        self.respreads: int | None = 0  # summed over the window and repair chains, None if a backend lacks a count
+
+    def partition(self, ordering: list[int]) -> list[list[int]]:
+        """Splits an ordering into consecutive windows.
+
+        Args:
+            ordering (list[int]): the greedy ordering of all tasks
+
+        Returns:
+            list[list[int]]: the task indices of each window, in order
+        """
+        if self.horizon is None:
+            groups = [ordering]
+        else:
+            due = self.table.due
+            groups = [
+                list(group)
+                for _, group in itertools.groupby(
+                    ordering, key=lambda index: math.floor(due[index] / self.horizon) if due[index] != 0 else math.inf
+                )
+            ]
+        return [group[i : i + self.windowSize] for group in groups for i in range(0, len(group), self.windowSize)]
+
+    def windowScheduler(self, indices: list[int], offset: float) -> AbstractScheduler:
+        """Creates a backend scheduler for the given window.
+
+        Args:
+            indices (list[int]): the tasks of the window, in their initial order
+            offset (float): end of the tasks preceding the window, in hours relative to self.table.start
+
+        Returns:
+            AbstractScheduler: the scheduler, spreading the window from offset onwards
+        """
+        scheduler = self.Backend([self.tasks[index] for index in indices], moves=self.moves)
+        scheduler.setTable(self.table.window(indices, offset))
+        return scheduler
+
+    def runChain(
+        self, seed: int, budget: Budget | None = None, progress: Callable[[Snapshot], None] | None = None
+    ) -> ChainResult:
+        """Anneals all windows in parallel, stitches them together and repairs the window edges. The budget applies to
+        each window and repair, and the step count is the total over all of them.
+
+        Args:
+            seed (int): seed from which the seeds of the windows are derived
+            budget (Budget | None, optional): when to stop early. Defaults to running the full schedule.
+            progress (Callable[[Snapshot], None] | None, optional): called after each annealed window and each repair,
+                with the stitched ordering so far. Defaults to None.
+
+        Returns:
+            ChainResult: the best ordering with its start times and energy
+        """
+        engine = EnergyEngine.fromTable(self.table)
+        if self.horizon is None:
+            self.greedyStart()
+            initial = list(self.initialState)
+        else:
+            initial = self.table.feasibleOrder(earliestDueDate(self.table))
+        greedyEnergy = engine.reset(initial)
+        ends = engine.ends
+        windows = self.partition(initial)
+        offsets, position = [], 0
+        for window in windows:
+            offsets.append(ends[position - 1] if position > 0 else 0.0)
+            position += len(window)
+        self.steps, self.stopReason, done = 0, None, 0
+        self.respreads = 0
+        ordered = [list(window) for window in windows]
+        self.windowEnergies = [math.nan] * len(windows)
+
+        def report() -> None:
+            if progress is not None:
+                ordering = [index for window in ordered for index in window]
+                energy = engine.reset(ordering)
+                progress(Snapshot(done, 0.0, energy, 0.0, self.steps, ordering, engine.starts(), energy))
+
+        Executor = (
+            concurrent.futures.ThreadPoolExecutor
+            if self.Backend.releasesGIL
+            else concurrent.futures.ProcessPoolExecutor
+        )
+        with Executor(self.workers) as executor:
+            futures = {
+                executor.submit(annealWindow, self.windowScheduler(window, offset), (seed + k) % 2**63, budget): k
+                for k, (window, offset) in enumerate(zip(windows, offsets))
+            }
+            for future in concurrent.futures.as_completed(futures):
+                k, result = futures[future], future.result()
+                ordered[k] = [windows[k][index] for index in result.ordering]
+                self.windowEnergies[k] = result.energy
+                self.steps += result.steps
+                self.countRespreads(result)
+                self.stopReason = self.stopReason or (result.stopReason if result.stopReason != "finished" else None)
+                done += 1
+                report()
+        ordering = [index for window in ordered for index in window]
+        energy = engine.reset(ordering)
+        edge = 0
+        for window in ordered[:-1]:
+            edge += len(window)
+            if budget is not None and budget.stopReason(self.steps) is not None:
+                self.stopReason = budget.stopReason(self.steps)
+                break
+            ordering, energy = self.repairEdge(ordering, energy, edge, (seed + len(windows) + edge) % 2**63, budget)
+            report()
+        if greedyEnergy < energy:
+            ordering, energy = initial, greedyEnergy
+        logging.info(f"Stitched {len(windows)} windows into an ordering with energy {energy}.")
+        engine.reset(ordering)
+        return ChainResult(ordering, engine.starts(), energy, self.stopReason or "finished", self.steps, self.respreads)
+
+    def countRespreads(self, result: ChainResult) -> None:
+        """Adds the respreads of a window or repair chain to the total, which is unknown if any backend lacks a count.
+
+        Args:
+            result (ChainResult): the result of the window or repair chain
+        """
+        if self.respreads is not None:
+            self.respreads = self.respreads + result.respreads if result.respreads is not None else None
+
+    def repairEdge(
+        self, ordering: list[int], energy: float, edge: int, seed: int, budget: Budget | None
+    ) -> tuple[list[int], float]:
+        """Re-anneals the tasks on either side of a window edge with the final, low-temperature sweeps of the annealing
+        schedule, and keeps the result if it lowers the energy of the whole ordering.
+
+        Args:
+            ordering (list[int]): the stitched ordering of all tasks
+            energy (float): its energy
+            edge (int): position of the first task of the next window
+            seed (int): seed of the random number generator of the repair
+            budget (Budget | None): when to stop early
+
+        Returns:
+            tuple[list[int], float]: the repaired ordering and its energy
+        """
+        low, high = max(edge - self.repairSize, 0), min(edge + self.repairSize, len(ordering))
+        engine = EnergyEngine.fromTable(self.table)
+        engine.reset(ordering)
+        segment = ordering[low:high]
+        scheduler = self.windowScheduler(segment, engine.ends[low - 1] if low > 0 else 0.0)
+        scheduler.firstSweep = SWEEPS - WARM_START_SWEEPS + 1
+        result = scheduler.runChain(seed, budget)
+        self.steps += result.steps
+        self.countRespreads(result)
+        repaired = ordering[:low] + [segment[index] for index in result.ordering] + ordering[high:]
+        repairedEnergy = engine.reset(repaired)
+        return (repaired, repairedEnergy) if repairedEnergy < energy else (ordering, energy)
@@ -1,141 +1,600 @@
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <functional>
 #include <iostream>
 #include <math.h>
+#include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <tuple>
 
 static const double INITIAL_TEMPERATURE = 0.4;
 static const double SWEEP_EXPONENT = -2.0;
-static const size_t DAY_LENGTH = 14;
+static const size_t SWEEPS = 15;
+static const double ON_TIME_PENALTY = 100.0;
+static const uint64_t CHECK_INTERVAL = 1024; // steps between two checks of the budget
+static const uint64_t SPLITMIX_GAMMA = 0x9E3779B97F4A7C15;
+static const uint64_t SPLITMIX_MULTIPLIERS[2] = {0xBF58476D1CE4E5B9, 0x94D049BB133111EB};
 
 namespace py = pybind11;
 typedef std::vector<size_t> State;
 
-struct Task {
-  std::string uid;
-  float duration;
-  int priority;
-  int location;
-  float due;
+typedef py::array_t<double, py::array::c_style> DoubleArray;
+typedef py::array_t<int64_t, py::array::c_style> IntArray;
+typedef py::array_t<uint64_t, py::array::c_style> BitsetArray;
+
+/// Free working slots, pointing into the flat array form of melon.scheduler.base.SlotTable without copying:
+/// row 0 holds the starts, row 1 the ends and row 2 + k the longest slot among slots i, ..., i + 2^k - 1.
+struct SlotTable {
+  const double *data = nullptr;
+  size_t count = 0;  // number of slots S
+  size_t levels = 0; // number of levels of the sparse table
+
+  double start(size_t slot) const { return data[slot]; }
+  double end(size_t slot) const { return data[count + slot]; }
+
+  double longest() const {
+    double longest = 0.0;
+    for (size_t slot = 0; slot < count; slot++)
+      longest = std::max(longest, end(slot) - start(slot));
+    return longest;
+  }
+
+  /// Places a task that cannot start before stamp at the earliest time at which it fits into a free slot, see
+  /// SlotTable.nextSlot(). Returns the start of the task and the end of its slot, in hours.
+  std::pair<double, double> nextSlot(double stamp, double duration) const {
+    size_t slot = std::upper_bound(data + count, data + 2 * count, stamp) - (data + count);
+    if (slot < count && std::max(stamp, start(slot)) + duration <= end(slot))
+      return {std::max(stamp, start(slot)), end(slot)};
+    slot++;
+    for (size_t k = levels; k-- > 0;) {
+      if (slot + ((size_t)1 << k) <= count && data[(2 + k) * count + slot] < duration)
+        slot += (size_t)1 << k;
+    }
+    if (slot >= count)
+      throw std::runtime_error("The tasks do not fit into the free slots of the calendar, extend the slot table.");
+    return {start(slot), end(slot)};
+  }
+};
+
+/// Columnar task table, pointing into the NumPy arrays of melon.scheduler.base.TaskTable without copying.
+struct TaskTable {
+  const double *duration; // in hours
+  const int64_t *priority;
+  const int64_t *location; // 0 is "hybrid"
+  const double *due;       // in hours, 0 if there is no due date
+  size_t size;
+  SlotTable slots;
+  const double *travel;          // (L, L) travel cost matrix, row-major
+  size_t sites;                  // number of locations L
+  const uint64_t *before;        // precedence bitset, bit j of row i is set if task j has to be done before task i
+  size_t words;                  // number of 64-bit words per row of the precedence bitset
+  std::vector<bool> constrained; // whether each task has to be done before or after any other task
+
+  /// Whether task (transitively) depends on other.
+  bool dependsOn(size_t task, size_t other) const { return (before[task * words + (other >> 6)] >> (other & 63)) & 1; }
+};
+
+/// Counter-based SplitMix64 generator, identical to melon.scheduler.base.SplitMix64 and the other backends.
+struct SplitMix64 {
+  uint64_t seed;
+  uint64_t counter = 0; // number of numbers drawn so far
+
+  SplitMix64(uint64_t seed) : seed(seed) {}
+
+  /// Returns the next number, uniform in [0, 1).
+  double uniform() {
+    uint64_t z = seed + ++counter * SPLITMIX_GAMMA;
+    z = (z ^ (z >> 30)) * SPLITMIX_MULTIPLIERS[0];
+    z = (z ^ (z >> 27)) * SPLITMIX_MULTIPLIERS[1];
+    z ^= z >> 31;
+    return (z >> 11) * 0x1.0p-53;
+  }
+
+  /// Returns the next number, uniform in [0, n), computed as floor(uniform() * n) like in all other backends.
+  size_t below(size_t n) { return (size_t)(uniform() * n); }
+};
+
+/// When a chain has to stop before finishing its annealing schedule, see melon.scheduler.base.Budget.
+struct Budget {
+  uint64_t maxSteps = UINT64_MAX;
+  double deadline = INFINITY;               // in seconds since the Unix epoch
+  const std::atomic<uint8_t> *cancelled = nullptr; // flag of a CancelToken, set from another thread
+
+  /// Returns why the chain has to stop after the given number of steps, as an index into
+  /// melon.scheduler.base.STOP_REASONS, or 0 if it may continue.
+  uint8_t stopReason(uint64_t steps) const {
+    if (cancelled != nullptr && cancelled->load(std::memory_order_relaxed) != 0)
+      return 3;
+    if (steps >= maxSteps)
+      return 2;
+    auto now = std::chrono::duration<double>(std::chrono::system_clock::now().time_since_epoch()).count();
+    if (now >= deadline)
+      return 1;
+    return 0;
+  }
+};
+
+/// The proposal types and their probabilities, see melon.scheduler.base.MoveSet. Move types are indices into
+/// melon.scheduler.base.MOVE_TYPES.
+enum Move : size_t { SWAP, INSERTION, BLOCK_MOVE, REVERSAL, MOVE_TYPES };
+
+struct MoveSet {
+  double weights[MOVE_TYPES] = {1.0, 0.0, 0.0, 0.0}; // 0 if the move type is disabled
+  size_t maxBlockLength = 5;
+
+  /// Draws a move type with the given relative weights, like SplitMix64.choices() on the enabled move types.
+  /// No random number is drawn if only one move type is enabled.
+  Move draw(SplitMix64 &rng) const {
+    size_t enabled = 0, last = SWAP;
+    double total = 0.0;
+    for (size_t move = 0; move < MOVE_TYPES; move++) {
+      if (weights[move] > 0) {
+        enabled++;
+        last = move;
+        total += weights[move];
+      }
+    }
+    if (enabled == 1)
+      return (Move)last;
+    double threshold = rng.uniform() * total;
+    for (size_t move = 0; move < MOVE_TYPES; move++) {
+      if (weights[move] > 0) {
+        threshold -= weights[move];
+        if (threshold < 0)
+          return (Move)move;
+      }
+    }
+    return (Move)last;
+  }
 };
 
 struct SpreadResult {
-  std::string uid;
-  float start;
-  float duration;
+  size_t index;
+  double start;
 };
 
 class MCMCScheduler {
  public:
   double temperature;
   State state;
-  std::vector<Task> tasks;
+  TaskTable tasks;
+  std::vector<double> ends, slotEnds;       // cached spread of the current state, per position
+  std::vector<double> newEnds, newSlotEnds; // spread of the last proposal, starting at its first changed position
+  size_t proposedCount = 0;
+  MoveSet moves;
+  Move proposedMove = SWAP;
+  size_t proposedA = 0, proposedB = 0;  // the swapped positions of the last proposal, if it is a swap
+  size_t windowLow = 0;                 // first position of the last proposal, if it is not a swap
+  std::vector<size_t> window;           // the proposed tasks from position windowLow onward
+  std::vector<uint64_t> later;          // scratch row of the precedence bitset, see windowFeasible()
+  uint64_t moveCounts[2][MOVE_TYPES] = {}; // proposed and accepted steps of each move type
+  uint64_t steps = 0; // number of Metropolis steps performed
+  uint64_t respreads = 0; // number of task placements recomputed by the incremental evaluations
+  double averageEnergy = 0.0, acceptanceRate = 0.0; // statistics of the last sweep, see mcmcSweep()
+  SplitMix64 rng; // every instance owns its generator, so that concurrently running chains are independent
 
  public:
-  MCMCScheduler() = default;
-
-  void initState() {
-    temperature = INITIAL_TEMPERATURE;
-    for (size_t i = 0; i < tasks.size(); i++)
-      state.push_back(i);
-  }
+  MCMCScheduler(TaskTable tasks, uint64_t seed = 0, MoveSet moves = MoveSet())
+      : tasks(tasks), moves(moves), later(tasks.words, 0), rng(seed) {}
 
   std::vector<SpreadResult> spreadTasks(State order) {
-    float slot_start = 0.0;
-    float slot_duration = DAY_LENGTH;
-    float stamp = slot_start;
+    double slotEnd = -INFINITY;
+    double stamp = 0.0;
     std::vector<SpreadResult> schedule;
     for (size_t i = 0; i < order.size(); i++) {
-      auto task = tasks[order[i]];
-      if (task.duration > DAY_LENGTH)
-        throw std::exception();
-      if (stamp + task.duration > slot_start + slot_duration) {
-        slot_start += 24;
-        stamp = slot_start;
-      }
-      schedule.push_back(SpreadResult{task.uid, stamp, task.duration});
-      stamp += task.duration;
+      double duration = tasks.duration[order[i]];
+      if (stamp + duration > slotEnd)
+        std::tie(stamp, slotEnd) = tasks.slots.nextSlot(stamp, duration);
+      schedule.push_back(SpreadResult{order[i], stamp});
+      stamp += duration;
     }
     return schedule;
   }
 
-  double computeEnergy(State order) {
-    auto spread = spreadTasks(order);
-    auto last = spread[spread.size() - 1];
-    auto first = spread[0];
-    double timePenalty = last.start + last.duration - first.start;
-    double priorityPenalty = 0;
-    double commutePenalty = 0;
-    double onTimePenalty = 0;
-    for (size_t index = 1; index < order.size(); index++) {
-      auto thisTask = tasks[order[index]];
-      auto thisSlot = spread[index];
-      priorityPenalty += index * thisTask.priority;
-      if (thisTask.due != 0.0 && thisTask.due < thisSlot.start + thisSlot.duration)
-        onTimePenalty += 100.0;
-      auto previousTask = tasks[order[index - 1]];
-      if (thisTask.location == 0 || previousTask.location == 0)
-        continue;
-      if (thisTask.location != previousTask.location)
-        commutePenalty += 30.0;
-    }
-    return timePenalty + priorityPenalty + commutePenalty + onTimePenalty;
-  }
-
-  State permuteState() {
-    State proposal = state; // copy current state
-    size_t cityA_ = rand() % tasks.size();
-    size_t cityB_ = rand() % tasks.size();
-    proposal[cityA_] = state[cityB_];
-    proposal[cityB_] = state[cityA_];
-    return proposal;
-  }
-
-  void mcmcSweep(size_t steps) {
-    double energy = computeEnergy(state);
-    double E_sum = 0, E_squared_sum = 0;
-    for (size_t i = 0; i < steps; i++) {
-      State proposal = permuteState();
-      double delta = computeEnergy(proposal) - energy;
-      double acceptanceProbability = std::min(1.0, std::exp(-delta / (energy * temperature)));
-      if (((double)rand() / RAND_MAX) < acceptanceProbability) {
-        state = proposal;
+  /// Commute penalty for doing task current right after task previous, looked up in the travel cost matrix.
+  double commute(size_t previous, size_t current) {
+    return tasks.travel[tasks.location[previous] * tasks.sites + tasks.location[current]];
+  }
+
+  /// Fully evaluates the energy of the current state, caching the end of each task and the end of its free slot.
+  double resetEnergy() {
+    ends.resize(state.size());
+    slotEnds.resize(state.size());
+    newEnds.resize(state.size());
+    newSlotEnds.resize(state.size());
+    double slotEnd = -INFINITY, stamp = 0.0;
+    double energy = 0.0;
+    for (size_t position = 0; position < state.size(); position++) {
+      size_t index = state[position];
+      if (stamp + tasks.duration[index] > slotEnd)
+        std::tie(stamp, slotEnd) = tasks.slots.nextSlot(stamp, tasks.duration[index]);
+      stamp += tasks.duration[index];
+      ends[position] = stamp;
+      slotEnds[position] = slotEnd;
+      energy += position * tasks.priority[index];
+      if (position > 0) {
+        if (tasks.due[index] != 0.0 && tasks.due[index] < stamp)
+          energy += ON_TIME_PENALTY;
+        energy += commute(state[position - 1], state[position]);
+      }
+    }
+    return energy + ends[state.size() - 1];
+  }
+
+  size_t swappedTaskAt(size_t low, size_t high, size_t position) {
+    if (position == low)
+      return state[high];
+    if (position == high)
+      return state[low];
+    return state[position];
+  }
+
+  /// Checks whether swapping the tasks at two positions keeps every task after the tasks it depends on, see
+  /// EnergyEngine.swapFeasible(). A swap of a task with one of its dependencies is rejected with a single bit test.
+  bool swapFeasible(size_t low, size_t high) {
+    size_t taskLow = state[low], taskHigh = state[high];
+    if (!tasks.constrained[taskLow] && !tasks.constrained[taskHigh])
+      return true;
+    if (tasks.dependsOn(taskHigh, taskLow))
+      return false;
+    for (size_t position = low + 1; position < high; position++) {
+      if (tasks.dependsOn(taskHigh, state[position]) || tasks.dependsOn(state[position], taskLow))
+        return false;
+    }
+    return true;
+  }
+
+  /// Computes the change in energy caused by swapping the tasks at two positions of the current state, without
+  /// applying it. The proposed spread is kept in newEnds / newSlotEnds until acceptSwap() is called. Swaps that break
+  /// a dependency have an infinite delta and are never accepted.
+  double swapDelta(size_t indexA, size_t indexB) {
+    size_t low = std::min(indexA, indexB), high = std::max(indexA, indexB);
+    proposedCount = 0;
+    if (low == high)
+      return 0.0;
+    if (!swapFeasible(low, high))
+      return INFINITY;
+    size_t n = state.size();
+    double delta = (double)(high - low) * (tasks.priority[state[low]] - tasks.priority[state[high]]);
+    long lefts[4] = {(long)low - 1, (long)low, (long)high - 1, (long)high};
+    for (size_t k = 0; k < 4; k++) {
+      long left = lefts[k];
+      if (left < 0 || left >= (long)n - 1 || (k == 2 && left == (long)low))
+        continue; // out of range, or the pair between two adjacent swapped positions was already counted
+      delta += commute(swappedTaskAt(low, high, left), swappedTaskAt(low, high, left + 1));
+      delta -= commute(state[left], state[left + 1]);
+    }
+
+    double slotEnd = low > 0 ? slotEnds[low - 1] : -INFINITY;
+    double stamp = low > 0 ? ends[low - 1] : 0.0;
+    for (size_t position = low; position < n; position++) {
+      size_t index = swappedTaskAt(low, high, position);
+      if (stamp + tasks.duration[index] > slotEnd)
+        std::tie(stamp, slotEnd) = tasks.slots.nextSlot(stamp, tasks.duration[index]);
+      stamp += tasks.duration[index];
+      newEnds[proposedCount] = stamp;
+      newSlotEnds[proposedCount] = slotEnd;
+      proposedCount++;
+      if (position > 0) {
+        double oldDue = tasks.due[state[position]];
+        if (tasks.due[index] != 0.0 && tasks.due[index] < stamp)
+          delta += ON_TIME_PENALTY;
+        if (oldDue != 0.0 && oldDue < ends[position])
+          delta -= ON_TIME_PENALTY;
+      }
+      if (position >= high && stamp == ends[position] && slotEnd == slotEnds[position])
+        return delta; // from here on, the proposed spread is identical to the cached one
+    }
+    return delta + (newEnds[proposedCount - 1] - ends[n - 1]);
+  }
+
+  /// Applies the swap last evaluated by swapDelta().
+  void acceptSwap(size_t indexA, size_t indexB) {
+    size_t low = std::min(indexA, indexB);
+    std::swap(state[indexA], state[indexB]);
+    std::copy(newEnds.begin(), newEnds.begin() + proposedCount, ends.begin() + low);
+    std::copy(newSlotEnds.begin(), newSlotEnds.begin() + proposedCount, slotEnds.begin() + low);
+  }
+
+  /// Checks whether the first count tasks of window are ordered such that no task comes before one it depends on, see
+  /// EnergyEngine.windowFeasible(). As tasks outside of the window keep their position, the proposal is feasible then.
+  bool windowFeasible(size_t count) {
+    bool feasible = true;
+    for (size_t offset = count; offset-- > 0 && feasible;) {
+      size_t index = window[offset];
+      if (!tasks.constrained[index])
+        continue; // neither depends on nor is a dependency of any task
+      for (size_t word = 0; word < tasks.words; word++) {
+        if (tasks.before[index * tasks.words + word] & later[word])
+          feasible = false;
+      }
+      later[index >> 6] |= (uint64_t)1 << (index & 63);
+    }
+    std::fill(later.begin(), later.end(), 0);
+    return feasible;
+  }
+
+  /// Computes the change in energy caused by replacing the tasks at positions low, ..., low + count - 1 with the first
+  /// count tasks of window, a permutation of them, without applying it, see EnergyEngine.windowDelta(). Insertions,
+  /// block moves and reversals are evaluated this way. Proposals that break a dependency have an infinite delta.
+  double windowDelta(size_t low, size_t count) {
+    size_t high = low + count - 1, n = state.size();
+    windowLow = low;
+    proposedCount = 0;
+    if (count <= 1)
+      return 0.0;
+    if (!windowFeasible(count))
+      return INFINITY;
+    auto taskAt = [&](size_t position) {
+      return low <= position && position <= high ? window[position - low] : state[position];
+    };
+    double delta = 0.0;
+    for (size_t offset = 0; offset < count; offset++) {
+      int64_t difference = tasks.priority[window[offset]] - tasks.priority[state[low + offset]];
+      delta += (double)((int64_t)(low + offset) * difference);
+    }
+    for (size_t left = low > 0 ? low - 1 : 0; left <= std::min(high, n - 2); left++) {
+      delta += commute(taskAt(left), taskAt(left + 1));
+      delta -= commute(state[left], state[left + 1]);
+    }
+
+    double slotEnd = low > 0 ? slotEnds[low - 1] : -INFINITY;
+    double stamp = low > 0 ? ends[low - 1] : 0.0;
+    for (size_t position = low; position < n; position++) {
+      size_t index = taskAt(position);
+      if (stamp + tasks.duration[index] > slotEnd)
+        std::tie(stamp, slotEnd) = tasks.slots.nextSlot(stamp, tasks.duration[index]);
+      stamp += tasks.duration[index];
+      newEnds[proposedCount] = stamp;
+      newSlotEnds[proposedCount] = slotEnd;
+      proposedCount++;
+      if (position > 0) {
+        double oldDue = tasks.due[state[position]];
+        if (tasks.due[index] != 0.0 && tasks.due[index] < stamp)
+          delta += ON_TIME_PENALTY;
+        if (oldDue != 0.0 && oldDue < ends[position])
+          delta -= ON_TIME_PENALTY;
+      }
+      if (position >= high && stamp == ends[position] && slotEnd == slotEnds[position])
+        return delta; // from here on, the proposed spread is identical to the cached one
+    }
+    return delta + (newEnds[proposedCount - 1] - ends[n - 1]);
+  }
+
+  /// Proposes to move the block of tasks at positions start, ..., start + length - 1 so that it begins at position
+  /// target, see EnergyEngine.blockMoveDelta(). An insertion is a block move of a single task.
+  double blockMoveDelta(size_t start, size_t length, size_t target) {
+    window.clear();
+    if (start < target)
+      window.insert(window.end(), state.begin() + start + length, state.begin() + target + length);
+    window.insert(window.end(), state.begin() + start, state.begin() + start + length);
+    if (target < start)
+      window.insert(window.end(), state.begin() + target, state.begin() + start);
+    return windowDelta(std::min(start, target), window.size());
+  }
+
+  /// Proposes to reverse the segment between two positions (both included), see EnergyEngine.reversalDelta().
+  double reversalDelta(size_t indexA, size_t indexB) {
+    size_t low = std::min(indexA, indexB), high = std::max(indexA, indexB);
+    window.assign(state.rbegin() + (state.size() - 1 - high), state.rbegin() + (state.size() - low));
+    return windowDelta(low, window.size());
+  }
+
+  /// Draws a move type from the move set and evaluates a random move of that type, drawing the same random numbers in
+  /// the same order as EnergyEngine.proposeMove(). The proposal is kept until acceptMove() is called.
+  double proposeMove() {
+    size_t n = state.size();
+    proposedMove = moves.draw(rng);
+    if (proposedMove == BLOCK_MOVE) {
+      size_t length = 1 + rng.below(std::min(moves.maxBlockLength, n - 1));
+      size_t start = rng.below(n - length + 1);
+      size_t target = rng.below(n - length + 1);
+      return blockMoveDelta(start, length, target);
+    }
+    proposedA = rng.below(n);
+    proposedB = rng.below(n);
+    if (proposedMove == INSERTION)
+      return blockMoveDelta(proposedA, 1, proposedB);
+    if (proposedMove == REVERSAL)
+      return reversalDelta(proposedA, proposedB);
+    return swapDelta(proposedA, proposedB);
+  }
+
+  /// Applies the move last evaluated by proposeMove().
+  void acceptMove() {
+    if (proposedMove == SWAP) {
+      acceptSwap(proposedA, proposedB);
+      return;
+    }
+    std::copy(window.begin(), window.end(), state.begin() + windowLow);
+    std::copy(newEnds.begin(), newEnds.begin() + proposedCount, ends.begin() + windowLow);
+    std::copy(newSlotEnds.begin(), newSlotEnds.begin() + proposedCount, slotEnds.begin() + windowLow);
+  }
+
+  /// Performs a full sweep of N² steps, or fewer if the budget is exhausted, and records the average energy and the
+  /// acceptance rate of the performed steps. Returns the stop reason, see Budget.
+  uint8_t mcmcSweep(const Budget &budget) {
+    double constantEnergyMinimum = 0.0;
+    for (size_t index = 0; index < tasks.size; index++)
+      constantEnergyMinimum += tasks.duration[index];
+    constantEnergyMinimum += tasks.size * (tasks.size - 1) / 2;
+    double energy = resetEnergy() - constantEnergyMinimum;
+    uint64_t fullSweep = tasks.size * tasks.size;
+    uint64_t sweepSteps = std::min(fullSweep, budget.maxSteps - std::min(budget.maxSteps, steps));
+    double energySum = 0.0;
+    uint64_t accepted = 0;
+    uint8_t reason = sweepSteps < fullSweep ? 2 : 0;
+    uint64_t i = 0;
+    for (; i < sweepSteps; i++) {
+      if (i % CHECK_INTERVAL == 0) {
+        uint8_t stop = budget.stopReason(steps);
+        if (stop != 0) {
+          reason = stop;
+          break;
+        }
+      }
+      double delta = proposeMove();
+      respreads += proposedCount;
+      moveCounts[0][proposedMove]++;
+      // at the energy minimum, every proposal is rejected, as exp(-0 / 0) is undefined
+      double acceptanceProbability = energy > 0 ? std::min(1.0, std::exp(-delta / (energy * temperature))) : 0.0;
+      if (rng.uniform() < acceptanceProbability) {
+        acceptMove();
         energy += delta;
+        accepted++;
+        moveCounts[1][proposedMove]++;
       }
+      energySum += energy;
+      steps++;
     }
+    averageEnergy = i > 0 ? energySum / i : 0.0;
+    acceptanceRate = i > 0 ? (double)accepted / i : 0.0;
+    return reason;
   }
 
-  void mcmcSimulate(size_t iterations) {
-    for (size_t j = 0; j < iterations; j++) {
-      mcmcSweep(tasks.size() * tasks.size());
-      temperature = INITIAL_TEMPERATURE * std::pow(j + 1, SWEEP_EXPONENT);
+  /// Anneals the state and keeps the best of the states reached at the end of each sweep. After every sweep that
+  /// performed steps, onSweep (if given) is called with the best state so far and its energy. Returns the stop reason.
+  uint8_t mcmcSimulate(size_t firstSweep, const Budget &budget,
+      const std::function<void(const State &, double)> &onSweep = nullptr) {
+    State best = state;
+    double bestEnergy = resetEnergy();
+    uint8_t reason = 0;
+    for (size_t k = firstSweep; k <= SWEEPS && reason == 0; k++) {
+      temperature = INITIAL_TEMPERATURE * std::pow(k, SWEEP_EXPONENT);
+      uint64_t stepsBefore = steps;
+      reason = mcmcSweep(budget);
+      double energy = resetEnergy();
+      if (energy <= bestEnergy) {
+        best = state;
+        bestEnergy = energy;
+      }
+      if (onSweep && steps > stepsBefore)
+        onSweep(best, bestEnergy);
     }
+    state = best;
+    return reason;
   }
 };
 
-py::list schedule(const py::list &tasks) {
-  auto scheduler = MCMCScheduler();
-  for (auto it = tasks.begin(); it != tasks.end(); ++it) {
-    // unpack the tuple assuming it has exactly 4 elements (uid, duration, priority, location)
-    auto tupleIterator = it->cast<py::tuple>().begin();
-    auto task = Task{(tupleIterator++)->cast<std::string>(), (tupleIterator++)->cast<float>(),
-        (tupleIterator++)->cast<int>(), tupleIterator->cast<int>(), tupleIterator->cast<float>()};
-    scheduler.tasks.push_back(task);
-  }
-  scheduler.initState();
-  scheduler.mcmcSimulate(15);
-  auto result = py::list();
-  auto spread = scheduler.spreadTasks(scheduler.state);
-  for (size_t i = 0; i < spread.size(); i++) {
-    result.append(py::make_tuple(spread[i].uid, spread[i].start, spread[i].duration));
-  }
-  return result;
+/// Views the (duration, priority, location, due) columns, the slot table array, the travel cost matrix and the
+/// precedence bitset as a task table.
+TaskTable taskTable(const DoubleArray &duration, const IntArray &priority, const IntArray &location,
+    const DoubleArray &due, const DoubleArray &slots, const DoubleArray &travel, const BitsetArray &before) {
+  size_t size = duration.size();
+  if ((size_t)priority.size() != size || (size_t)location.size() != size || (size_t)due.size() != size)
+    throw std::invalid_argument("All columns of the task table must have the same length.");
+  if (slots.ndim() != 2 || slots.shape(0) < 3)
+    throw std::invalid_argument("Expected the (2 + K, S) array form of a SlotTable.");
+  SlotTable slotTable{slots.data(), (size_t)slots.shape(1), (size_t)slots.shape(0) - 2};
+  if (travel.ndim() != 2 || travel.shape(0) != travel.shape(1))
+    throw std::invalid_argument("Expected the (L, L) travel cost matrix of a TaskTable.");
+  size_t sites = travel.shape(0);
+  for (size_t index = 0; index < size; index++) {
+    if (location.data()[index] < 0 || (size_t)location.data()[index] >= sites)
+      throw std::invalid_argument("Every location must index a row of the travel cost matrix.");
+  }
+  if (before.ndim() != 2 || (size_t)before.shape(0) != size || before.shape(1) < (ssize_t)((size + 63) / 64))
+    throw std::invalid_argument("Expected the (N, W) precedence bitset of a TaskTable.");
+  size_t words = before.shape(1);
+  double longest = slotTable.longest();
+  for (size_t index = 0; index < size; index++) {
+    if (duration.data()[index] > longest)
+      throw std::runtime_error("Cannot schedule a task longer than the slot!");
+  }
+  std::vector<bool> constrained(size, false);
+  for (size_t task = 0; task < size; task++) {
+    for (size_t other = 0; other < size; other++) {
+      if ((before.data()[task * words + (other >> 6)] >> (other & 63)) & 1)
+        constrained[task] = constrained[other] = true;
+    }
+  }
+  return TaskTable{
+      duration.data(), priority.data(), location.data(), due.data(), size, slotTable, travel.data(), sites, before.data(),
+      words, constrained};
 }
 
-PYBIND11_MODULE(libcppscheduler, m) {
-  srand(time(NULL)); // seed the random number generator
+/// Anneals the tasks starting from initialState, proposing the move types with the weights (in the order of
+/// melon.scheduler.base.MOVE_TYPES) of moveWeights, and returns the best ordering and the start of each task as
+/// arrays, together with the number of steps performed, the stop reason, an index into
+/// melon.scheduler.base.STOP_REASONS, the number of task placements recomputed by the incremental energy evaluations
+/// and the (2, len(MOVE_TYPES)) array of the proposed and the accepted steps of each move type.
+/// Everything is validated while holding the GIL, then the GIL is released for the whole anneal, so that several
+/// schedules can run concurrently on Python threads. Unless progress is None, it is called after every sweep with
+/// (temperature, averageEnergy, acceptanceRate, steps, bestOrdering, bestStarts, bestEnergy), re-acquiring the GIL.
+py::tuple schedule(const DoubleArray &duration, const IntArray &priority, const IntArray &location,
+    const DoubleArray &due, const DoubleArray &slots, const DoubleArray &travel,
+    const BitsetArray &before, uint64_t seed, const IntArray &initialState, size_t firstSweep,
+    const DoubleArray &moveWeights, size_t maxBlockLength, uint64_t maxSteps, double deadline,
+    const py::array_t<uint8_t, py::array::c_style> &cancel, const py::object &progress) {
+  if (moveWeights.size() != MOVE_TYPES)
+    throw std::invalid_argument("Expected one weight per move type, see MoveSet.nativeArguments().");
+  MoveSet moves;
+  std::copy(moveWeights.data(), moveWeights.data() + MOVE_TYPES, moves.weights);
+  moves.maxBlockLength = maxBlockLength;
+  auto scheduler = MCMCScheduler(taskTable(duration, priority, location, due, slots, travel, before), seed, moves);
+  size_t size = scheduler.tasks.size;
+  if ((size_t)initialState.size() != size)
+    throw std::invalid_argument("The initial state must contain every task once.");
+  scheduler.state.resize(size);
+  for (size_t i = 0; i < size; i++) {
+    int64_t index = initialState.data()[i];
+    if (index < 0 || (size_t)index >= size)
+      throw std::invalid_argument("The initial state must contain every task once.");
+    scheduler.state[i] = index;
+  }
+  if (cancel.size() < 1)
+    throw std::invalid_argument("The cancel flag must have one element.");
+  // std::atomic<uint8_t> has the layout of uint8_t, and the flag is only ever written by CancelToken.cancel()
+  Budget budget{maxSteps, deadline, reinterpret_cast<const std::atomic<uint8_t> *>(cancel.data())};
+  IntArray ordering(size);
+  DoubleArray starts(size);
+  int64_t *orderingData = ordering.mutable_data();
+  double *startsData = starts.mutable_data();
+  std::function<void(const State &, double)> onSweep = nullptr;
+  if (!progress.is_none())
+    onSweep = [&](const State &best, double bestEnergy) {
+      auto spread = scheduler.spreadTasks(best);
+      std::vector<double> bestStarts;
+      for (auto &result : spread)
+        bestStarts.push_back(result.start);
+      py::gil_scoped_acquire acquire;
+      progress(scheduler.temperature, scheduler.averageEnergy, scheduler.acceptanceRate, scheduler.steps, best,
+          bestStarts, bestEnergy);
+    };
+  uint8_t reason;
+  {
+    py::gil_scoped_release release;
+    reason = scheduler.mcmcSimulate(firstSweep, budget, onSweep);
+    auto spread = scheduler.spreadTasks(scheduler.state);
+    for (size_t i = 0; i < size; i++) {
+      orderingData[i] = spread[i].index;
+      startsData[i] = spread[i].start;
+    }
+  }
+  IntArray moveCounts({(size_t)2, (size_t)MOVE_TYPES});
+  for (size_t row = 0; row < 2; row++) {
+    for (size_t move = 0; move < MOVE_TYPES; move++)
+      moveCounts.mutable_at(row, move) = scheduler.moveCounts[row][move];
+  }
+  return py::make_tuple(ordering, starts, scheduler.steps, reason, scheduler.respreads, moveCounts);
+}
 
+double swapDelta(const DoubleArray &duration, const IntArray &priority, const IntArray &location,
+    const DoubleArray &due, const DoubleArray &slots, const DoubleArray &travel, const BitsetArray &before,
+    const State &state, size_t indexA, size_t indexB) {
+  auto scheduler = MCMCScheduler(taskTable(duration, priority, location, due, slots, travel, before));
+  scheduler.state = state;
+  scheduler.resetEnergy();
+  return scheduler.swapDelta(indexA, indexB);
+}
+
+PYBIND11_MODULE(libcppscheduler, m) {
   m.doc() = "Schedule tasks";
   m.def("schedule", &schedule, "Schedule tasks");
+  m.def("swapDelta", &swapDelta, "Energy difference caused by swapping two positions of a state");
 }
@@ -1,11 +1,78 @@
-from typing import Iterable
+from typing import Callable, Sequence
 
-def schedule(tasks: Iterable[tuple[str, float, int, int, float]]) -> Iterable[tuple[str, float, float]]:
-    """Schedules the given tasks in low-level representation into calendar.
+import numpy as np
+
+def schedule(
+    duration: np.ndarray,
+    priority: np.ndarray,
+    location: np.ndarray,
+    due: np.ndarray,
+    slots: np.ndarray,
+    travel: np.ndarray,
+    before: np.ndarray,
+    seed: int,
+    initialState: np.ndarray,
+    firstSweep: int,
+    maxSteps: int,
+    deadline: float,
+    cancel: np.ndarray,
+    progress: Callable[..., None] | None,
+) -> tuple[np.ndarray, np.ndarray, int, int, int]:
+    """Schedules the given tasks in columnar representation (see melon.scheduler.base.TaskTable) into calendar.
+    The columns are read through the buffer protocol without copying, and the GIL is released during the anneal.
+    The budget (see melon.scheduler.base.Budget.nativeArguments) is checked every CHECK_INTERVAL steps.
+    Unless progress is None, it is called after every sweep, and an exception raised by it aborts the anneal.
+
+    Args:
+        duration (np.ndarray): float64 duration of each task, in hours
+        priority (np.ndarray): int64 priority of each task
+        location (np.ndarray): int64 location of each task, where 0 is "hybrid"
+        due (np.ndarray): float64 due date of each task, in hours, 0 if there is no due date
+        slots (np.ndarray): float64 (2 + K, S) array of the free working slots, see SlotTable.array
+        travel (np.ndarray): float64 (L, L) travel cost matrix, indexed by location, see TaskTable.travel
+        before (np.ndarray): uint64 (N, W) precedence bitset of the tasks, see TaskTable.before
+        seed (int): seed of the random number generator of this chain
+        initialState (np.ndarray): int64 ordering of task indices to start from
+        firstSweep (int): index k of the first sweep of the annealing schedule, 1 for a full anneal
+        maxSteps (int): number of Metropolis steps after which to stop
+        deadline (float): time.time() after which to stop, inf for no deadline
+        cancel (np.ndarray): uint8 flag of a CancelToken, stops the anneal once non-zero
+        progress (Callable[..., None] | None): called with (temperature, averageEnergy, acceptanceRate, steps,
+            bestOrdering, bestStarts, bestEnergy) after every sweep, see melon.scheduler.base.Snapshot
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, int, int, int]: int64 best ordering of task indices, float64 start of the task
+            at each position in hours, the number of steps performed, the stop reason, an index into STOP_REASONS,
+            and the number of task placements recomputed by the incremental energy evaluations
+    """
+
+def swapDelta(
+    duration: np.ndarray,
+    priority: np.ndarray,
+    location: np.ndarray,
+    due: np.ndarray,
+    slots: np.ndarray,
+    travel: np.ndarray,
+    before: np.ndarray,
+    state: Sequence[int],
+    indexA: int,
+    indexB: int,
+) -> float:
+    """Computes the energy difference caused by swapping two positions of the given state.
 
     Args:
-        tasks (Iterable[tuple[str, float, int, int]]): vector of tasks (uid, duration, priority, location)
+        duration (np.ndarray): float64 duration of each task, in hours
+        priority (np.ndarray): int64 priority of each task
+        location (np.ndarray): int64 location of each task, where 0 is "hybrid"
+        due (np.ndarray): float64 due date of each task, in hours, 0 if there is no due date
+        slots (np.ndarray): float64 (2 + K, S) array of the free working slots, see SlotTable.array
+        travel (np.ndarray): float64 (L, L) travel cost matrix, indexed by location, see TaskTable.travel
+        before (np.ndarray): uint64 (N, W) precedence bitset of the tasks, see TaskTable.before
+        state (Sequence[int]): ordering of task indices
+        indexA (int): first position within the state
+        indexB (int): second position within the state
 
     Returns:
-        Iterable[tuple[str, float, float]]: vector of allocated timeslots (uid, timestamp, duration)
+        float: the energy difference between the swapped and the given state, infinite if the swap breaks a
+            dependency
     """
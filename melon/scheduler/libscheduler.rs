@@ -1,137 +1,833 @@
 extern crate cpython;
-use rand::Rng;
+use std::sync::atomic::{AtomicU8, Ordering};
+use std::time::{SystemTime, UNIX_EPOCH};
 
-use cpython::{py_fn, py_module_initializer, PyResult, Python};
+use cpython::buffer::{Element, PyBuffer};
+use cpython::{exc, py_fn, py_module_initializer, PyErr, PyObject, PyResult, Python};
 
-const INITIAL_TEMPERATURE: f64 = 0.2;
-const DAY_LENGTH: f32 = 14.0;
+const INITIAL_TEMPERATURE: f64 = 0.4;
+const SWEEP_EXPONENT: f64 = -2.0;
+const SWEEPS: usize = 15;
+const ON_TIME_PENALTY: f64 = 100.0;
+const CHECK_INTERVAL: u64 = 1024; // steps between two checks of the budget
+const SPLITMIX_GAMMA: u64 = 0x9E3779B97F4A7C15;
+const SPLITMIX_MULTIPLIERS: [u64; 2] = [0xBF58476D1CE4E5B9, 0x94D049BB133111EB];
+// move types, indices into melon.scheduler.base.MOVE_TYPES
+const SWAP: usize = 0;
+const INSERTION: usize = 1;
+const BLOCK_MOVE: usize = 2;
+const REVERSAL: usize = 3;
+const MOVE_TYPES: usize = 4;
 
-struct Task {
-  uid: String,
-  duration: f32, // in hours
-  priority: u32,
-  location: u32,
-  due: f32, // in hours
+/// Counter-based SplitMix64 generator, identical to melon.scheduler.base.SplitMix64 and the other backends.
+struct SplitMix64 {
+  seed: u64,
+  counter: u64, // number of numbers drawn so far
 }
 
-struct TimeSlot {
-  timestamp: f32, // in hours
-  duration: f32,  // in hours
+impl SplitMix64 {
+  fn new(seed: u64) -> SplitMix64 {
+    return SplitMix64 { seed: seed, counter: 0 };
+  }
+
+  /// Returns the next number, uniform in [0, 1).
+  fn uniform(&mut self) -> f64 {
+    self.counter += 1;
+    let mut z = self.seed.wrapping_add(self.counter.wrapping_mul(SPLITMIX_GAMMA));
+    z = (z ^ (z >> 30)).wrapping_mul(SPLITMIX_MULTIPLIERS[0]);
+    z = (z ^ (z >> 27)).wrapping_mul(SPLITMIX_MULTIPLIERS[1]);
+    z ^= z >> 31;
+    return (z >> 11) as f64 * (1.0 / (1u64 << 53) as f64);
+  }
+
+  /// Returns the next number, uniform in [0, n), computed as floor(uniform() * n) like in all other backends.
+  fn below(&mut self, n: usize) -> usize {
+    return (self.uniform() * n as f64) as usize;
+  }
 }
 
-fn permute_state(state: &mut Vec<usize>) {
-  let mut rng = rand::thread_rng();
-  let index_a = rng.gen_range(0..state.len());
-  let index_b = rng.gen_range(0..state.len());
-  let value_at_a = state[index_a];
-  state[index_a] = state[index_b];
-  state[index_b] = value_at_a;
+/// The proposal types and their probabilities, see melon.scheduler.base.MoveSet.
+struct MoveSet<'a> {
+  weights: &'a [f64], // weight of each move type in the order of MOVE_TYPES, 0 if it is disabled
+  max_block_length: usize,
 }
 
-fn generate_next_working_slot(previous: TimeSlot) -> TimeSlot {
-  return TimeSlot {
-    timestamp: previous.timestamp + 24.0,
-    duration: DAY_LENGTH,
-  };
+impl<'a> MoveSet<'a> {
+  /// Draws a move type with the given relative weights, like SplitMix64.choices() on the enabled move types.
+  /// No random number is drawn if only one move type is enabled.
+  fn draw(&self, rng: &mut SplitMix64) -> usize {
+    let (mut enabled, mut last, mut total) = (0, SWAP, 0.0);
+    for movement in 0..MOVE_TYPES {
+      if self.weights[movement] > 0.0 {
+        enabled += 1;
+        last = movement;
+        total += self.weights[movement];
+      }
+    }
+    if enabled == 1 {
+      return last;
+    }
+    let mut threshold = rng.uniform() * total;
+    for movement in 0..MOVE_TYPES {
+      if self.weights[movement] > 0.0 {
+        threshold -= self.weights[movement];
+        if threshold < 0.0 {
+          return movement;
+        }
+      }
+    }
+    return last;
+  }
 }
 
-fn spread_tasks(tasks: &Vec<Task>, state: &Vec<usize>) -> Vec<(String, TimeSlot)> {
-  let mut slot = TimeSlot {
-    timestamp: 0.0,
-    duration: DAY_LENGTH,
-  };
-  let mut stamp = slot.timestamp;
-  let mut spread: Vec<(String, TimeSlot)> = vec![];
+/// Free working slots, borrowed from the flat array form of melon.scheduler.base.SlotTable without copying:
+/// row 0 holds the starts, row 1 the ends and row 2 + k the longest slot among slots i, ..., i + 2^k - 1.
+struct SlotTable<'a> {
+  data: &'a [f64],
+  count: usize, // number of slots S
+}
+
+impl<'a> SlotTable<'a> {
+  fn start(&self, slot: usize) -> f64 {
+    return self.data[slot];
+  }
+
+  fn end(&self, slot: usize) -> f64 {
+    return self.data[self.count + slot];
+  }
+
+  fn longest(&self) -> f64 {
+    return (0..self.count).map(|slot| self.end(slot) - self.start(slot)).fold(0.0, f64::max);
+  }
+
+  /// Places a task that cannot start before `stamp` at the earliest time at which it fits into a free slot, see
+  /// SlotTable.nextSlot(). Returns the start of the task and the end of its slot, in hours.
+  fn next_slot(&self, stamp: f64, duration: f64) -> (f64, f64) {
+    let ends = &self.data[self.count..2 * self.count];
+    let mut slot = ends.partition_point(|end| *end <= stamp);
+    if slot < self.count && stamp.max(self.start(slot)) + duration <= self.end(slot) {
+      return (stamp.max(self.start(slot)), self.end(slot));
+    }
+    slot += 1;
+    let levels = self.data.len() / self.count.max(1) - 2;
+    for k in (0..levels).rev() {
+      if slot + (1 << k) <= self.count && self.data[(2 + k) * self.count + slot] < duration {
+        slot += 1 << k;
+      }
+    }
+    if slot >= self.count {
+      panic!("The tasks do not fit into the free slots of the calendar, extend the slot table.");
+    }
+    return (self.start(slot), self.end(slot));
+  }
+}
+
+/// Columnar task table, borrowed from the NumPy arrays of melon.scheduler.base.TaskTable without copying.
+struct TaskTable<'a> {
+  duration: &'a [f64], // in hours
+  priority: &'a [i64],
+  location: &'a [i64], // 0 is "hybrid"
+  due: &'a [f64],      // in hours, 0 if there is no due date
+  slots: SlotTable<'a>,
+  travel: &'a [f64],       // (L, L) travel cost matrix, row-major
+  sites: usize,            // number of locations L
+  before: &'a [u64],       // precedence bitset, bit j of row i is set if task j has to be done before task i
+  words: usize,            // number of 64-bit words per row of the precedence bitset
+  constrained: Vec<bool>,  // whether each task has to be done before or after any other task
+}
+
+impl<'a> TaskTable<'a> {
+  fn len(&self) -> usize {
+    return self.duration.len();
+  }
+
+  /// Whether `task` (transitively) depends on `other`.
+  fn depends_on(&self, task: usize, other: usize) -> bool {
+    return (self.before[task * self.words + (other >> 6)] >> (other & 63)) & 1 != 0;
+  }
+}
+
+/// When a chain has to stop before finishing its annealing schedule, see melon.scheduler.base.Budget.
+struct Budget<'a> {
+  max_steps: u64,
+  deadline: f64,           // in seconds since the Unix epoch
+  cancelled: &'a AtomicU8, // flag of a CancelToken, set from another thread
+}
+
+impl<'a> Budget<'a> {
+  /// Returns why the chain has to stop after the given number of steps, as an index into
+  /// melon.scheduler.base.STOP_REASONS, or 0 if it may continue.
+  fn stop_reason(&self, steps: u64) -> u8 {
+    if self.cancelled.load(Ordering::Relaxed) != 0 {
+      return 3;
+    }
+    if steps >= self.max_steps {
+      return 2;
+    }
+    let now = SystemTime::now().duration_since(UNIX_EPOCH).map_or(0.0, |elapsed| elapsed.as_secs_f64());
+    if now >= self.deadline {
+      return 1;
+    }
+    return 0;
+  }
+}
+
+fn spread_tasks(tasks: &TaskTable, state: &Vec<usize>) -> Vec<f64> {
+  let mut slot_end = f64::NEG_INFINITY;
+  let mut stamp: f64 = 0.0;
+  let mut starts: Vec<f64> = vec![];
   for index in state {
-    let task = &tasks[*index];
-    if task.duration > slot.duration {
-      panic!("Cannot schedule a task longer than the slot!");
-    }
-    if stamp + task.duration > slot.timestamp + slot.duration {
-      slot = generate_next_working_slot(slot);
-      stamp = slot.timestamp;
-    }
-    spread.push((
-      task.uid.clone(),
-      TimeSlot {
-        timestamp: stamp,
-        duration: task.duration,
-      },
-    ));
-    stamp += task.duration;
+    let duration = tasks.duration[*index];
+    if stamp + duration > slot_end {
+      (stamp, slot_end) = tasks.slots.next_slot(stamp, duration);
+    }
+    starts.push(stamp);
+    stamp += duration;
+  }
+  return starts;
+}
+
+struct SpreadCache {
+  ends: Vec<f64>,      // end of the task at each position, in hours
+  slot_ends: Vec<f64>, // end of the free slot of the task at each position, in hours
+}
+
+impl SpreadCache {
+  fn new(n: usize) -> SpreadCache {
+    return SpreadCache {
+      ends: vec![0.0; n],
+      slot_ends: vec![0.0; n],
+    };
   }
-  return spread;
 }
 
-fn compute_energy(tasks: &Vec<Task>, state: &Vec<usize>) -> f64 {
-  let spread = spread_tasks(&tasks, &state);
-  let first = spread.first().expect("Cannot get energy of an empty state");
-  let last = spread.last().expect("Cannot get energy of an empty state");
-  let time_penalty = (last.1.timestamp + last.1.duration - first.1.timestamp) as f64;
-  let priority_penalty: u32 = (0..state.len())
-    .map(|i| (i as u32) * tasks[state[i] as usize].priority)
-    .sum();
-  let mut commute_penalty: f64 = 0.0;
-  let mut on_time_penalty: f64 = 0.0;
-  for index in 1..state.len() {
-    let previous_task = &tasks[state[index - 1]];
-    let this_task = &tasks[state[index]];
-    if this_task.due != 0.0 && this_task.due < spread[index].1.timestamp + spread[index].1.duration {
-      on_time_penalty += 100.0;
+/// Commute penalty for doing task `current` right after task `previous`, looked up in the travel cost matrix.
+fn commute(tasks: &TaskTable, previous: usize, current: usize) -> f64 {
+  return tasks.travel[tasks.location[previous] as usize * tasks.sites + tasks.location[current] as usize];
+}
+
+fn reset_energy(tasks: &TaskTable, state: &Vec<usize>, cache: &mut SpreadCache) -> f64 {
+  let mut slot_end = f64::NEG_INFINITY;
+  let mut stamp: f64 = 0.0;
+  let mut energy: f64 = 0.0;
+  for position in 0..state.len() {
+    let index = state[position];
+    if stamp + tasks.duration[index] > slot_end {
+      (stamp, slot_end) = tasks.slots.next_slot(stamp, tasks.duration[index]);
     }
-    if previous_task.location == 0 || this_task.location == 0 {
-      continue;
+    stamp += tasks.duration[index];
+    cache.ends[position] = stamp;
+    cache.slot_ends[position] = slot_end;
+    energy += (position as i64 * tasks.priority[index]) as f64;
+    if position > 0 {
+      if tasks.due[index] != 0.0 && tasks.due[index] < stamp {
+        energy += ON_TIME_PENALTY;
+      }
+      energy += commute(tasks, state[position - 1], index);
     }
-    if previous_task.location != this_task.location {
-      commute_penalty += 30.0;
+  }
+  return energy + cache.ends.last().expect("Cannot get energy of an empty state");
+}
+
+fn swapped_task_at(state: &Vec<usize>, low: usize, high: usize, position: usize) -> usize {
+  if position == low {
+    return state[high];
+  }
+  if position == high {
+    return state[low];
+  }
+  return state[position];
+}
+
+/// Checks whether swapping the tasks at two positions keeps every task after the tasks it depends on, see
+/// melon.scheduler.base.EnergyEngine.swapFeasible. A swap of a task with one of its dependencies is rejected with a
+/// single bit test.
+fn swap_feasible(tasks: &TaskTable, state: &Vec<usize>, low: usize, high: usize) -> bool {
+  let (task_low, task_high) = (state[low], state[high]);
+  if !tasks.constrained[task_low] && !tasks.constrained[task_high] {
+    return true;
+  }
+  if tasks.depends_on(task_high, task_low) {
+    return false;
+  }
+  return !state[low + 1..high]
+    .iter()
+    .any(|index| tasks.depends_on(task_high, *index) || tasks.depends_on(*index, task_low));
+}
+
+/// Computes the change in energy caused by swapping the tasks at two positions, without applying it.
+/// The proposed spread is written to `proposal`, starting at index min(index_a, index_b), and the number of written
+/// positions is returned next to the energy difference. Swaps that break a dependency have an infinite delta.
+fn swap_delta(
+  tasks: &TaskTable,
+  state: &Vec<usize>,
+  cache: &SpreadCache,
+  index_a: usize,
+  index_b: usize,
+  proposal: &mut SpreadCache,
+) -> (f64, usize) {
+  let low = index_a.min(index_b);
+  let high = index_a.max(index_b);
+  if low == high {
+    return (0.0, 0);
+  }
+  if !swap_feasible(tasks, state, low, high) {
+    return (f64::INFINITY, 0);
+  }
+  let n = state.len();
+  let mut delta = (high - low) as f64 * (tasks.priority[state[low]] - tasks.priority[state[high]]) as f64;
+  for (k, left) in [low as i64 - 1, low as i64, high as i64 - 1, high as i64].iter().enumerate() {
+    if *left < 0 || *left >= n as i64 - 1 || (k == 2 && *left == low as i64) {
+      continue; // out of range, or the pair between two adjacent swapped positions was already counted
+    }
+    let left = *left as usize;
+    delta += commute(
+      tasks,
+      swapped_task_at(state, low, high, left),
+      swapped_task_at(state, low, high, left + 1),
+    );
+    delta -= commute(tasks, state[left], state[left + 1]);
+  }
+
+  let mut slot_end: f64 = if low > 0 { cache.slot_ends[low - 1] } else { f64::NEG_INFINITY };
+  let mut stamp: f64 = if low > 0 { cache.ends[low - 1] } else { 0.0 };
+  let mut count = 0;
+  for position in low..n {
+    let index = swapped_task_at(state, low, high, position);
+    if stamp + tasks.duration[index] > slot_end {
+      (stamp, slot_end) = tasks.slots.next_slot(stamp, tasks.duration[index]);
+    }
+    stamp += tasks.duration[index];
+    proposal.ends[count] = stamp;
+    proposal.slot_ends[count] = slot_end;
+    count += 1;
+    if position > 0 {
+      let old_due = tasks.due[state[position]];
+      if tasks.due[index] != 0.0 && tasks.due[index] < stamp {
+        delta += ON_TIME_PENALTY;
+      }
+      if old_due != 0.0 && old_due < cache.ends[position] {
+        delta -= ON_TIME_PENALTY;
+      }
+    }
+    if position >= high && stamp == cache.ends[position] && slot_end == cache.slot_ends[position] {
+      return (delta, count); // from here on, the proposed spread is identical to the cached one
     }
   }
-  return time_penalty + priority_penalty as f64 + commute_penalty + on_time_penalty;
+  return (delta + proposal.ends[count - 1] - cache.ends[n - 1], count);
+}
+
+fn accept_swap(
+  state: &mut Vec<usize>,
+  cache: &mut SpreadCache,
+  index_a: usize,
+  index_b: usize,
+  proposal: &SpreadCache,
+  count: usize,
+) {
+  let low = index_a.min(index_b);
+  state.swap(index_a, index_b);
+  cache.ends[low..low + count].copy_from_slice(&proposal.ends[..count]);
+  cache.slot_ends[low..low + count].copy_from_slice(&proposal.slot_ends[..count]);
 }
 
-fn mcmc_sweep(tasks: &Vec<Task>, initial_state: Vec<usize>, temperature: f64) -> Vec<usize> {
+/// Writes the tasks of the window changed by moving the block of tasks at positions start, ..., start + length - 1 so
+/// that it begins at position target, see melon.scheduler.base.EnergyEngine.blockMoveDelta. An insertion is a block
+/// move of a single task.
+fn block_move_window(state: &Vec<usize>, start: usize, length: usize, target: usize, window: &mut Vec<usize>) {
+  window.clear();
+  if start < target {
+    window.extend_from_slice(&state[start + length..target + length]);
+  }
+  window.extend_from_slice(&state[start..start + length]);
+  if target < start {
+    window.extend_from_slice(&state[target..start]);
+  }
+}
+
+/// Checks whether the tasks of a window are ordered such that no task comes before one it depends on, see
+/// melon.scheduler.base.EnergyEngine.windowFeasible. `later` is a scratch row of the precedence bitset, all zero, and
+/// zero again on return.
+fn window_feasible(tasks: &TaskTable, window: &[usize], later: &mut Vec<u64>) -> bool {
+  let mut feasible = true;
+  for index in window.iter().rev() {
+    if !tasks.constrained[*index] {
+      continue; // neither depends on nor is a dependency of any task
+    }
+    let row = &tasks.before[*index * tasks.words..(*index + 1) * tasks.words];
+    if row.iter().zip(later.iter()).any(|(bits, placed)| bits & placed != 0) {
+      feasible = false;
+      break;
+    }
+    later[*index >> 6] |= 1 << (*index & 63);
+  }
+  later.fill(0);
+  return feasible;
+}
+
+/// Computes the change in energy caused by replacing the tasks at positions low, low + 1, ... with `window`, a
+/// permutation of them, without applying it, see melon.scheduler.base.EnergyEngine.windowDelta. Insertions, block
+/// moves and reversals are evaluated this way. The proposed spread is written to `proposal`, starting at index low,
+/// and the number of written positions is returned next to the energy difference. Proposals that break a dependency
+/// have an infinite delta.
+fn window_delta(
+  tasks: &TaskTable,
+  state: &Vec<usize>,
+  cache: &SpreadCache,
+  low: usize,
+  window: &[usize],
+  later: &mut Vec<u64>,
+  proposal: &mut SpreadCache,
+) -> (f64, usize) {
+  if window.len() <= 1 {
+    return (0.0, 0);
+  }
+  if !window_feasible(tasks, window, later) {
+    return (f64::INFINITY, 0);
+  }
+  let n = state.len();
+  let high = low + window.len() - 1;
+  let task_at = |position: usize| {
+    if low <= position && position <= high {
+      window[position - low]
+    } else {
+      state[position]
+    }
+  };
+  let mut delta: f64 = 0.0;
+  for (offset, index) in window.iter().enumerate() {
+    delta += ((low + offset) as i64 * (tasks.priority[*index] - tasks.priority[state[low + offset]])) as f64;
+  }
+  for left in low.saturating_sub(1)..high.min(n - 2) + 1 {
+    delta += commute(tasks, task_at(left), task_at(left + 1));
+    delta -= commute(tasks, state[left], state[left + 1]);
+  }
+
+  let mut slot_end: f64 = if low > 0 { cache.slot_ends[low - 1] } else { f64::NEG_INFINITY };
+  let mut stamp: f64 = if low > 0 { cache.ends[low - 1] } else { 0.0 };
+  let mut count = 0;
+  for position in low..n {
+    let index = task_at(position);
+    if stamp + tasks.duration[index] > slot_end {
+      (stamp, slot_end) = tasks.slots.next_slot(stamp, tasks.duration[index]);
+    }
+    stamp += tasks.duration[index];
+    proposal.ends[count] = stamp;
+    proposal.slot_ends[count] = slot_end;
+    count += 1;
+    if position > 0 {
+      let old_due = tasks.due[state[position]];
+      if tasks.due[index] != 0.0 && tasks.due[index] < stamp {
+        delta += ON_TIME_PENALTY;
+      }
+      if old_due != 0.0 && old_due < cache.ends[position] {
+        delta -= ON_TIME_PENALTY;
+      }
+    }
+    if position >= high && stamp == cache.ends[position] && slot_end == cache.slot_ends[position] {
+      return (delta, count); // from here on, the proposed spread is identical to the cached one
+    }
+  }
+  return (delta + (proposal.ends[count - 1] - cache.ends[n - 1]), count);
+}
+
+fn accept_window(
+  state: &mut Vec<usize>,
+  cache: &mut SpreadCache,
+  low: usize,
+  window: &[usize],
+  proposal: &SpreadCache,
+  count: usize,
+) {
+  state[low..low + window.len()].copy_from_slice(window);
+  cache.ends[low..low + count].copy_from_slice(&proposal.ends[..count]);
+  cache.slot_ends[low..low + count].copy_from_slice(&proposal.slot_ends[..count]);
+}
+
+/// Statistics of a sweep, together with the best state of the chain so far, reported back to Python after each sweep.
+struct SweepReport<'a> {
+  temperature: f64,
+  average_energy: f64,  // E_avg of the performed steps
+  acceptance_rate: f64, // proportion of accepted proposals
+  steps: u64,           // number of steps performed by the chain so far
+  best: &'a Vec<usize>,
+  best_energy: f64,
+}
+
+/// Performs a full sweep of N² steps, or fewer if the budget is exhausted. The move types are drawn, and their
+/// positions chosen, with the same random numbers as in melon.scheduler.base.EnergyEngine.proposeMove, and the proposed
+/// and accepted steps of each move type are added to `move_counts`. Returns the new state, the number of steps
+/// performed, the stop reason (see Budget::stop_reason), the average energy, the acceptance rate and the number of task
+/// placements recomputed by the incremental evaluations.
+fn mcmc_sweep(
+  tasks: &TaskTable,
+  initial_state: Vec<usize>,
+  temperature: f64,
+  rng: &mut SplitMix64,
+  moves: &MoveSet,
+  budget: &Budget,
+  steps_done: u64,
+  move_counts: &mut [[u64; MOVE_TYPES]; 2],
+) -> (Vec<usize>, u64, u8, f64, f64, u64) {
   let n = tasks.len();
   let mut state = initial_state;
-  let mut energy = compute_energy(&tasks, &state);
-  for _i in 0..n * n {
-    let mut new_state = state.clone();
-    permute_state(&mut new_state);
-    let delta = compute_energy(&tasks, &new_state) - energy;
-    let acceptance_probability = (-delta / (energy * temperature)).exp();
-    if rand::random::<f64>() < acceptance_probability {
-      state = new_state;
+  let mut cache = SpreadCache::new(n);
+  let mut proposal = SpreadCache::new(n);
+  let mut window: Vec<usize> = Vec::with_capacity(n);
+  let mut later = vec![0u64; tasks.words];
+  let mut constant_energy_minimum: f64 = 0.0;
+  for duration in tasks.duration {
+    constant_energy_minimum += duration;
+  }
+  constant_energy_minimum += (n * n.saturating_sub(1) / 2) as f64;
+  let mut energy = reset_energy(&tasks, &state, &mut cache) - constant_energy_minimum;
+  let mut steps = ((n * n) as u64).min(budget.max_steps.saturating_sub(steps_done));
+  let mut reason = if steps < (n * n) as u64 { 2 } else { 0 };
+  let mut energy_sum: f64 = 0.0;
+  let mut accepted: u64 = 0;
+  let mut respreads: u64 = 0;
+  for i in 0..steps {
+    if i % CHECK_INTERVAL == 0 {
+      let stop = budget.stop_reason(steps_done + i);
+      if stop != 0 {
+        steps = i;
+        reason = stop;
+        break;
+      }
+    }
+    let movement = moves.draw(rng);
+    let length = if movement == BLOCK_MOVE { 1 + rng.below(moves.max_block_length.min(n - 1)) } else { 1 };
+    let index_a = rng.below(n - length + 1);
+    let index_b = rng.below(n - length + 1);
+    let low = index_a.min(index_b);
+    if movement == REVERSAL {
+      window.clear();
+      window.extend(state[low..index_a.max(index_b) + 1].iter().rev());
+    } else if movement == INSERTION || movement == BLOCK_MOVE {
+      block_move_window(&state, index_a, length, index_b, &mut window); // an insertion moves a block of one task
+    }
+    let (delta, count) = if movement == SWAP {
+      swap_delta(&tasks, &state, &cache, index_a, index_b, &mut proposal)
+    } else {
+      window_delta(&tasks, &state, &cache, low, &window, &mut later, &mut proposal)
+    };
+    respreads += count as u64;
+    move_counts[0][movement] += 1;
+    // at the energy minimum, every proposal is rejected, as exp(-0 / 0) is undefined
+    let acceptance_probability = if energy > 0.0 { (-delta / (energy * temperature)).exp() } else { 0.0 };
+    if rng.uniform() < acceptance_probability {
+      if movement == SWAP {
+        accept_swap(&mut state, &mut cache, index_a, index_b, &proposal, count);
+      } else {
+        accept_window(&mut state, &mut cache, low, &window, &proposal, count);
+      }
       energy += delta;
+      accepted += 1;
+      move_counts[1][movement] += 1;
     }
+    energy_sum += energy;
   }
-  return state;
+  if steps == 0 {
+    return (state, 0, reason, 0.0, 0.0, respreads);
+  }
+  let average_energy = energy_sum / steps as f64;
+  return (state, steps, reason, average_energy, accepted as f64 / steps as f64, respreads);
 }
 
-fn schedule(tasks: &Vec<Task>) -> Vec<(String, TimeSlot)> {
+/// Anneals the tasks and returns the best of the states reached at the end of each sweep, the start of each of its
+/// tasks, the number of steps performed, the stop reason (see Budget::stop_reason), the number of task placements
+/// recomputed by the incremental energy evaluations and the proposed and accepted steps of each move type. After every
+/// sweep that performed steps, `on_sweep` is called with a report, and the anneal is cancelled once it returns false.
+fn schedule(
+  tasks: &TaskTable,
+  seed: u64,
+  initial_state: Vec<usize>,
+  first_sweep: usize,
+  moves: &MoveSet,
+  budget: &Budget,
+  on_sweep: &mut dyn FnMut(&SweepReport) -> bool,
+) -> (Vec<usize>, Vec<f64>, u64, u8, u64, [[u64; MOVE_TYPES]; 2]) {
+  let mut rng = SplitMix64::new(seed);
+  let mut cache = SpreadCache::new(tasks.len());
+  let mut state = initial_state;
+  let mut best = state.clone();
+  let mut best_energy = reset_energy(&tasks, &state, &mut cache);
+  let mut steps: u64 = 0;
+  let mut reason: u8 = 0;
+  let mut respreads: u64 = 0;
+  let mut move_counts = [[0u64; MOVE_TYPES]; 2];
+  for k in first_sweep..SWEEPS + 1 {
+    let temperature = INITIAL_TEMPERATURE * (k as f64).powf(SWEEP_EXPONENT);
+    let (new_state, performed, stop, average_energy, acceptance_rate, count) =
+      mcmc_sweep(&tasks, state, temperature, &mut rng, moves, budget, steps, &mut move_counts);
+    state = new_state;
+    steps += performed;
+    respreads += count;
+    reason = stop;
+    let energy = reset_energy(&tasks, &state, &mut cache);
+    if energy <= best_energy {
+      best = state.clone();
+      best_energy = energy;
+    }
+    if performed > 0 {
+      let report = SweepReport {
+        temperature: temperature,
+        average_energy: average_energy,
+        acceptance_rate: acceptance_rate,
+        steps: steps,
+        best: &best,
+        best_energy: best_energy,
+      };
+      if !on_sweep(&report) {
+        reason = 3;
+      }
+    }
+    if reason != 0 {
+      break;
+    }
+  }
+  let starts = spread_tasks(&tasks, &best);
+  return (best, starts, steps, reason, respreads, move_counts);
+}
+
+/// Borrows the contents of a C-contiguous buffer of the given element type, without copying.
+fn column<'a, T: Element>(py: Python<'a>, buffer: &'a PyBuffer) -> PyResult<&'a [T]> {
+  match buffer.as_slice::<T>(py) {
+    // ReadOnlyCell<T> is a transparent wrapper around T, and nobody writes to the arrays while we schedule
+    Some(cells) => Ok(unsafe { std::slice::from_raw_parts(cells.as_ptr() as *const T, cells.len()) }),
+    None => Err(PyErr::new::<exc::TypeError, _>(
+      py,
+      "Expected a C-contiguous array of the right dtype (see melon.scheduler.base.TaskTable).",
+    )),
+  }
+}
+
+/// Borrows the contents of a writable, C-contiguous buffer of the given element type, without copying.
+fn column_mut<'a, T: Element>(py: Python<'a>, buffer: &'a PyBuffer, length: usize) -> PyResult<&'a mut [T]> {
+  match buffer.as_mut_slice::<T>(py) {
+    // Cell<T> is a transparent wrapper around T, and the caller hands the output arrays over for this call only
+    Some(cells) if cells.len() == length => {
+      Ok(unsafe { std::slice::from_raw_parts_mut(cells.as_ptr() as *mut T, cells.len()) })
+    }
+    _ => Err(PyErr::new::<exc::TypeError, _>(
+      py,
+      "Expected a writable, C-contiguous output array of the right dtype and length.",
+    )),
+  }
+}
+
+/// Views the buffers of the (duration, priority, location, due, slots, travel, before) columns as a task table.
+fn task_table<'a>(py: Python<'a>, buffers: &'a [PyBuffer; 7]) -> PyResult<TaskTable<'a>> {
+  let shape = buffers[4].shape();
+  if shape.len() != 2 || shape[0] < 3 {
+    return Err(PyErr::new::<exc::ValueError, _>(
+      py,
+      "Expected the (2 + K, S) array of a slot table (see melon.scheduler.base.SlotTable).",
+    ));
+  }
+  let n = buffers[0].item_count();
+  let travel_shape = buffers[5].shape();
+  if travel_shape.len() != 2 || travel_shape[0] != travel_shape[1] {
+    return Err(PyErr::new::<exc::ValueError, _>(
+      py,
+      "Expected the (L, L) travel cost matrix of a task table (see melon.scheduler.base.TaskTable.travel).",
+    ));
+  }
+  let sites = travel_shape[0];
+  let location: &[i64] = column(py, &buffers[2])?;
+  if location.iter().any(|site| *site < 0 || *site as usize >= sites) {
+    return Err(PyErr::new::<exc::ValueError, _>(py, "Every location must index a row of the travel cost matrix."));
+  }
+  let bitset_shape = buffers[6].shape();
+  if bitset_shape.len() != 2 || bitset_shape[0] != n || bitset_shape[1] < (n + 63) / 64 {
+    return Err(PyErr::new::<exc::ValueError, _>(
+      py,
+      "Expected the (N, W) precedence bitset of a task table (see melon.scheduler.base.TaskTable.before).",
+    ));
+  }
+  let words = bitset_shape[1];
+  let before: &[u64] = column(py, &buffers[6])?;
+  let mut constrained = vec![false; n];
+  for task in 0..n {
+    for other in 0..n {
+      if (before[task * words + (other >> 6)] >> (other & 63)) & 1 != 0 {
+        constrained[task] = true;
+        constrained[other] = true;
+      }
+    }
+  }
+  Ok(TaskTable {
+    duration: column(py, &buffers[0])?,
+    priority: column(py, &buffers[1])?,
+    location: location,
+    due: column(py, &buffers[3])?,
+    slots: SlotTable {
+      data: column(py, &buffers[4])?,
+      count: shape[1],
+    },
+    travel: column(py, &buffers[5])?,
+    sites: sites,
+    before: before,
+    words: words,
+    constrained: constrained,
+  })
+}
+
+/// Anneals the tasks starting from `initial_state`, proposing the move types with the weights (in the order of
+/// melon.scheduler.base.MOVE_TYPES) of `move_weights`, and writes the best ordering and the start of each task into the
+/// caller-allocated `ordering` and `starts` arrays, and the proposed and accepted steps of each move type into the
+/// (2, len(MOVE_TYPES)) `move_counts` array. Everything is validated while holding the GIL, then the GIL is
+/// released for the whole anneal, so that several schedules can run concurrently on Python threads. Unless `progress`
+/// is None, it is called after every sweep with (temperature, averageEnergy, acceptanceRate, steps, bestOrdering,
+/// bestStarts, bestEnergy), re-acquiring the GIL, and an exception raised by it cancels the anneal and is re-raised.
+/// Returns the number of steps performed, the stop reason, an index into melon.scheduler.base.STOP_REASONS, and the
+/// number of task placements recomputed by the incremental energy evaluations.
+fn py_schedule(
+  py: Python,
+  duration: PyObject,
+  priority: PyObject,
+  location: PyObject,
+  due: PyObject,
+  slots: PyObject,
+  travel: PyObject,
+  before: PyObject,
+  seed: u64,
+  initial_state: PyObject,
+  first_sweep: usize,
+  move_weights: PyObject,
+  max_block_length: usize,
+  max_steps: u64,
+  deadline: f64,
+  cancel: PyObject,
+  progress: PyObject,
+  ordering: PyObject,
+  starts: PyObject,
+  move_counts: PyObject,
+) -> PyResult<(u64, u8, u64)> {
+  let buffers = [
+    PyBuffer::get(py, &duration)?,
+    PyBuffer::get(py, &priority)?,
+    PyBuffer::get(py, &location)?,
+    PyBuffer::get(py, &due)?,
+    PyBuffer::get(py, &slots)?,
+    PyBuffer::get(py, &travel)?,
+    PyBuffer::get(py, &before)?,
+  ];
+  let tasks = task_table(py, &buffers)?;
   let n = tasks.len();
-  let mut state = (0..n).collect();
-  for k in 1..16 {
-    state = mcmc_sweep(&tasks, state, INITIAL_TEMPERATURE * (k as f64).powf(-1.0));
+  let initial_buffer = PyBuffer::get(py, &initial_state)?;
+  let initial: &[i64] = column(py, &initial_buffer)?;
+  if initial.len() != n || initial.iter().any(|index| *index < 0 || *index as usize >= n) {
+    return Err(PyErr::new::<exc::ValueError, _>(py, "The initial state must contain every task once."));
+  }
+  let longest = tasks.slots.longest();
+  if tasks.duration.iter().any(|duration| *duration > longest) {
+    return Err(PyErr::new::<exc::RuntimeError, _>(py, "Cannot schedule a task longer than the slot!"));
+  }
+  let cancel_buffer = PyBuffer::get(py, &cancel)?;
+  let cancel_flag: &[u8] = column(py, &cancel_buffer)?;
+  if cancel_flag.is_empty() {
+    return Err(PyErr::new::<exc::ValueError, _>(py, "The cancel flag must have one element."));
+  }
+  let weights_buffer = PyBuffer::get(py, &move_weights)?;
+  let weights: &[f64] = column(py, &weights_buffer)?;
+  if weights.len() != MOVE_TYPES {
+    return Err(PyErr::new::<exc::ValueError, _>(
+      py,
+      "Expected one weight per move type (see melon.scheduler.base.MoveSet.nativeArguments).",
+    ));
+  }
+  let moves = MoveSet {
+    weights: weights,
+    max_block_length: max_block_length,
+  };
+  let budget = Budget {
+    max_steps: max_steps,
+    deadline: deadline,
+    // AtomicU8 has the layout of u8, and the flag is only ever written by CancelToken.cancel()
+    cancelled: unsafe { &*(cancel_flag.as_ptr() as *const AtomicU8) },
+  };
+  let ordering_buffer = PyBuffer::get(py, &ordering)?;
+  let starts_buffer = PyBuffer::get(py, &starts)?;
+  let ordering_out: &mut [i64] = column_mut(py, &ordering_buffer, n)?;
+  let starts_out: &mut [f64] = column_mut(py, &starts_buffer, n)?;
+  let move_counts_buffer = PyBuffer::get(py, &move_counts)?;
+  let move_counts_out: &mut [i64] = column_mut(py, &move_counts_buffer, 2 * MOVE_TYPES)?;
+  let initial_state: Vec<usize> = initial.iter().map(|index| *index as usize).collect();
+  let reports_progress = !progress.is_none(py);
+  let mut error: Option<PyErr> = None;
+  let (steps, reason, respreads) = py.allow_threads(|| {
+    let mut on_sweep = |report: &SweepReport| -> bool {
+      if !reports_progress {
+        return true;
+      }
+      let best: Vec<usize> = report.best.clone();
+      let best_starts = spread_tasks(&tasks, &best);
+      let gil = Python::acquire_gil();
+      let py = gil.python();
+      let statistics = (
+        report.temperature,
+        report.average_energy,
+        report.acceptance_rate,
+        report.steps,
+        best,
+        best_starts,
+        report.best_energy,
+      );
+      match progress.call(py, statistics, None) {
+        Ok(_) => true,
+        Err(err) => {
+          error = Some(err);
+          false
+        }
+      }
+    };
+    let (state, spread, steps, reason, respreads, counts) =
+      schedule(&tasks, seed, initial_state, first_sweep, &moves, &budget, &mut on_sweep);
+    for position in 0..n {
+      ordering_out[position] = state[position] as i64;
+      starts_out[position] = spread[position];
+    }
+    for movement in 0..MOVE_TYPES {
+      move_counts_out[movement] = counts[0][movement] as i64;
+      move_counts_out[MOVE_TYPES + movement] = counts[1][movement] as i64;
+    }
+    (steps, reason, respreads)
+  });
+  match error {
+    Some(err) => Err(err),
+    None => Ok((steps, reason, respreads)),
   }
-  return spread_tasks(&tasks, &state);
 }
 
-fn py_schedule(_py: Python, tasks: Vec<(String, f32, u32, u32, f32)>) -> PyResult<Vec<(String, f32, f32)>> {
-  let my_tasks: Vec<Task> = tasks
-    .iter()
-    .map(|x| Task {
-      uid: x.0.clone(),
-      duration: x.1,
-      priority: x.2,
-      location: x.3,
-      due: x.4,
-    })
-    .collect();
-  let calendar = schedule(&my_tasks);
-  let results = calendar
-    .iter()
-    .map(|x| (x.0.clone(), x.1.timestamp, x.1.duration))
-    .collect();
-  Ok(results)
+fn py_swap_delta(
+  py: Python,
+  duration: PyObject,
+  priority: PyObject,
+  location: PyObject,
+  due: PyObject,
+  slots: PyObject,
+  travel: PyObject,
+  before: PyObject,
+  state: Vec<usize>,
+  index_a: usize,
+  index_b: usize,
+) -> PyResult<f64> {
+  let buffers = [
+    PyBuffer::get(py, &duration)?,
+    PyBuffer::get(py, &priority)?,
+    PyBuffer::get(py, &location)?,
+    PyBuffer::get(py, &due)?,
+    PyBuffer::get(py, &slots)?,
+    PyBuffer::get(py, &travel)?,
+    PyBuffer::get(py, &before)?,
+  ];
+  let tasks = task_table(py, &buffers)?;
+  let mut cache = SpreadCache::new(state.len());
+  let mut proposal = SpreadCache::new(state.len());
+  reset_energy(&tasks, &state, &mut cache);
+  let (delta, _count) = swap_delta(&tasks, &state, &cache, index_a, index_b, &mut proposal);
+  Ok(delta)
 }
 
 py_module_initializer!(libscheduler, initlibscheduler, PyInit_scheduler, |py, m| {
@@ -139,7 +835,49 @@ py_module_initializer!(libscheduler, initlibscheduler, PyInit_scheduler, |py, m|
   m.add(
     py,
     "schedule",
-    py_fn!(py, py_schedule(tasks: Vec<(String, f32, u32, u32, f32)>)),
+    py_fn!(
+      py,
+      py_schedule(
+        duration: PyObject,
+        priority: PyObject,
+        location: PyObject,
+        due: PyObject,
+        slots: PyObject,
+        travel: PyObject,
+        before: PyObject,
+        seed: u64,
+        initial_state: PyObject,
+        first_sweep: usize,
+        move_weights: PyObject,
+        max_block_length: usize,
+        max_steps: u64,
+        deadline: f64,
+        cancel: PyObject,
+        progress: PyObject,
+        ordering: PyObject,
+        starts: PyObject,
+        move_counts: PyObject
+      )
+    ),
+  )?;
+  m.add(
+    py,
+    "swapDelta",
+    py_fn!(
+      py,
+      py_swap_delta(
+        duration: PyObject,
+        priority: PyObject,
+        location: PyObject,
+        due: PyObject,
+        slots: PyObject,
+        travel: PyObject,
+        before: PyObject,
+        state: Vec<usize>,
+        index_a: usize,
+        index_b: usize
+      )
+    ),
   )?;
   Ok(())
 });
@@ -1,141 +1,848 @@
-"""Numba implementation of the scheduler algorithm."""
+"""Numba implementation of the scheduler algorithm.
+
+All kernels are compiled for explicit signatures when this module is imported, and cached on disk (cache=True), so
+that only the very first import pays for the compilation. Later processes load the machine code from the cache in
+__pycache__, or from the directory given by the NUMBA_CACHE_DIR environment variable. Deployments can fill the cache
+ahead of time by running `python -m melon.scheduler.numba` once. The kernels release the GIL (nogil=True), so that
+other threads can cancel a running sweep and chains can run on threads.
+"""
 
 import math
-import random
-from datetime import date, datetime, timedelta
-from typing import Mapping, Sequence
+from typing import Generator, Sequence
 
 import numba
-from numba.typed.typedlist import List as NumbaList
+import numpy as np
+
+from .base import (
+    CHECK_INTERVAL,
+    INITIAL_TEMPERATURE,
+    MOVE_TYPES,
+    ON_TIME_PENALTY,
+    SPLITMIX_GAMMA,
+    SPLITMIX_MULTIPLIERS,
+    SWEEP_EXPONENT,
+    SWEEPS,
+    AbstractScheduler,
+    Budget,
+    ChainResult,
+    Snapshot,
+)
+
+# the columns of a TaskTable and all states are C-contiguous, which lets Numba vectorise the kernels
+DOUBLES = numba.float64[::1]
+SLOTS = numba.float64[:, ::1]  # the flat array form of a SlotTable
+MATRIX = numba.float64[:, ::1]  # the travel cost matrix of a TaskTable
+BITSETS = numba.uint64[:, ::1]  # the precedence bitset of a TaskTable
+BOOLEANS = numba.boolean[::1]
+INTEGERS = numba.int64[::1]
+UNSIGNED = numba.uint64[::1]
+GAMMA, MULTIPLIER_A, MULTIPLIER_B = (np.uint64(constant) for constant in (SPLITMIX_GAMMA, *SPLITMIX_MULTIPLIERS))
+SWAP, INSERTION, BLOCK_MOVE, REVERSAL = range(len(MOVE_TYPES))  # the move codes, indices into MOVE_TYPES
+
+
+@numba.njit(numba.float64(UNSIGNED), cache=True, nogil=True)
+def nextUniform(rngState: np.ndarray) -> float:
+    """Draws the next number of the SplitMix64 stream (see melon.scheduler.base.SplitMix64).
+
+    Args:
+        rngState (np.ndarray): the seed and the number of numbers drawn so far, the latter is incremented
+
+    Returns:
+        float: uniform number in [0, 1)
+    """
+    rngState[1] += np.uint64(1)
+    z = rngState[0] + rngState[1] * GAMMA
+    z = (z ^ (z >> np.uint64(30))) * MULTIPLIER_A
+    z = (z ^ (z >> np.uint64(27))) * MULTIPLIER_B
+    z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)) * 2.0**-53
+
+
+@numba.njit(numba.types.UniTuple(numba.float64, 2)(SLOTS, numba.float64, numba.float64), cache=True, nogil=True)
+def nextSlot(slots: np.ndarray, stamp: float, duration: float) -> tuple[float, float]:
+    """Places a task that cannot start before stamp at the earliest time at which it fits into a free slot
+    (see melon.scheduler.base.SlotTable.nextSlot).
+
+    Args:
+        slots (np.ndarray): the flat array form of the slot table
+        stamp (float): earliest start of the task, in hours
+        duration (float): duration of the task, in hours
+
+    Returns:
+        tuple[float, float]: the start of the task and the end of its slot, in hours
+    """
+    S = slots.shape[1]
+    slot = np.searchsorted(slots[1], stamp, side="right")
+    if slot < S and max(stamp, slots[0, slot]) + duration <= slots[1, slot]:
+        return max(stamp, slots[0, slot]), slots[1, slot]
+    slot += 1
+    for k in range(slots.shape[0] - 3, -1, -1):
+        if slot + 2**k <= S and slots[2 + k, slot] < duration:
+            slot += 2**k
+    if slot >= S:
+        raise RuntimeError("The tasks do not fit into the free slots of the calendar, extend the slot table.")
+    return slots[0, slot], slots[1, slot]
+
+
+@numba.njit(DOUBLES(DOUBLES, SLOTS, INTEGERS), cache=True, nogil=True)
+def spreadTasks(duration: np.ndarray, slots: np.ndarray, state: np.ndarray) -> np.ndarray:
+    """Spreads the given ordering of tasks across the available slots in the calendar.
+
+    Args:
+        duration (np.ndarray): duration of each task, in hours
+        slots (np.ndarray): the flat array form of the slot table
+        state (np.ndarray): ordering of task indices
+
+    Returns:
+        np.ndarray: start of the task at each position of the ordering, in hours
+    """
+    starts = np.empty(len(state))
+    slotEnd = -np.inf
+    stamp = 0.0
+    for position in range(len(state)):
+        taskDuration = duration[state[position]]
+        if stamp + taskDuration > slotEnd:
+            stamp, slotEnd = nextSlot(slots, stamp, taskDuration)
+        starts[position] = stamp
+        stamp += taskDuration
+    return starts
+
+
+@numba.njit(numba.float64(INTEGERS, MATRIX, numba.int64, numba.int64), cache=True, nogil=True)
+def commute(location: np.ndarray, travel: np.ndarray, previous: int, current: int) -> float:
+    """Commute penalty for doing task `current` right after task `previous`, looked up in the travel cost matrix.
 
-from .base import DAY_LENGTH, INITIAL_TEMPERATURE, START_OF_DAY, SWEEP_EXPONENT, AbstractScheduler, TimeSlot
+    Args:
+        location (np.ndarray): location of each task, where 0 is "hybrid"
+        travel (np.ndarray): the travel cost matrix, see melon.scheduler.base.TaskTable.travel
+        previous (int): index of the previous task
+        current (int): index of the current task
+
+    Returns:
+        float: the penalty
+    """
+    return travel[location[previous], location[current]]
+
+
+@numba.njit(numba.int64(INTEGERS, numba.int64, numba.int64, numba.int64), cache=True, nogil=True)
+def swappedTaskAt(state: np.ndarray, low: int, high: int, position: int) -> int:
+    """Returns the task index at the given position, as if the positions low and high of the state were swapped.
+
+    Args:
+        state (np.ndarray): current state
+        low (int): first swapped position
+        high (int): second swapped position
+        position (int): position to look up
+
+    Returns:
+        int: index of the task
+    """
+    if position == low:
+        return state[high]
+    if position == high:
+        return state[low]
+    return state[position]
+
+
+@numba.njit(numba.boolean(BITSETS, numba.int64, numba.int64), cache=True, nogil=True)
+def dependsOn(before: np.ndarray, task: int, other: int) -> bool:
+    """Looks up whether a task has to be done after another one.
 
-State = list[int]
+    Args:
+        before (np.ndarray): the precedence bitset, see melon.scheduler.base.TaskTable.before
+        task (int): index of the task
+        other (int): index of the other task
+
+    Returns:
+        bool: whether task (transitively) depends on other
+    """
+    return (before[task, other >> 6] >> np.uint64(other & 63)) & np.uint64(1) != 0
 
 
-@numba.njit()
-def spreadTasks(tasks: Sequence[tuple[str, float, int, int, float]]) -> Sequence[tuple[str, float, float]]:
-    """Spreads the given list of tasks across the available slots in the calendar, in order.
+@numba.njit(numba.boolean(BITSETS, BOOLEANS, INTEGERS, numba.int64, numba.int64), cache=True, nogil=True)
+def swapFeasible(before: np.ndarray, constrained: np.ndarray, state: np.ndarray, low: int, high: int) -> bool:
+    """Checks whether swapping the tasks at two positions keeps every task after the tasks it depends on
+    (see melon.scheduler.base.EnergyEngine.swapFeasible).
 
     Args:
-        tasks (Sequence[Task]): list of tasks to schedule
+        before (np.ndarray): the precedence bitset
+        constrained (np.ndarray): whether each task has to be done before or after any other task
+        state (np.ndarray): current state, which is feasible
+        low (int): first position
+        high (int): second position, greater than low
+
+    Returns:
+        bool: whether the proposed state is feasible
+    """
+    taskLow, taskHigh = state[low], state[high]
+    if not (constrained[taskLow] or constrained[taskHigh]):
+        return True
+    if dependsOn(before, taskHigh, taskLow):
+        return False
+    for position in range(low + 1, high):
+        if dependsOn(before, taskHigh, state[position]) or dependsOn(before, state[position], taskLow):
+            return False
+    return True
 
-    Yields:
-        Iterator[tuple[str, TimeSlot]]: pairs of (UID, TimeSlot), returned in chronological order
+
+@numba.njit(
+    numba.float64(DOUBLES, INTEGERS, INTEGERS, DOUBLES, SLOTS, MATRIX, INTEGERS, DOUBLES, DOUBLES),
+    cache=True,
+    nogil=True,
+)
+def resetEnergy(
+    duration: np.ndarray,
+    priority: np.ndarray,
+    location: np.ndarray,
+    due: np.ndarray,
+    slots: np.ndarray,
+    travel: np.ndarray,
+    state: np.ndarray,
+    ends: np.ndarray,
+    slotEnds: np.ndarray,
+) -> float:
+    """Fully evaluates the energy of the given state, caching the end of each task and the end of its free slot.
+
+    Args:
+        duration (np.ndarray): duration of each task, in hours
+        priority (np.ndarray): priority of each task
+        location (np.ndarray): location of each task, where 0 is "hybrid"
+        due (np.ndarray): due date of each task, in hours, 0 if there is no due date
+        slots (np.ndarray): the flat array form of the slot table
+        travel (np.ndarray): the travel cost matrix, see melon.scheduler.base.TaskTable.travel
+        state (np.ndarray): state of the MCMC algorithm
+        ends (np.ndarray): output, end of the task at each position
+        slotEnds (np.ndarray): output, end of the free slot of the task at each position
+
+    Returns:
+        float: the energy / penalty for this state
     """
-    order = []
-    slot = (0.0, DAY_LENGTH)
-    stamp = slot[0]
-    for task in tasks:
-        if task[1] > DAY_LENGTH:
+    slotEnd, stamp = -np.inf, 0.0
+    energy = 0.0
+    longest = slots[2].max() if slots.shape[1] > 0 else 0.0
+    for position in range(len(state)):
+        index = state[position]
+        if duration[index] > longest:
             raise RuntimeError(
                 "You are trying to schedule a task longer than any working slot."
                 "Split it into smaller chunks! Automatic splitting is not supported."
             )
-        if stamp + task[1] > slot[0] + slot[1]:
-            slot = (slot[0] + 24.0, DAY_LENGTH)
-            stamp = slot[0]
-        order.append((task[0], stamp, task[1]))
-        stamp += task[1]
-    return order
+        if stamp + duration[index] > slotEnd:
+            stamp, slotEnd = nextSlot(slots, stamp, duration[index])
+        stamp += duration[index]
+        ends[position] = stamp
+        slotEnds[position] = slotEnd
+        energy += position * priority[index]
+        if position > 0:
+            if due[index] != 0 and due[index] < stamp:
+                energy += ON_TIME_PENALTY
+            energy += commute(location, travel, state[position - 1], index)
+    return energy + ends[len(state) - 1]
 
 
-@numba.njit()
-def permuteState(state: State) -> State:
-    """Proposes a new state to use instead of the old state.
+@numba.njit(
+    numba.types.Tuple((numba.float64, numba.int64))(
+        DOUBLES,
+        INTEGERS,
+        INTEGERS,
+        DOUBLES,
+        SLOTS,
+        MATRIX,
+        INTEGERS,
+        DOUBLES,
+        DOUBLES,
+        numba.int64,
+        numba.int64,
+        DOUBLES,
+        DOUBLES,
+    ),
+    cache=True,
+    nogil=True,
+)
+def swapDelta(
+    duration: np.ndarray,
+    priority: np.ndarray,
+    location: np.ndarray,
+    due: np.ndarray,
+    slots: np.ndarray,
+    travel: np.ndarray,
+    state: np.ndarray,
+    ends: np.ndarray,
+    slotEnds: np.ndarray,
+    indexA: int,
+    indexB: int,
+    newEnds: np.ndarray,
+    newSlotEnds: np.ndarray,
+) -> tuple[float, int]:
+    """Computes the change in energy caused by swapping the tasks at two positions, without applying it.
+    Only the commute terms around the two positions are re-evaluated, and the spread is recomputed from the first
+    swapped position onward until it re-joins the cached one.
+
+    Args:
+        duration (np.ndarray): duration of each task, in hours
+        priority (np.ndarray): priority of each task
+        location (np.ndarray): location of each task, where 0 is "hybrid"
+        due (np.ndarray): due date of each task, in hours, 0 if there is no due date
+        slots (np.ndarray): the flat array form of the slot table
+        travel (np.ndarray): the travel cost matrix, see melon.scheduler.base.TaskTable.travel
+        state (np.ndarray): current state
+        ends (np.ndarray): cached end of the task at each position of the current state
+        slotEnds (np.ndarray): cached end of the free slot at each position of the current state
+        indexA (int): first position
+        indexB (int): second position
+        newEnds (np.ndarray): output, proposed ends, starting at index min(indexA, indexB)
+        newSlotEnds (np.ndarray): output, proposed slot ends, starting at index min(indexA, indexB)
 
     Returns:
-        State: the new state, a list of indices within tasks representing traversal order
+        tuple[float, int]: the energy difference and the number of positions written to newEnds
     """
-    newState = state.copy()
-    indexA = random.randrange(len(newState))
-    indexB = random.randrange(len(newState))
+    low, high = min(indexA, indexB), max(indexA, indexB)
+    if low == high:
+        return 0.0, 0
+    N = len(state)
+    delta = float((high - low) * (priority[state[low]] - priority[state[high]]))
+    for k in range(4):
+        left = (low - 1, low, high - 1, high)[k]
+        if left < 0 or left >= N - 1 or (k == 2 and left == low):
+            continue  # out of range, or the pair between two adjacent swapped positions was already counted
+        delta += commute(
+            location, travel, swappedTaskAt(state, low, high, left), swappedTaskAt(state, low, high, left + 1)
+        )
+        delta -= commute(location, travel, state[left], state[left + 1])
+
+    slotEnd = slotEnds[low - 1] if low > 0 else -np.inf
+    stamp = ends[low - 1] if low > 0 else 0.0
+    count = 0
+    for position in range(low, N):
+        index = swappedTaskAt(state, low, high, position)
+        if stamp + duration[index] > slotEnd:
+            stamp, slotEnd = nextSlot(slots, stamp, duration[index])
+        stamp += duration[index]
+        newEnds[count] = stamp
+        newSlotEnds[count] = slotEnd
+        count += 1
+        if position > 0:
+            oldDue = due[state[position]]
+            if due[index] != 0 and due[index] < stamp:
+                delta += ON_TIME_PENALTY
+            if oldDue != 0 and oldDue < ends[position]:
+                delta -= ON_TIME_PENALTY
+        if position >= high and stamp == ends[position] and slotEnd == slotEnds[position]:
+            return delta, count  # from here on, the proposed spread is identical to the cached one
+    return delta + newEnds[count - 1] - ends[N - 1], count
+
+
+@numba.njit(
+    numba.void(INTEGERS, DOUBLES, DOUBLES, numba.int64, numba.int64, DOUBLES, DOUBLES, numba.int64),
+    cache=True,
+    nogil=True,
+)
+def acceptSwap(
+    state: np.ndarray,
+    ends: np.ndarray,
+    slotEnds: np.ndarray,
+    indexA: int,
+    indexB: int,
+    newEnds: np.ndarray,
+    newSlotEnds: np.ndarray,
+    count: int,
+):
+    """Applies a swap evaluated by swapDelta() to the state and its cached spread.
+
+    Args:
+        state (np.ndarray): current state, modified in-place
+        ends (np.ndarray): cached ends, modified in-place
+        slotEnds (np.ndarray): cached slot ends, modified in-place
+        indexA (int): first position
+        indexB (int): second position
+        newEnds (np.ndarray): proposed ends as computed by swapDelta()
+        newSlotEnds (np.ndarray): proposed slot ends as computed by swapDelta()
+        count (int): number of positions written by swapDelta()
+    """
+    low = min(indexA, indexB)
     indexAValue = state[indexA]
-    newState[indexA] = state[indexB]
-    newState[indexB] = indexAValue
-    return newState
+    state[indexA] = state[indexB]
+    state[indexB] = indexAValue
+    ends[low : low + count] = newEnds[:count]
+    slotEnds[low : low + count] = newSlotEnds[:count]
 
 
-@numba.njit()
-def computeEnergy(tasks: Sequence[tuple[str, float, int, int, float]], state: State) -> float:
-    """For the given state, compute an MCMC energy (the lower, the better)
+@numba.njit(numba.int64(DOUBLES, UNSIGNED), cache=True, nogil=True)
+def drawMove(weights: np.ndarray, rngState: np.ndarray) -> int:
+    """Draws a move type with the given relative weights, like SplitMix64.choices() on the enabled move types.
+    No random number is drawn if only one move type is enabled.
 
     Args:
-        tasks (Sequence[tuple[str, float, int, int, float]]): list of tasks (uid, duration, priority, location, due)
-        state (State): state of the MCMC algorithm
+        weights (np.ndarray): the weight of each move type in the order of MOVE_TYPES, 0 if it is disabled
+        rngState (np.ndarray): state of the random number generator, see nextUniform()
 
     Returns:
-        float: the energy / penalty for this state
+        int: the move type, as an index into MOVE_TYPES
     """
-    spread = spreadTasks([tasks[i] for i in state])
-    totalTimePenalty = spread[-1][1] + spread[-1][2] - spread[0][1]
-    priorityPenalty = sum([position * tasks[state[position]][2] for position in range(len(state))])
-    commutePenalty = 0.0
-    onTimePenalty = 0.0
-    for position in range(1, len(state)):
-        previous = tasks[state[position - 1]]
-        current = tasks[state[position]]
-        if current[4] != 0 and current[4] < spread[position][1] + spread[position][2]:
-            onTimePenalty += 100
-        if previous[3] == 0 or current[3] == 0:
-            continue  # hybrid tasks can be done from anywhere, so do not penalise
-        if previous[3] != current[3]:
-            commutePenalty += 30.0
-    # print(totalTimePenalty, priorityPenalty, commutePenalty, onTimePenalty)
-    return totalTimePenalty + priorityPenalty + commutePenalty + onTimePenalty
-
-
-@numba.njit()
-def mcmcSweep(tasks: Sequence[tuple[str, float, int, int, float]], initialState: State, temperature: float) -> State:
-    """Performs a full MCMC sweep
-
-    Args:
-        tasks (Sequence[tuple[str, float, int, int, float]]): list of tasks
-        initialState (State): initial ordering
-        temperature (float): temperature for Simulated Annealing
+    enabled, last, total = 0, 0, 0.0
+    for move in range(len(weights)):
+        if weights[move] > 0:
+            enabled, last, total = enabled + 1, move, total + weights[move]
+    if enabled == 1:
+        return last
+    threshold = nextUniform(rngState) * total
+    for move in range(len(weights)):
+        if weights[move] > 0:
+            threshold -= weights[move]
+            if threshold < 0:
+                return move
+    return last
+
+
+@numba.njit(numba.int64(INTEGERS, numba.int64, numba.int64, numba.int64, INTEGERS), cache=True, nogil=True)
+def blockMoveWindow(state: np.ndarray, start: int, length: int, target: int, window: np.ndarray) -> int:
+    """Writes the tasks of the window changed by moving the block of tasks at positions start, ..., start + length - 1
+    so that it begins at position target (see melon.scheduler.base.EnergyEngine.blockMoveDelta). An insertion is a
+    block move of a single task.
+
+    Args:
+        state (np.ndarray): current state
+        start (int): current first position of the block
+        length (int): number of tasks in the block
+        target (int): first position of the block in the proposed state
+        window (np.ndarray): output, the proposed tasks from position min(start, target) onward
 
     Returns:
-        State: new state
-    """
-    state = initialState
-    energy = computeEnergy(tasks, state)
-    for i in range(len(tasks) ** 2):
-        newState = permuteState(state)
-        delta = computeEnergy(tasks, newState) - energy
-        acceptanceProbability = min(math.exp(-delta / (energy * temperature)), 1)
-        # print(f"New state with energy {energy + delta} (delta {delta}), accepted with {acceptanceProbability}.")
-        if random.random() < acceptanceProbability:
-            state = newState
-            energy += delta
-    return state
+        int: the number of positions in the window
+    """
+    count = 0
+    if start < target:
+        for position in range(start + length, target + length):
+            window[count] = state[position]
+            count += 1
+    for position in range(start, start + length):
+        window[count] = state[position]
+        count += 1
+    if target < start:
+        for position in range(target, start):
+            window[count] = state[position]
+            count += 1
+    return count
+
+
+@numba.njit(numba.boolean(BITSETS, BOOLEANS, INTEGERS, numba.int64, UNSIGNED), cache=True, nogil=True)
+def windowFeasible(
+    before: np.ndarray, constrained: np.ndarray, window: np.ndarray, count: int, later: np.ndarray
+) -> bool:
+    """Checks whether the tasks of a window are ordered such that no task comes before one it depends on
+    (see melon.scheduler.base.EnergyEngine.windowFeasible).
+
+    Args:
+        before (np.ndarray): the precedence bitset
+        constrained (np.ndarray): whether each task has to be done before or after any other task
+        window (np.ndarray): the task indices of the window, in their proposed order
+        count (int): the number of positions in the window
+        later (np.ndarray): scratch row of the precedence bitset, all zero, and zero again on return
+
+    Returns:
+        bool: whether the proposed state is feasible
+    """
+    for offset in range(count - 1, -1, -1):
+        index = window[offset]
+        if not constrained[index]:
+            continue  # neither depends on nor is a dependency of any task
+        for word in range(len(later)):
+            if before[index, word] & later[word]:
+                later[:] = 0
+                return False
+        later[index >> 6] |= np.uint64(1) << np.uint64(index & 63)
+    later[:] = 0
+    return True
+
+
+@numba.njit(
+    numba.types.Tuple((numba.float64, numba.int64))(
+        DOUBLES,
+        INTEGERS,
+        INTEGERS,
+        DOUBLES,
+        SLOTS,
+        MATRIX,
+        INTEGERS,
+        DOUBLES,
+        DOUBLES,
+        numba.int64,
+        INTEGERS,
+        numba.int64,
+        DOUBLES,
+        DOUBLES,
+    ),
+    cache=True,
+    nogil=True,
+)
+def windowDelta(
+    duration: np.ndarray,
+    priority: np.ndarray,
+    location: np.ndarray,
+    due: np.ndarray,
+    slots: np.ndarray,
+    travel: np.ndarray,
+    state: np.ndarray,
+    ends: np.ndarray,
+    slotEnds: np.ndarray,
+    low: int,
+    window: np.ndarray,
+    count: int,
+    newEnds: np.ndarray,
+    newSlotEnds: np.ndarray,
+) -> tuple[float, int]:
+    """Computes the change in energy caused by replacing the tasks at positions low, ..., low + count - 1 with a
+    permutation of them, without applying it (see melon.scheduler.base.EnergyEngine.windowDelta). Insertions, block
+    moves and reversals are evaluated this way.
 
+    Args:
+        duration (np.ndarray): duration of each task, in hours
+        priority (np.ndarray): priority of each task
+        location (np.ndarray): location of each task, where 0 is "hybrid"
+        due (np.ndarray): due date of each task, in hours, 0 if there is no due date
+        slots (np.ndarray): the flat array form of the slot table
+        travel (np.ndarray): the travel cost matrix, see melon.scheduler.base.TaskTable.travel
+        state (np.ndarray): current state
+        ends (np.ndarray): cached end of the task at each position of the current state
+        slotEnds (np.ndarray): cached end of the free slot at each position of the current state
+        low (int): first position of the window
+        window (np.ndarray): the new task indices at the positions of the window
+        count (int): the number of positions in the window
+        newEnds (np.ndarray): output, proposed ends, starting at index low
+        newSlotEnds (np.ndarray): output, proposed slot ends, starting at index low
+
+    Returns:
+        tuple[float, int]: the energy difference and the number of positions written to newEnds
+    """
+    high = low + count - 1
+    if high <= low:
+        return 0.0, 0
+    N = len(state)
+    delta = 0.0
+    for offset in range(count):
+        delta += (low + offset) * (priority[window[offset]] - priority[state[low + offset]])
+    for left in range(max(low - 1, 0), min(high, N - 2) + 1):
+        previous = window[left - low] if left >= low else state[left]
+        current = window[left + 1 - low] if left + 1 <= high else state[left + 1]
+        delta += commute(location, travel, previous, current)
+        delta -= commute(location, travel, state[left], state[left + 1])
 
-@numba.njit()
-def schedule(tasks: Sequence[tuple[str, float, int, int, float]]) -> Sequence[tuple[str, float, float]]:
-    """Schedules the given tasks in low-level representation into calendar.
+    slotEnd = slotEnds[low - 1] if low > 0 else -np.inf
+    stamp = ends[low - 1] if low > 0 else 0.0
+    written = 0
+    for position in range(low, N):
+        index = window[position - low] if position <= high else state[position]
+        if stamp + duration[index] > slotEnd:
+            stamp, slotEnd = nextSlot(slots, stamp, duration[index])
+        stamp += duration[index]
+        newEnds[written] = stamp
+        newSlotEnds[written] = slotEnd
+        written += 1
+        if position > 0:
+            oldDue = due[state[position]]
+            if due[index] != 0 and due[index] < stamp:
+                delta += ON_TIME_PENALTY
+            if oldDue != 0 and oldDue < ends[position]:
+                delta -= ON_TIME_PENALTY
+        if position >= high and stamp == ends[position] and slotEnd == slotEnds[position]:
+            return delta, written  # from here on, the proposed spread is identical to the cached one
+    delta += newEnds[written - 1] - ends[N - 1]
+    return delta, written
+
+
+@numba.njit(
+    numba.void(INTEGERS, DOUBLES, DOUBLES, numba.int64, INTEGERS, numba.int64, DOUBLES, DOUBLES, numba.int64),
+    cache=True,
+    nogil=True,
+)
+def acceptWindow(
+    state: np.ndarray,
+    ends: np.ndarray,
+    slotEnds: np.ndarray,
+    low: int,
+    window: np.ndarray,
+    count: int,
+    newEnds: np.ndarray,
+    newSlotEnds: np.ndarray,
+    written: int,
+):
+    """Applies a move evaluated by windowDelta() to the state and its cached spread.
 
     Args:
-        tasks (Sequence[tuple[str, float, int, int, float]]): vector of tasks (uid, duration, priority, location, due)
+        state (np.ndarray): current state, modified in-place
+        ends (np.ndarray): cached ends, modified in-place
+        slotEnds (np.ndarray): cached slot ends, modified in-place
+        low (int): first position of the window
+        window (np.ndarray): the new task indices at the positions of the window
+        count (int): the number of positions in the window
+        newEnds (np.ndarray): proposed ends as computed by windowDelta()
+        newSlotEnds (np.ndarray): proposed slot ends as computed by windowDelta()
+        written (int): number of positions written by windowDelta()
+    """
+    state[low : low + count] = window[:count]
+    ends[low : low + written] = newEnds[:written]
+    slotEnds[low : low + written] = newSlotEnds[:written]
+
+
+@numba.njit(
+    numba.types.Tuple((INTEGERS, numba.int64, numba.float64, numba.float64, numba.int64))(
+        DOUBLES,
+        INTEGERS,
+        INTEGERS,
+        DOUBLES,
+        SLOTS,
+        MATRIX,
+        BITSETS,
+        BOOLEANS,
+        INTEGERS,
+        numba.float64,
+        UNSIGNED,
+        numba.int64,
+        numba.uint8[::1],
+        DOUBLES,
+        numba.int64,
+        numba.int64[:, ::1],
+    ),
+    cache=True,
+    nogil=True,
+)
+def mcmcSweep(
+    duration: np.ndarray,
+    priority: np.ndarray,
+    location: np.ndarray,
+    due: np.ndarray,
+    slots: np.ndarray,
+    travel: np.ndarray,
+    before: np.ndarray,
+    constrained: np.ndarray,
+    initialState: np.ndarray,
+    temperature: float,
+    rngState: np.ndarray,
+    steps: int,
+    cancelFlag: np.ndarray,
+    weights: np.ndarray,
+    maxBlockLength: int,
+    moveCounts: np.ndarray,
+) -> tuple[np.ndarray, int, float, float, int]:
+    """Performs an MCMC sweep, evaluating each proposal incrementally. The move types are drawn, and their positions
+    chosen, with the same random numbers as in melon.scheduler.base.EnergyEngine.proposeMove().
+
+    Args:
+        duration (np.ndarray): duration of each task, in hours
+        priority (np.ndarray): priority of each task
+        location (np.ndarray): location of each task, where 0 is "hybrid"
+        due (np.ndarray): due date of each task, in hours, 0 if there is no due date
+        slots (np.ndarray): the flat array form of the slot table
+        travel (np.ndarray): the travel cost matrix, see melon.scheduler.base.TaskTable.travel
+        before (np.ndarray): the precedence bitset, see melon.scheduler.base.TaskTable.before
+        constrained (np.ndarray): whether each task has to be done before or after any other task
+        initialState (np.ndarray): initial ordering, which is feasible
+        temperature (float): temperature for Simulated Annealing
+        rngState (np.ndarray): state of the random number generator, see nextUniform()
+        steps (int): number of Metropolis steps, N² for a full sweep
+        cancelFlag (np.ndarray): flag of a CancelToken, polled every CHECK_INTERVAL steps
+        weights (np.ndarray): the weight of each move type in the order of MOVE_TYPES, see MoveSet.nativeArguments()
+        maxBlockLength (int): upper bound on the length of a relocated block
+        moveCounts (np.ndarray): (2, len(MOVE_TYPES)) array, incremented by the proposed and the accepted steps of
+            each move type
 
     Returns:
-        Sequence[tuple[str, float, float]]: vector of allocated timeslots (uid, timestamp, duration)
+        tuple[np.ndarray, int, float, float, int]: new state, the number of steps performed before the sweep ended or
+            was cancelled, the average energy E_avg, the acceptance rate over these steps and the number of task
+            placements recomputed by the incremental evaluations
     """
-    state = list(range(len(tasks)))
-    for k in range(1, 16):
-        temperature = INITIAL_TEMPERATURE * k**SWEEP_EXPONENT
-        state = mcmcSweep(tasks, state, temperature)
-    return spreadTasks([tasks[i] for i in state])
+    N = len(initialState)
+    state = initialState.copy()
+    ends, slotEnds = np.empty(N), np.empty(N)
+    newEnds, newSlotEnds = np.empty(N), np.empty(N)
+    window, later = np.empty(N, dtype=np.int64), np.zeros(before.shape[1], dtype=np.uint64)
+    constantEnergyMinimum = 0.0
+    for index in range(N):
+        constantEnergyMinimum += duration[index]
+    constantEnergyMinimum += N * (N - 1) // 2
+    energy = (
+        resetEnergy(duration, priority, location, due, slots, travel, state, ends, slotEnds) - constantEnergyMinimum
+    )
+    E_sum, accepted, respreads = 0.0, 0, 0
+    performed = steps
+    for i in range(steps):
+        if i % CHECK_INTERVAL == 0 and cancelFlag[0] != 0:
+            performed = i
+            break
+        move = drawMove(weights, rngState)
+        if move == BLOCK_MOVE:
+            length = 1 + int(nextUniform(rngState) * min(maxBlockLength, N - 1))
+            indexA = int(nextUniform(rngState) * (N - length + 1))
+            indexB = int(nextUniform(rngState) * (N - length + 1))
+        else:
+            length = 1
+            indexA = int(nextUniform(rngState) * N)
+            indexB = int(nextUniform(rngState) * N)
+        low, high = min(indexA, indexB), max(indexA, indexB)
+        if move != SWAP:
+            if move == REVERSAL:
+                size = high - low + 1
+                window[:size] = state[low : high + 1][::-1]
+            else:  # an insertion is a block move of a single task
+                size = blockMoveWindow(state, indexA, length, indexB, window)
+            if not windowFeasible(before, constrained, window, size, later):
+                delta, count = math.inf, 0
+            else:
+                delta, count = windowDelta(
+                    duration,
+                    priority,
+                    location,
+                    due,
+                    slots,
+                    travel,
+                    state,
+                    ends,
+                    slotEnds,
+                    low,
+                    window,
+                    size,
+                    newEnds,
+                    newSlotEnds,
+                )
+                respreads += count
+        elif indexA != indexB and not swapFeasible(before, constrained, state, low, high):
+            delta, count = math.inf, 0  # the random number is still drawn, to keep the stream aligned
+        else:
+            delta, count = swapDelta(
+                duration,
+                priority,
+                location,
+                due,
+                slots,
+                travel,
+                state,
+                ends,
+                slotEnds,
+                indexA,
+                indexB,
+                newEnds,
+                newSlotEnds,
+            )
+            respreads += count
+        acceptanceProbability = min(math.exp(-delta / (energy * temperature)), 1) if energy > 0 else 0.0
+        # print(f"New state with energy {energy + delta} (delta {delta}), accepted with {acceptanceProbability}.")
+        moveCounts[0, move] += 1
+        if nextUniform(rngState) < acceptanceProbability:
+            if move == SWAP:
+                acceptSwap(state, ends, slotEnds, indexA, indexB, newEnds, newSlotEnds, count)
+            else:
+                acceptWindow(state, ends, slotEnds, low, window, size, newEnds, newSlotEnds, count)
+            energy += delta
+            accepted += 1
+            moveCounts[1, move] += 1
+        E_sum += energy
+    if performed == 0:
+        return state, 0, 0.0, 0.0, respreads
+    return state, performed, E_sum / performed, accepted / performed, respreads
 
 
 class NumbaMCMCScheduler(AbstractScheduler):
     """Markov Chain Monte-Carlo Task Scheduler, implemented in Python with numba speed-up."""
 
-    def schedule(self) -> Mapping[str, TimeSlot]:
-        """Runs the Rust implementation of the scheduler.
+    releasesGIL = True  # only the bookkeeping between sweeps holds the GIL
+
+    def swapDelta(self, state: Sequence[int], indexA: int, indexB: int) -> float:
+        """Computes the energy difference caused by swapping two positions of the given state.
+
+        Args:
+            state (Sequence[int]): the ordering of task indices
+            indexA (int): first position within the state
+            indexB (int): second position within the state
 
         Returns:
-            Mapping[str, TimeSlot]: the resulting schedule
+            float: the energy difference between the swapped and the given state, infinite if the swap breaks a
+                dependency
         """
-        start = datetime.combine(date.today(), START_OF_DAY)  # equivalent to t = 0
-        result = schedule(NumbaList(task.asTuple(start) for task in self.tasks))
-        return {t[0]: TimeSlot(start + timedelta(hours=t[1]), t[2]) for t in result}
+        *columns, before = self.table.columns()
+        array = np.array(state, dtype=np.int64)
+        low, high = min(indexA, indexB), max(indexA, indexB)
+        if low != high and not swapFeasible(before, self.table.constrained, array, low, high):
+            return math.inf
+        ends, slotEnds = np.empty(len(array)), np.empty(len(array))
+        resetEnergy(*columns, array, ends, slotEnds)
+        delta, _ = swapDelta(
+            *columns, array, ends, slotEnds, indexA, indexB, np.empty(len(array)), np.empty(len(array))
+        )
+        return delta
+
+    def sweeps(self, seed: int, budget: Budget | None = None) -> Generator[Snapshot, None, ChainResult]:
+        """Runs a single chain of the Numba implementation of the scheduler, yielding a snapshot after each sweep.
+        Numba cannot read the clock, so the time budget is checked between sweeps, while the kernel, which runs without
+        the GIL, polls the cancel token every CHECK_INTERVAL steps and stops after the allowed steps.
+
+        Args:
+            seed (int): seed of the random number generator of this chain
+            budget (Budget | None, optional): when to stop early. Defaults to running the full schedule.
+
+        Yields:
+            Snapshot: the progress after each sweep
+
+        Returns:
+            ChainResult: the best ordering seen at the end of a sweep, with its start times and energy
+        """
+        budget = budget if budget is not None else Budget()
+        *columns, before = self.table.columns()
+        constrained = self.table.constrained
+        rngState = np.array([seed, 0], dtype=np.uint64)
+        state = np.array(self.initialState, dtype=np.int64)
+        N = len(state)
+        ends, slotEnds = np.empty(N), np.empty(N)
+        self.steps, self.stopReason, respreads = 0, None, 0
+        best, bestEnergy = state, resetEnergy(*columns, state, ends, slotEnds)
+        _, _, cancelFlag = budget.nativeArguments()
+        weights, maxBlockLength = self.moves.nativeArguments()
+        moveCounts = np.zeros((2, len(MOVE_TYPES)), dtype=np.int64)
+        for sweep, k in enumerate(range(self.firstSweep, SWEEPS + 1), 1):
+            self.stopReason = budget.stopReason(self.steps)
+            if self.stopReason is not None:
+                break
+            stepsLeft = budget.stepsLeft(self.steps)
+            steps = N**2 if stepsLeft is None else min(N**2, stepsLeft)
+            temperature = INITIAL_TEMPERATURE * k**SWEEP_EXPONENT
+            state, performed, averageEnergy, acceptanceRate, count = mcmcSweep(
+                *columns,
+                before,
+                constrained,
+                state,
+                temperature,
+                rngState,
+                steps,
+                cancelFlag,
+                weights,
+                maxBlockLength,
+                moveCounts,
+            )
+            self.steps += performed
+            respreads += count
+            energy = resetEnergy(*columns, state, ends, slotEnds)
+            if energy <= bestEnergy:
+                best, bestEnergy = state, energy
+            if performed > 0:
+                starts = spreadTasks(self.table.duration, self.table.slots.array, best)
+                yield Snapshot(
+                    sweep,
+                    temperature,
+                    averageEnergy,
+                    acceptanceRate,
+                    self.steps,
+                    best.tolist(),
+                    starts.tolist(),
+                    bestEnergy,
+                )
+            if performed < N**2:
+                self.stopReason = budget.stopReason(self.steps)
+                break
+        self.recordMoveCounts(moveCounts)
+        starts = spreadTasks(self.table.duration, self.table.slots.array, best)
+        return ChainResult(
+            best.tolist(), starts.tolist(), bestEnergy, self.stopReason or "finished", self.steps, respreads
+        )
+
+
+if __name__ == "__main__":
+    print(f"Compiled and cached {len(mcmcSweep.signatures)} signature(s) of the Numba scheduler.")
@@ -1,67 +1,156 @@
 """The scheduler algorithm"""
 
+import bisect
 import logging
 import math
 import random
-from datetime import date, datetime, timedelta
-from typing import Iterable, Mapping
+from datetime import date, datetime, time, timedelta
+from typing import Generator, Iterable, Iterator, Mapping, Sequence
 
-from .base import DAY_LENGTH, INITIAL_TEMPERATURE, START_OF_DAY, SWEEP_EXPONENT, AbstractScheduler, Task, TimeSlot
+from .base import (
+    CHECK_INTERVAL,
+    DAY_LENGTH,
+    INITIAL_TEMPERATURE,
+    ON_TIME_PENALTY,
+    START_OF_DAY,
+    SWEEP_EXPONENT,
+    SWEEPS,
+    AbstractScheduler,
+    Budget,
+    ChainResult,
+    EnergyEngine,
+    MoveSet,
+    SlotTable,
+    Snapshot,
+    SplitMix64,
+    Task,
+    TaskTable,
+    TimeSlot,
+)
 
 
 class AvailabilityManager:
-    """This class manages the user's availability in a calendar."""
+    """This class manages the user's availability in a calendar: working hours per weekday, excluded days (holidays)
+    and busy times, such as the events in the user's calendars. The busy times are merged into sorted, disjoint
+    intervals, which are subtracted from the working hours with a binary search per working slot.
+    """
 
-    def __init__(self) -> None:
-        """Initialises the availability manager according to defaults."""
+    def __init__(
+        self,
+        workingHours: Mapping[int, Sequence[tuple[time, float]]] | None = None,
+        busy: Iterable[TimeSlot] = (),
+        exclusions: Iterable[date] = (),
+    ) -> None:
+        """Initialises the availability manager, by default with a working slot of DAY_LENGTH hours every day.
+
+        Args:
+            workingHours (Mapping[int, Sequence[tuple[time, float]]] | None, optional): the working slots of each
+                weekday (0 is Monday), as pairs of start time and length in hours. Defaults to the same slot every day.
+            busy (Iterable[TimeSlot], optional): times at which the user is not available. Defaults to none.
+            exclusions (Iterable[date], optional): days without any working hours. Defaults to none.
+        """
         self.startOfDay = START_OF_DAY  # start at 10am
         self.defaultDayLength = DAY_LENGTH  # going all the way to 2am
+        if workingHours is None:
+            workingHours = {weekday: [(self.startOfDay, self.defaultDayLength)] for weekday in range(7)}
+        self.workingHours = {weekday: sorted(workingHours.get(weekday, ())) for weekday in range(7)}
+        self.exclusions = set(exclusions)
+        self.busyStarts: list[datetime] = []  # sorted and disjoint, such that the ends are sorted as well
+        self.busyEnds: list[datetime] = []
+        self.addBusy(busy)
 
-    def startingSlot(self) -> TimeSlot:
-        """Starting slot, starting at 10am today
+    def addBusy(self, slots: Iterable[TimeSlot]) -> None:
+        """Marks the given times as busy, merging them with the known busy times.
 
-        Returns:
-            TimeSlot: the first working slot
+        Args:
+            slots (Iterable[TimeSlot]): the busy times, in any order and possibly overlapping
         """
-        return TimeSlot(datetime.combine(date.today(), self.startOfDay), self.defaultDayLength)
+        intervals = sorted([*zip(self.busyStarts, self.busyEnds), *((slot.timestamp, slot.end) for slot in slots)])
+        self.busyStarts, self.busyEnds = [], []
+        for start, end in intervals:
+            if self.busyEnds and start <= self.busyEnds[-1]:
+                self.busyEnds[-1] = max(self.busyEnds[-1], end)
+            elif end > start:
+                self.busyStarts.append(start)
+                self.busyEnds.append(end)
 
-    def generateNextSlot(self, previous: TimeSlot) -> TimeSlot:
-        """Following a daily schedule, returns the next possible working slot
+    def freeSlots(self, start: datetime) -> Iterator[TimeSlot]:
+        """Generates the free working slots after the given time, in chronological order and without end.
 
         Args:
-            previous (TimeSlot): the previous working slot
+            start (datetime): the earliest time to consider
+
+        Yields:
+            Iterator[TimeSlot]: the free slots, each one being a working slot minus the busy times within it
+        """
+        if not any(length > 0 for slots in self.workingHours.values() for _, length in slots):
+            raise ValueError("There are no working hours on any weekday.")
+        day = start.date() - timedelta(days=1)  # working slots of the previous day may extend past midnight
+        while True:
+            if day not in self.exclusions:
+                for startOfSlot, length in self.workingHours[day.weekday()]:
+                    slotStart = datetime.combine(day, startOfSlot)
+                    slotEnd, cursor = slotStart + timedelta(hours=length), max(slotStart, start)
+                    busy = bisect.bisect_right(self.busyEnds, cursor)  # the first busy time ending after the cursor
+                    while busy < len(self.busyStarts) and self.busyStarts[busy] < slotEnd:
+                        if self.busyStarts[busy] > cursor:
+                            yield TimeSlot(cursor, (self.busyStarts[busy] - cursor).total_seconds() / 3600)
+                        cursor = max(cursor, self.busyEnds[busy])
+                        busy += 1
+                    if cursor < slotEnd:
+                        yield TimeSlot(cursor, (slotEnd - cursor).total_seconds() / 3600)
+            day += timedelta(days=1)
+
+    def slotTable(self, start: datetime, tasks: Sequence[Task]) -> SlotTable:
+        """Builds the table of free slots that the schedulers spread the given tasks across. Each task either fits
+        behind the previous one or starts a slot at least as long as itself, so the table ends once it holds one such
+        slot more than there are tasks.
+
+        Args:
+            start (datetime): time reference of the table, equivalent to t = 0
+            tasks (Sequence[Task]): the tasks to be scheduled
+
+        Raises:
+            RuntimeError: when a task is longer than any working slot
 
         Returns:
-            TimeSlot: the next working slot
+            SlotTable: the free slots, in hours relative to start
         """
-        return TimeSlot(
-            datetime.combine(previous.timestamp.date() + timedelta(days=1), self.startOfDay),
-            self.defaultDayLength,
-        )
+        longest = max((task.duration for task in tasks), default=0.0)
+        if longest > max((length for slots in self.workingHours.values() for _, length in slots), default=0.0):
+            raise RuntimeError(
+                "You are trying to schedule a task longer than any working slot."
+                "Split it into smaller chunks! Automatic splitting is not supported."
+            )
+        starts, ends, longEnough = [], [], 0
+        for slot in self.freeSlots(start):
+            offset = (slot.timestamp - start).total_seconds() / 3600
+            starts.append(offset)
+            ends.append(offset + slot.duration)
+            longEnough += slot.duration >= longest
+            if longEnough > len(tasks):
+                break
+        return SlotTable(starts, ends)
 
-    def spreadTasks(self, tasks: Iterable[Task]) -> Iterable[tuple[str, TimeSlot]]:
+    def spreadTasks(self, tasks: Iterable[Task], start: datetime | None = None) -> Iterable[tuple[str, TimeSlot]]:
         """Spreads the given list of tasks across the available slots in the calendar, in order.
 
         Args:
             tasks (Iterable[Task]): list of tasks to schedule
+            start (datetime | None, optional): the earliest time to schedule at. Defaults to today at startOfDay.
 
         Yields:
             Iterator[tuple[str, TimeSlot]]: pairs of (UID, TimeSlot), returned in chronological order
         """
-        slot = self.startingSlot()
-        stamp = slot.timestamp
+        tasks = list(tasks)
+        start = start if start is not None else datetime.combine(date.today(), self.startOfDay)
+        slots = self.slotTable(start, tasks)
+        stamp, slotEnd = 0.0, -math.inf
         for task in tasks:
-            if task.duration > self.defaultDayLength:
-                raise RuntimeError(
-                    "You are trying to schedule a task longer than any working slot."
-                    "Split it into smaller chunks! Automatic splitting is not supported."
-                )
-            taskDuration = timedelta(hours=task.duration)
-            if stamp + taskDuration > slot.end:
-                slot = self.generateNextSlot(slot)
-                stamp = slot.timestamp
-            yield (task.uid, TimeSlot(stamp, taskDuration.total_seconds() / 3600))
-            stamp += taskDuration
+            if stamp + task.duration > slotEnd:
+                stamp, slotEnd = slots.nextSlot(stamp, task.duration)
+            yield (task.uid, TimeSlot(start + timedelta(hours=stamp), float(task.duration)))
+            stamp += task.duration
 
 
 class MCMCScheduler(AbstractScheduler):
@@ -69,33 +158,62 @@ class MCMCScheduler(AbstractScheduler):
 
     State = tuple[int, ...]  # using literal ellipsis to indicate a homogenous tuple of ints
 
-    def __init__(self, tasks: list[Task]) -> None:
+    def __init__(
+        self,
+        tasks: list[Task],
+        seed: int | None = None,
+        moves: MoveSet | None = None,
+        *,
+        adaptive: bool = False,
+        tolerance: float = 0.01,
+        maxSweeps: int = 60,
+    ) -> None:
         """Initialises the MCMC scheduler, working on a set of pre-defined tasks.
 
         Args:
             tasks (list[Task]): the tasks to be scheduled
+            seed (int | None, optional): seed of the first chain. Defaults to a random seed.
+            moves (MoveSet | None, optional): the proposal types and their probabilities. Defaults to swaps only.
+            adaptive (bool, optional): whether to derive each temperature from the energy statistics of the previous
+                sweep and stop once they plateau, instead of following the fixed schedule of 15 sweeps.
+                Defaults to False.
+            tolerance (float, optional): relative change of E_avg and absolute change of the acceptance rate below
+                which the adaptive schedule considers the chain converged. Defaults to 0.01.
+            maxSweeps (int, optional): upper bound on the number of sweeps of the adaptive schedule. Defaults to 60.
         """
-        super().__init__(tasks)
+        super().__init__(tasks, seed, moves)
         self.availability = AvailabilityManager()
+        self.engine = EnergyEngine.fromTable(self.table)
         self.state = tuple(range(len(self.tasks)))  # initialise in order
+        self.rng = SplitMix64(seed if seed is not None else random.getrandbits(63))
         self.temperature = 1.0
         self.energyLog = []
+        self.acceptanceLog = []
         self.sweepExponent = SWEEP_EXPONENT
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.maxSweeps = maxSweeps
+        self.coolingRate = 0.7  # lambda of the adaptive schedule, the smaller the slower the cooling
         self.constantEnergyMinimum = sum(t.duration for t in self.tasks) + sum((n) for n in self.state)
 
-    def permuteState(self) -> State:
-        """Proposes a new state to use instead of the old state.
+    def setAvailability(self, availability: AvailabilityManager) -> None:
+        """Spreads the tasks across the free slots of the given availability, see AbstractScheduler.setAvailability().
 
-        Returns:
-            State: the new state, a list of indices within self.tasks representing traversal order
+        Args:
+            availability (AvailabilityManager): the working hours, exclusions and busy times of the user
+        """
+        super().setAvailability(availability)
+        self.availability = availability
+        self.engine = EnergyEngine.fromTable(self.table)
+
+    def setTable(self, table: TaskTable) -> None:
+        """Replaces the task table and rebuilds the energy engine, see AbstractScheduler.setTable().
+
+        Args:
+            table (TaskTable): the table, holding the same tasks in the same order
         """
-        newState = list(self.state)
-        indexA = random.randrange(len(newState))
-        indexB = random.randrange(len(newState))
-        indexAValue = self.state[indexA]
-        newState[indexA] = self.state[indexB]
-        newState[indexB] = indexAValue
-        return tuple(newState)
+        super().setTable(table)
+        self.engine = EnergyEngine.fromTable(self.table)
 
     def computeEnergy(self, state: State) -> float:
         """For the given state, compute an MCMC energy (the lower, the better)
@@ -106,8 +224,8 @@ class MCMCScheduler(AbstractScheduler):
         Returns:
             float: the energy / penalty for this state
         """
-        spread = list(self.availability.spreadTasks(self.tasks[i] for i in state))
-        totalTimePenalty = (spread[-1][1].end - spread[0][1].timestamp).total_seconds() / 3600
+        spread = list(self.availability.spreadTasks((self.tasks[i] for i in state), self.table.start))
+        totalTimePenalty = (spread[-1][1].end - self.table.start).total_seconds() / 3600
         priorityPenalty = sum((position) * self.tasks[state[position]].priority for position in range(len(state)))
         commutePenalty = 0.0
         onTimePenalty = 0.0
@@ -115,40 +233,166 @@ class MCMCScheduler(AbstractScheduler):
             previous = self.tasks[state[position - 1]]
             current = self.tasks[state[position]]
             if current.due is not None and current.due < spread[position][1].end:
-                onTimePenalty += 100.0
-            if previous.location == 0 or current.location == 0:
-                continue  # hybrid tasks can be done from anywhere, so do not penalise
-            if previous.location != current.location:
-                commutePenalty += 30.0
+                onTimePenalty += ON_TIME_PENALTY
+            commutePenalty += self.table.travel[previous.location, current.location]
         total = totalTimePenalty + priorityPenalty + commutePenalty + onTimePenalty - self.constantEnergyMinimum
         return total
 
-    def mcmcSweep(self):
-        """Performs a full MCMC sweep"""
-        energy = self.computeEnergy(self.state)
+    def swapDelta(self, state: State, indexA: int, indexB: int) -> float:
+        """Computes the energy difference caused by swapping two positions of the given state.
+
+        Args:
+            state (State): the ordering of task indices
+            indexA (int): first position within the state
+            indexB (int): second position within the state
+
+        Returns:
+            float: the energy difference between the swapped and the given state
+        """
+        self.engine.reset(state)
+        return self.engine.swapDelta(indexA, indexB)
+
+    def proposeMove(self) -> tuple[str, float]:
+        """Draws a move type according to self.moves and lets the energy engine evaluate a random move of that type.
+
+        Returns:
+            tuple[str, float]: the name of the move type and the energy difference of the proposal
+        """
+        return self.engine.proposeMove(self.moves, self.rng)
+
+    def mcmcSweep(self, budget: Budget | None = None):
+        """Performs a full MCMC sweep, evaluating each proposal incrementally through the energy engine. The sweep is cut
+        short when the budget is exhausted, which is recorded in self.stopReason.
+
+        Args:
+            budget (Budget | None, optional): when to stop early. Defaults to None.
+        """
+        energy = self.engine.reset(self.state) - self.constantEnergyMinimum
         E_sum, E_squared_sum = 0, 0
+        accepted = 0
         steps = len(self.tasks) ** 2
+        stepsLeft = budget.stepsLeft(self.steps) if budget is not None else None
+        if stepsLeft is not None and stepsLeft < steps:
+            steps, self.stopReason = stepsLeft, "maxSteps"
         for i in range(steps):
-            newState = self.permuteState()
-            delta = self.computeEnergy(newState) - energy
-            acceptanceProbability = min(math.exp(-delta / (energy * self.temperature)), 1)
-            if random.random() < acceptanceProbability:
-                self.state = newState
+            if budget is not None and i % CHECK_INTERVAL == 0:
+                reason = budget.stopReason(self.steps + i)
+                if reason is not None:
+                    steps, self.stopReason = i, reason
+                    break
+            move, delta = self.proposeMove()
+            self.moveStats[move].proposedSteps += 1
+            acceptanceProbability = min(math.exp(-delta / (energy * self.temperature)), 1) if energy > 0 else 0.0
+            if self.rng.random() < acceptanceProbability:
+                self.engine.accept()
                 energy += delta
+                accepted += 1
+                self.moveStats[move].acceptedSteps += 1
             E_sum += energy
             E_squared_sum += energy**2
+        self.state = tuple(self.engine.state)
+        self.steps += steps
+        if steps == 0:
+            return
         E_avg = E_sum / steps
         E_var = E_squared_sum / steps - E_avg**2
         self.energyLog.append((self.temperature, E_avg, E_var))
+        self.acceptanceLog.append(accepted / steps)
+
+    def nextTemperature(self) -> float:
+        """Adaptive cooling step based on the energy statistics of the last sweep, T' = T exp(-lambda T E_avg / sigma).
+        As the Metropolis step scales differences by the current energy, T E_avg is the effective temperature in units
+        of energy. Large fluctuations (a high specific heat) indicate a phase transition, where we cool slowly.
+
+        Returns:
+            float: the temperature for the next sweep
+        """
+        temperature, E_avg, E_var = self.energyLog[-1]
+        if E_var <= 0:
+            return temperature / 2  # frozen, nothing to learn from the fluctuations
+        factor = math.exp(-self.coolingRate * temperature * E_avg / math.sqrt(E_var))
+        return temperature * min(max(factor, 0.5), 0.95)
+
+    def hasConverged(self) -> bool:
+        """Checks whether both the average energy and the acceptance rate of the last two sweeps agree within the
+        tolerance, and the chain is frozen, i.e. the energy fluctuates by less than the tolerance within a sweep.
+        The latter rules out the plateau at high temperatures, where the chain performs an unbiased random walk.
+
+        Returns:
+            bool: whether the adaptive schedule should stop
+        """
+        if len(self.energyLog) < 2:
+            return False
+        (_, previousEnergy, _), (_, energy, variance) = self.energyLog[-2:]
+        previousAcceptance, acceptance = self.acceptanceLog[-2:]
+        return (
+            abs(energy - previousEnergy) <= self.tolerance * abs(previousEnergy)
+            and abs(acceptance - previousAcceptance) <= self.tolerance
+            and math.sqrt(max(variance, 0.0)) <= self.tolerance * abs(energy)
+        )
+
+    def temperatures(self) -> Iterator[float]:
+        """Generates the annealing schedule, either the fixed one starting at sweep self.firstSweep, or the adaptive one.
+
+        Yields:
+            float: the temperature of the next sweep
+        """
+        if self.adaptive:
+            yield INITIAL_TEMPERATURE * self.firstSweep**self.sweepExponent
+            while len(self.energyLog) < self.maxSweeps and not self.hasConverged():
+                yield self.nextTemperature()
+        else:
+            for k in range(self.firstSweep, SWEEPS + 1):
+                yield INITIAL_TEMPERATURE * k**self.sweepExponent
 
-    def schedule(self) -> Mapping[str, TimeSlot]:
-        """Schedules the tasks using an MCMC procedure.
+    def sweeps(self, seed: int, budget: Budget | None = None) -> Generator[Snapshot, None, ChainResult]:
+        """Anneals a single chain from self.initialState, yielding a snapshot after each sweep.
+
+        Args:
+            seed (int): seed of the random number generator of this chain
+            budget (Budget | None, optional): when to stop early. Defaults to running the full schedule.
+
+        Yields:
+            Snapshot: the progress after each sweep
 
         Returns:
-            Mapping[str, TimeSlot]: the resulting map of Tasks to TimeSlots
+            ChainResult: the best ordering seen at the end of a sweep, with its start times and energy
         """
-        for k in range(1, 16):
-            self.temperature = INITIAL_TEMPERATURE * k**self.sweepExponent
-            self.mcmcSweep()
-        logging.info(f"Final State of the MCMC simulation {self.state}.")
-        return dict(self.availability.spreadTasks(self.tasks[i] for i in self.state))
+        self.rng = SplitMix64(seed)
+        self.state = tuple(self.initialState)
+        self.steps, self.stopReason = 0, None
+        self.energyLog, self.acceptanceLog = [], []  # the adaptive schedule only reads the sweeps of this chain
+        respreads = self.engine.respreads
+        bestState, bestEnergy = self.state, self.engine.reset(self.state)
+        for sweep, temperature in enumerate(self.temperatures(), 1):
+            self.temperature = temperature
+            stepsBefore = self.steps
+            self.mcmcSweep(budget)
+            energy = self.engine.reset(self.state)
+            if energy <= bestEnergy:
+                bestState, bestEnergy = self.state, energy
+            if self.steps > stepsBefore:
+                self.engine.reset(bestState)
+                _, averageEnergy, _ = self.energyLog[-1]
+                yield Snapshot(
+                    sweep,
+                    temperature,
+                    averageEnergy,
+                    self.acceptanceLog[-1],
+                    self.steps,
+                    list(bestState),
+                    self.engine.starts(),
+                    bestEnergy,
+                )
+            if self.stopReason is not None:
+                break
+        logging.info(f"Final State of the MCMC simulation {self.state}, stopped after {self.steps} steps.")
+        self.engine.reset(bestState)
+        return ChainResult(
+            list(bestState),
+            self.engine.starts(),
+            bestEnergy,
+            self.stopReason or "finished",
+            self.steps,
+            self.engine.respreads - respreads,
+        )
@@ -1,10 +1,13 @@
 """The scheduler algorithm"""
 
+import itertools
 import logging
 import pathlib
 import sys
-from datetime import date, datetime, timedelta
-from typing import Mapping
+import time
+from typing import Callable, Sequence
+
+import numpy as np
 
 try:
     from melon.scheduler import libscheduler
@@ -14,18 +17,72 @@ except ImportError:
     sys.path.append(importPath)
     import libscheduler
 
-from .base import START_OF_DAY, AbstractScheduler, TimeSlot
+from .base import MOVE_TYPES, STOP_REASONS, AbstractScheduler, Budget, ChainResult, Snapshot
 
 
 class RustyMCMCScheduler(AbstractScheduler):
     """Markov Chain Monte-Carlo Task Scheduler, implemented in Rust."""
 
-    def schedule(self) -> Mapping[str, TimeSlot]:
-        """Runs the Rust implementation of the scheduler.
+    releasesGIL = True
+
+    def swapDelta(self, state: Sequence[int], indexA: int, indexB: int) -> float:
+        """Computes the energy difference caused by swapping two positions of the given state.
+
+        Args:
+            state (Sequence[int]): the ordering of task indices
+            indexA (int): first position within the state
+            indexB (int): second position within the state
+
+        Returns:
+            float: the energy difference between the swapped and the given state
+        """
+        return libscheduler.swapDelta(*self.table.columns(), list(state), indexA, indexB)
+
+    def runChain(
+        self, seed: int, budget: Budget | None = None, progress: Callable[[Snapshot], None] | None = None
+    ) -> ChainResult:
+        """Runs a single chain of the Rust implementation of the scheduler, which checks the budget every
+        CHECK_INTERVAL steps. The extension calls back into Python after every sweep to report the progress. The time
+        spent preparing the arguments, converting the results and in these callbacks is reported as marshalling time.
+
+        Args:
+            seed (int): seed of the random number generator of this chain
+            budget (Budget | None, optional): when to stop early. Defaults to running the full schedule.
+            progress (Callable[[Snapshot], None] | None, optional): called after each sweep. Defaults to None.
 
         Returns:
-            Mapping[str, TimeSlot]: the resulting schedule
+            ChainResult: the best ordering seen at the end of a sweep, with its start times and energy
         """
-        start = datetime.combine(date.today(), START_OF_DAY)  # equivalent to t = 0 for libscheduler
-        result = libscheduler.schedule([task.asTuple(start) for task in self.tasks])
-        return {t[0]: TimeSlot(start + timedelta(hours=t[1]), t[2]) for t in result}
+        started = time.perf_counter()
+        budget = budget if budget is not None else Budget()
+        sweeps = itertools.count(1)
+        marshalling = 0.0
+
+        def report(*statistics) -> None:
+            nonlocal marshalling
+            reported = time.perf_counter()
+            progress(Snapshot(next(sweeps), *statistics))
+            marshalling += time.perf_counter() - reported
+
+        columns = self.table.columns()
+        ordering, starts = np.empty(len(self.tasks), dtype=np.int64), np.empty(len(self.tasks))
+        moveCounts = np.zeros((2, len(MOVE_TYPES)), dtype=np.int64)
+        initialState = np.array(self.initialState, dtype=np.int64)
+        marshalling += time.perf_counter() - started
+        steps, reason, respreads = libscheduler.schedule(
+            *columns,
+            seed,
+            initialState,
+            self.firstSweep,
+            *self.moves.nativeArguments(),
+            *budget.nativeArguments(),
+            report if progress is not None else None,
+            ordering,
+            starts,
+            moveCounts,
+        )
+        returned = time.perf_counter()
+        state, starts = ordering.tolist(), starts.tolist()
+        self.recordMoveCounts(moveCounts)
+        marshalling += time.perf_counter() - returned
+        return ChainResult(state, starts, self.energy(state), STOP_REASONS[reason], steps, respreads, marshalling)
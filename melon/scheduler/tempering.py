@@ -0,0 +1,239 @@
+"""Parallel tempering (replica exchange) implementation of the scheduler algorithm, running replicas on all cores."""
+
+import concurrent.futures
+import dataclasses
+import logging
+import math
+import random
+from typing import Generator
+
+from .base import INITIAL_TEMPERATURE, Budget, ChainResult, EnergyEngine, MoveSet, MoveStats, Snapshot, Task
+from .purepython import MCMCScheduler
+
+
+@dataclasses.dataclass
+class ReplicaStats:
+    """Slim struct collecting the statistics of one replica over a parallel tempering run."""
+
+    temperature: float  # the rung of the temperature ladder this replica sits on
+    proposedSteps: int = 0
+    acceptedSteps: int = 0
+    attemptedExchanges: int = 0  # exchanges attempted with the next hotter replica
+    acceptedExchanges: int = 0
+
+    @property
+    def acceptanceRate(self) -> float:
+        """
+        Returns:
+            float: the fraction of accepted Metropolis steps
+        """
+        return self.acceptedSteps / self.proposedSteps if self.proposedSteps else 0.0
+
+    @property
+    def exchangeRate(self) -> float:
+        """
+        Returns:
+            float: the fraction of accepted exchanges with the next hotter replica
+        """
+        return self.acceptedExchanges / self.attemptedExchanges if self.attemptedExchanges else 0.0
+
+
+@dataclasses.dataclass
+class ReplicaResult:
+    """Slim struct holding what a replica reports back to the parent process after a round of sweeps."""
+
+    state: list[int]
+    energy: float
+    acceptedSteps: int
+    proposedSteps: int
+    bestState: list[int]
+    bestEnergy: float
+    respreads: int  # task placements recomputed by the incremental evaluations of this round
+    moveStats: dict[str, MoveStats]  # the proposed and accepted steps of each move type in this round
+
+
+def runReplica(
+    engine: EnergyEngine, moves: MoveSet, offset: float, state: list[int], temperature: float, sweeps: int, seed: int
+) -> ReplicaResult:
+    """Runs Metropolis sweeps at a fixed temperature. This is executed within a worker process.
+
+    Args:
+        engine (EnergyEngine): energy engine of the tasks
+        moves (MoveSet): the proposal types and their probabilities
+        offset (float): constant subtracted from the energy, see MCMCScheduler.constantEnergyMinimum
+        state (list[int]): the state to start from
+        temperature (float): the temperature of this replica
+        sweeps (int): the number of sweeps (of N² steps each) to run
+        seed (int): seed of the random number generator of this replica
+
+    Returns:
+        ReplicaResult: the final and the best state visited, with their energies
+    """
+    rng = random.Random(seed)
+    N = len(state)
+    respreads = engine.respreads
+    energy = engine.reset(state) - offset
+    best, bestEnergy = list(engine.state), energy
+    accepted, steps = 0, sweeps * N**2
+    moveStats = {name: MoveStats() for name in moves.weights()}
+    for i in range(steps):
+        move, delta = engine.proposeMove(moves, rng)
+        moveStats[move].proposedSteps += 1
+        acceptanceProbability = min(math.exp(-delta / (energy * temperature)), 1) if energy > 0 else 0.0
+        if rng.random() < acceptanceProbability:
+            engine.accept()
+            energy += delta
+            accepted += 1
+            moveStats[move].acceptedSteps += 1
+            if energy < bestEnergy:
+                best, bestEnergy = list(engine.state), energy
+    return ReplicaResult(
+        list(engine.state), energy, accepted, steps, best, bestEnergy, engine.respreads - respreads, moveStats
+    )
+
+
+class ParallelTemperingScheduler(MCMCScheduler):
+    """Replica exchange MCMC scheduler. Instead of cooling a single chain, R replicas are simulated at a fixed ladder of
+    temperatures in a process pool. After every few sweeps, neighbouring replicas attempt to exchange their states,
+    so that good states found by the hot, well-mixing replicas can trickle down to the cold ones.
+    """
+
+    def __init__(
+        self,
+        tasks: list[Task],
+        replicas: int = 8,
+        rounds: int = 15,
+        exchangeInterval: int = 1,
+        workers: int | None = None,
+        moves: MoveSet | None = None,
+        seed: int | None = None,
+    ) -> None:
+        """Initialises the scheduler.
+
+        Args:
+            tasks (list[Task]): the tasks to be scheduled
+            replicas (int, optional): the number of replicas R. Defaults to 8.
+            rounds (int, optional): the number of exchange rounds. Defaults to 15.
+            exchangeInterval (int, optional): the number of sweeps between two exchange rounds. Defaults to 1.
+            workers (int | None, optional): the number of worker processes. Defaults to one per CPU core.
+            moves (MoveSet | None, optional): the proposal types of the replicas and their probabilities. Defaults to
+                swaps only.
+            seed (int | None, optional): seed of the first chain. Defaults to a random seed.
+        """
+        super().__init__(tasks, moves=moves, seed=seed)
+        self.rounds = rounds
+        self.exchangeInterval = exchangeInterval
+        self.workers = workers
+        self.ladder = self.temperatureLadder(replicas)  # from coldest to hottest
+        self.replicaStats = [ReplicaStats(temperature) for temperature in self.ladder]
+        self.bestEnergy = math.inf
+
+    def temperatureLadder(self, replicas: int) -> list[float]:
+        """A geometric ladder spanning the temperatures visited by the annealing schedule of the MCMCScheduler.
+
+        Args:
+            replicas (int): the number of rungs
+
+        Returns:
+            list[float]: the temperatures, from coldest to hottest
+        """
+        coldest = INITIAL_TEMPERATURE * 15**self.sweepExponent
+        if replicas == 1:
+            return [coldest]
+        ratio = (INITIAL_TEMPERATURE / coldest) ** (1 / (replicas - 1))
+        return [coldest * ratio**k for k in range(replicas)]
+
+    def exchangeAcceptance(self, lower: int, energies: list[float]) -> float:
+        """The probability to exchange the states of replica `lower` and its hotter neighbour. As our Metropolis step
+        measures energy differences relative to the current energy, the inverse temperatures use the mean energy of
+        both replicas as a common energy scale.
+
+        Args:
+            lower (int): index of the colder replica
+            energies (list[float]): current energy of each replica
+
+        Returns:
+            float: the acceptance probability
+        """
+        scale = (energies[lower] + energies[lower + 1]) / 2
+        exponent = (energies[lower] - energies[lower + 1]) * (1 / self.ladder[lower] - 1 / self.ladder[lower + 1])
+        return math.exp(min(exponent / scale, 0.0)) if scale > 0 else 1.0
+
+    def sweeps(self, seed: int, budget: Budget | None = None) -> Generator[Snapshot, None, ChainResult]:
+        """Runs all replicas in a process pool and returns the best state found by any of them. The budget is checked
+        between exchange rounds, and each round counts the sweeps of all replicas towards the step limit. After each
+        round, a snapshot of the coldest replica is yielded, together with the best state found so far.
+
+        Args:
+            seed (int): seed from which the seeds of the replicas and the exchange decisions are drawn
+            budget (Budget | None, optional): when to stop early. Defaults to running all rounds.
+
+        Yields:
+            Snapshot: the progress after each exchange round
+
+        Returns:
+            ChainResult: the best ordering with its start times and energy
+        """
+        rng = random.Random(seed)
+        self.state = tuple(self.initialState)
+        replicas = len(self.ladder)
+        states = [list(self.state) for _ in range(replicas)]
+        best, self.bestEnergy = list(self.state), self.engine.reset(self.state) - self.constantEnergyMinimum
+        self.steps, self.stopReason = 0, None
+        respreads = 0
+        if len(self.tasks) < 2:
+            return ChainResult(best, self.engine.starts(), self.engine.energy)
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as executor:
+            for iteration in range(self.rounds):
+                self.stopReason = budget.stopReason(self.steps) if budget is not None else None
+                if self.stopReason is not None:
+                    break
+                futures = [
+                    executor.submit(
+                        runReplica,
+                        self.engine,
+                        self.moves,
+                        self.constantEnergyMinimum,
+                        states[k],
+                        self.ladder[k],
+                        self.exchangeInterval,
+                        rng.getrandbits(64),
+                    )
+                    for k in range(replicas)
+                ]
+                results = [future.result() for future in futures]
+                self.steps += sum(result.proposedSteps for result in results)
+                respreads += sum(result.respreads for result in results)
+                for k, result in enumerate(results):
+                    states[k] = result.state
+                    self.replicaStats[k].proposedSteps += result.proposedSteps
+                    self.replicaStats[k].acceptedSteps += result.acceptedSteps
+                    for name, stats in result.moveStats.items():
+                        self.moveStats[name].proposedSteps += stats.proposedSteps
+                        self.moveStats[name].acceptedSteps += stats.acceptedSteps
+                    if result.bestEnergy < self.bestEnergy:
+                        best, self.bestEnergy = result.bestState, result.bestEnergy
+                energies = [result.energy for result in results]
+                for lower in range(iteration % 2, replicas - 1, 2):  # alternate between even and odd pairs
+                    self.replicaStats[lower].attemptedExchanges += 1
+                    if rng.random() < self.exchangeAcceptance(lower, energies):
+                        self.replicaStats[lower].acceptedExchanges += 1
+                        states[lower], states[lower + 1] = states[lower + 1], states[lower]
+                        energies[lower], energies[lower + 1] = energies[lower + 1], energies[lower]
+                self.engine.reset(best)
+                yield Snapshot(
+                    iteration + 1,
+                    self.ladder[0],
+                    results[0].energy,
+                    results[0].acceptedSteps / max(results[0].proposedSteps, 1),
+                    self.steps,
+                    list(best),
+                    self.engine.starts(),
+                    self.bestEnergy + self.constantEnergyMinimum,
+                )
+        self.state = tuple(best)
+        logging.info(f"Best state of the parallel tempering simulation {self.state} with energy {self.bestEnergy}.")
+        energy = self.engine.reset(self.state)
+        return ChainResult(
+            list(self.state), self.engine.starts(), energy, self.stopReason or "finished", self.steps, respreads
+        )
@@ -0,0 +1,302 @@
+"""NumPy implementation of the scheduler algorithm, evaluating a whole batch of candidate orderings at once."""
+
+import logging
+import math
+from typing import Generator, Sequence
+
+import numpy as np
+
+from .base import (
+    INITIAL_TEMPERATURE,
+    MOVE_TYPES,
+    ON_TIME_PENALTY,
+    SWEEP_EXPONENT,
+    SWEEPS,
+    AbstractScheduler,
+    Budget,
+    ChainResult,
+    MoveSet,
+    SlotTable,
+    Snapshot,
+    Task,
+    TaskTable,
+)
+
+
+def batchSpread(durations: np.ndarray, slots: SlotTable) -> tuple[np.ndarray, np.ndarray]:
+    """Spreads a batch of orderings across the free working slots. The rollover to the next slot depends on where the
+    previous task ended, so we walk along the positions, but handle all B orderings of the batch at once.
+
+    Args:
+        durations (np.ndarray): (B, N) array, the duration of the task at each position of each ordering
+        slots (SlotTable): the free working slots
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (B, N) arrays of the start and end of the task at each position, in hours
+    """
+    B, N = durations.shape
+    ends = np.empty((B, N))
+    slotEnd, stamp = np.full(B, -np.inf), np.zeros(B)
+    for position in range(N):
+        duration = durations[:, position]
+        overflow = stamp + duration > slotEnd
+        if np.any(overflow):
+            stamp[overflow], slotEnd[overflow] = slots.nextSlots(stamp[overflow], duration[overflow])
+        stamp = stamp + duration
+        ends[:, position] = stamp
+    return ends - durations, ends
+
+
+def batchFeasible(edges: tuple[np.ndarray, np.ndarray], orderings: np.ndarray) -> np.ndarray:
+    """Checks a batch of orderings against the precedence of the tasks.
+
+    Args:
+        edges (tuple[np.ndarray, np.ndarray]): the pairs (task, dependency) of the transitive closure of the precedence,
+            as returned by np.nonzero(table.precedence())
+        orderings (np.ndarray): (B, N) integer array, each row being an ordering of task indices
+
+    Returns:
+        np.ndarray: (B,) boolean array, whether every task of each ordering comes after the tasks it depends on
+    """
+    B, N = orderings.shape
+    if len(edges[0]) == 0:
+        return np.ones(B, dtype=bool)
+    positions = np.empty_like(orderings)
+    positions[np.arange(B)[:, np.newaxis], orderings] = np.arange(N)
+    tasks, dependencies = edges
+    return np.all(positions[:, dependencies] < positions[:, tasks], axis=1)
+
+
+def batchEnergy(table: TaskTable, orderings: np.ndarray) -> np.ndarray:
+    """Evaluates the energy of B candidate orderings in a single call.
+
+    Args:
+        table (TaskTable): the tasks
+        orderings (np.ndarray): (B, N) integer array, each row being an ordering of task indices
+
+    Returns:
+        np.ndarray: (B,) array, the energy / penalty of each ordering, equal to EnergyEngine.reset() of each row
+    """
+    durations = table.duration[orderings]
+    if np.any(durations > table.slots.longest):
+        raise RuntimeError(
+            "You are trying to schedule a task longer than any working slot."
+            "Split it into smaller chunks! Automatic splitting is not supported."
+        )
+    _, ends = batchSpread(durations, table.slots)
+    priorityPenalty = table.priority[orderings] @ np.arange(orderings.shape[1])
+    locations = table.location[orderings]
+    commutePenalty = table.travel[locations[:, :-1], locations[:, 1:]].sum(axis=1)
+    dues = table.due[orderings][:, 1:]
+    lateTasks = (dues != 0) & (dues < ends[:, 1:])
+    return ends[:, -1] + priorityPenalty + commutePenalty + ON_TIME_PENALTY * lateTasks.sum(axis=1)
+
+
+class NumpyMCMCScheduler(AbstractScheduler):
+    """Markov Chain Monte-Carlo Task Scheduler, implemented with NumPy only. Every step proposes a batch of B moves of
+    the current state and evaluates them with a single call to batchEnergy(). In "best-of-B" mode, the lowest-energy
+    proposal is put to the Metropolis test. Otherwise, the proposals are tested in order and the first accepted one is
+    taken, which follows the same chain as B consecutive single-move steps that stop at the first acceptance.
+    """
+
+    def __init__(
+        self,
+        tasks: list[Task],
+        batchSize: int = 32,
+        bestOfBatch: bool = True,
+        moves: MoveSet | None = None,
+        seed: int | None = None,
+    ) -> None:
+        """Initialises the scheduler.
+
+        Args:
+            tasks (list[Task]): the tasks to be scheduled
+            batchSize (int, optional): the number of proposals B evaluated per step. Defaults to 32.
+            bestOfBatch (bool, optional): whether to only test the best proposal of each batch. Defaults to True.
+            moves (MoveSet | None, optional): the proposal types and their probabilities. Defaults to swaps only.
+            seed (int | None, optional): seed of the first chain. Defaults to a random seed.
+        """
+        super().__init__(tasks, seed, moves)
+        self.batchSize = batchSize
+        self.bestOfBatch = bestOfBatch
+        self.sweepExponent = SWEEP_EXPONENT
+        self.constantEnergyMinimum = float(self.table.duration.sum()) + sum(range(len(tasks)))
+        self.energyLog = []
+        self.acceptanceLog = []  # proportion of batches whose proposal was accepted, per sweep
+        self.respreads = 0  # task placements computed by batchEnergy() during the current chain
+
+    def swapDelta(self, state: Sequence[int], indexA: int, indexB: int) -> float:
+        """Computes the energy difference caused by swapping two positions of the given state.
+
+        Args:
+            state (Sequence[int]): the ordering of task indices
+            indexA (int): first position within the state
+            indexB (int): second position within the state
+
+        Returns:
+            float: the energy difference between the swapped and the given state, inf if it is infeasible
+        """
+        orderings = np.array([state, state], dtype=np.int64)
+        orderings[0, [indexA, indexB]] = orderings[0, [indexB, indexA]]
+        if not batchFeasible(np.nonzero(self.table.precedence()), orderings[:1])[0]:
+            return math.inf
+        energies = batchEnergy(self.table, orderings)
+        return float(energies[0] - energies[1])
+
+    def proposeMoves(
+        self, state: np.ndarray, rng: np.random.Generator, size: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Proposes a batch of random moves of the given state, drawing the type of each according to self.moves. Every
+        move replaces the window of positions low, ..., high with a permutation of its tasks: a swap exchanges both
+        ends, a reversal mirrors the window, and insertions and block moves (insertions of a single task) rotate it.
+
+        Args:
+            state (np.ndarray): the current ordering
+            rng (np.random.Generator): random number generator of the chain
+            size (int | None, optional): the number of proposals. Defaults to the batch size B.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (size, N) array of proposed orderings and (size,) array of the move type of
+                each, as an index into MOVE_TYPES
+        """
+        N = len(state)
+        size = self.batchSize if size is None else size
+        weights, maxBlockLength = self.moves.nativeArguments()
+        if np.count_nonzero(weights) == 1:
+            moves = np.full(size, int(np.flatnonzero(weights)[0]))
+        else:
+            moves = rng.choice(len(MOVE_TYPES), size=size, p=weights / weights.sum())
+        indexA, indexB = rng.integers(N, size=size), rng.integers(N, size=size)
+        low, high = np.minimum(indexA, indexB), np.maximum(indexA, indexB)
+        shift = np.where(indexA < indexB, 1, indexA - indexB)  # rotation of the window by an insertion
+        if weights[MOVE_TYPES.index("blockMove")] > 0:
+            length = rng.integers(1, max(min(maxBlockLength, N - 1), 1) + 1, size=size)
+            start, target = rng.integers(N - length + 1), rng.integers(N - length + 1)
+            block = moves == MOVE_TYPES.index("blockMove")
+            low = np.where(block, np.minimum(start, target), low)
+            high = np.where(block, np.maximum(start, target) + length - 1, high)
+            shift = np.where(block, np.where(start < target, length, start - target), shift)
+        positions = np.arange(N)
+        offset = positions - low[:, np.newaxis]
+        width = (high - low + 1)[:, np.newaxis]
+        window = (offset >= 0) & (offset < width)
+        swapped = np.where(
+            offset == 0, high[:, np.newaxis], np.where(offset == width - 1, low[:, np.newaxis], positions)
+        )
+        rotated = low[:, np.newaxis] + (offset + shift[:, np.newaxis]) % width
+        mirrored = (low + high)[:, np.newaxis] - positions
+        sources = [swapped, rotated, rotated, mirrored]  # the position each task is taken from, in MOVE_TYPES order
+        source = np.select([moves[:, np.newaxis] == move for move in range(len(MOVE_TYPES))], sources)
+        return state[np.where(window, source, positions)], moves
+
+    def mcmcSweep(
+        self, state: np.ndarray, temperature: float, rng: np.random.Generator, budget: Budget | None = None
+    ) -> np.ndarray:
+        """Performs a full MCMC sweep of N² proposals, in batches of B. The budget is checked before every batch, which
+        counts as B steps, and the sweep is cut short when it is exhausted, which is recorded in self.stopReason. The
+        last batch before reaching the step limit of the budget is cut down to the steps that are left.
+        Proposals that put a task before one it depends on are rejected before evaluating the energy of the batch.
+
+        Args:
+            state (np.ndarray): the initial ordering
+            temperature (float): temperature for Simulated Annealing
+            rng (np.random.Generator): random number generator of the chain
+            budget (Budget | None, optional): when to stop early. Defaults to None.
+
+        Returns:
+            np.ndarray: the new ordering
+        """
+        energy = float(batchEnergy(self.table, state[np.newaxis, :])[0]) - self.constantEnergyMinimum
+        edges = np.nonzero(self.table.precedence())
+        steps = max(len(state) ** 2 // self.batchSize, 1)
+        E_sum, E_squared_sum = 0, 0
+        acceptedBatches = 0
+        for i in range(steps):
+            batchSize = self.batchSize
+            if budget is not None:
+                self.stopReason = budget.stopReason(self.steps)
+                if self.stopReason is not None:
+                    steps = i
+                    break
+                stepsLeft = budget.stepsLeft(self.steps)
+                batchSize = min(batchSize, stepsLeft) if stepsLeft is not None else batchSize
+            self.steps += batchSize
+            candidates, moves = self.proposeMoves(state, rng, batchSize)
+            counts = np.zeros((2, len(MOVE_TYPES)), dtype=np.int64)
+            np.add.at(counts[0], moves, 1)
+            feasible = batchFeasible(edges, candidates)
+            deltas = np.full(batchSize, np.inf)
+            deltas[feasible] = batchEnergy(self.table, candidates[feasible]) - self.constantEnergyMinimum - energy
+            self.respreads += int(feasible.sum()) * len(state)
+            if self.bestOfBatch:
+                best = int(np.argmin(deltas))
+                acceptanceProbability = min(math.exp(-deltas[best] / (energy * temperature)), 1) if energy > 0 else 0.0
+                if rng.random() < acceptanceProbability:
+                    state, energy = candidates[best], energy + deltas[best]
+                    acceptedBatches += 1
+                    counts[1, moves[best]] += 1
+            else:
+                if energy > 0:
+                    acceptanceProbabilities = np.exp(np.minimum(-deltas / (energy * temperature), 0.0))
+                else:  # the state is optimal already
+                    acceptanceProbabilities = np.zeros(batchSize)
+                accepted = np.flatnonzero(rng.random(batchSize) < acceptanceProbabilities)
+                if len(accepted):
+                    state, energy = candidates[accepted[0]], energy + deltas[accepted[0]]
+                    acceptedBatches += 1
+                    counts[1, moves[accepted[0]]] += 1
+            self.recordMoveCounts(counts)
+            E_sum += energy
+            E_squared_sum += energy**2
+        if steps == 0:
+            return state
+        E_avg = E_sum / steps
+        self.energyLog.append((temperature, E_avg, E_squared_sum / steps - E_avg**2))
+        self.acceptanceLog.append(acceptedBatches / steps)
+        return state
+
+    def sweeps(self, seed: int, budget: Budget | None = None) -> Generator[Snapshot, None, ChainResult]:
+        """Anneals a single chain from self.initialState, yielding a snapshot after each sweep.
+
+        Args:
+            seed (int): seed of the random number generator of this chain
+            budget (Budget | None, optional): when to stop early. Defaults to running the full schedule.
+
+        Yields:
+            Snapshot: the progress after each sweep
+
+        Returns:
+            ChainResult: the best ordering seen at the end of a sweep, with its start times and energy
+        """
+        rng = np.random.default_rng(seed)
+        state = np.array(self.initialState, dtype=np.int64)
+        self.steps, self.stopReason, self.respreads = 0, None, 0
+        best, bestEnergy = state, float(batchEnergy(self.table, state[np.newaxis, :])[0])
+        if len(state) >= 2:
+            for sweep, k in enumerate(range(self.firstSweep, SWEEPS + 1), 1):
+                temperature = INITIAL_TEMPERATURE * k**self.sweepExponent
+                stepsBefore = self.steps
+                state = self.mcmcSweep(state, temperature, rng, budget)
+                energy = float(batchEnergy(self.table, state[np.newaxis, :])[0])
+                if energy <= bestEnergy:
+                    best, bestEnergy = state, energy
+                if self.steps > stepsBefore:
+                    starts, _ = batchSpread(self.table.duration[best][np.newaxis, :], self.table.slots)
+                    _, averageEnergy, _ = self.energyLog[-1]
+                    yield Snapshot(
+                        sweep,
+                        temperature,
+                        averageEnergy,
+                        self.acceptanceLog[-1],
+                        self.steps,
+                        best.tolist(),
+                        starts[0].tolist(),
+                        bestEnergy,
+                    )
+                if self.stopReason is not None:
+                    break
+        logging.info(f"Final State of the NumPy MCMC simulation {state}, stopped after {self.steps} steps.")
+        starts, _ = batchSpread(self.table.duration[best][np.newaxis, :], self.table.slots)
+        return ChainResult(
+            best.tolist(), starts[0].tolist(), bestEnergy, self.stopReason or "finished", self.steps, self.respreads
+        )
@@ -0,0 +1,193 @@
+"""This module contains the SearchIndex, the full-text index behind Melon.findTask()."""
+
+import bisect
+import json
+import os
+import re
+
+FIELD_WEIGHTS = {"summary": 3, "categories": 2, "location": 2, "description": 1}  # the searched properties
+EXACT, PREFIX, SUBSTRING = 3, 2, 1  # how well a query term matches a word, multiplied with the field weight
+
+
+def tokenise(text: str) -> list[str]:
+    """
+    Args:
+        text (str): any text
+
+    Returns:
+        list[str]: its words, in lower case
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    Args:
+        text (str): a lower-case text
+
+    Returns:
+        set[str]: all substrings of three characters
+    """
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """Inverted index from words to todos, together with a trigram index for matching arbitrary substrings, over the
+    fields in FIELD_WEIGHTS. A query matches the todos that contain all of its terms, where a term matches a whole word,
+    the start of a word, or (for terms of at least three characters) any substring of a field. Results are ranked by
+    how well and in which fields the terms matched. The index is updated incrementally, per todo.
+    """
+
+    def __init__(self) -> None:
+        """Initialises an empty index."""
+        self.documents: dict[str, dict[str, str]] = {}  # UID to the lower-case text of each field
+        self.postings: dict[str, dict[str, int]] = {}  # word to the UIDs containing it, with the largest field weight
+        self.trigrams: dict[str, set[str]] = {}  # trigram to the UIDs containing it
+        self.vocabulary: list[str] = []  # sorted words, for prefix lookups
+
+    def __len__(self) -> int:
+        """
+        Returns:
+            int: the number of indexed todos
+        """
+        return len(self.documents)
+
+    def add(self, uid: str, fields: dict[str, str]) -> None:
+        """Indexes the fields of a todo, replacing what was indexed for it before. Unchanged todos are skipped, which
+        makes re-adding everything after loading a persisted index cheap.
+
+        Args:
+            uid (str): the Unique Identifier of the todo
+            fields (dict[str, str]): the text of each field, see Todo.searchFields
+        """
+        document = {field: text.lower() for field, text in fields.items() if field in FIELD_WEIGHTS and text}
+        if self.documents.get(uid) == document:
+            return
+        self.remove(uid)
+        self.documents[uid] = document
+        for field, text in document.items():
+            for word in tokenise(text):
+                posting = self.postings.get(word)
+                if posting is None:
+                    posting = self.postings[word] = {}
+                    bisect.insort(self.vocabulary, word)
+                posting[uid] = max(posting.get(uid, 0), FIELD_WEIGHTS[field])
+            for trigram in trigrams(text):
+                self.trigrams.setdefault(trigram, set()).add(uid)
+
+    def remove(self, uid: str) -> None:
+        """Removes a todo from the index.
+
+        Args:
+            uid (str): the Unique Identifier of the todo
+        """
+        document = self.documents.pop(uid, None)
+        if document is None:
+            return
+        for text in document.values():
+            for word in tokenise(text):
+                posting = self.postings.get(word)
+                if posting is not None and posting.pop(uid, None) is not None and not posting:
+                    del self.postings[word]
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, word)]
+            for trigram in trigrams(text):
+                uids = self.trigrams.get(trigram)
+                if uids is not None:
+                    uids.discard(uid)
+                    if not uids:
+                        del self.trigrams[trigram]
+
+    def retain(self, uids: set[str] | dict[str, object]) -> None:
+        """Removes all todos except the given ones, e.g. those deleted since a persisted index was stored.
+
+        Args:
+            uids (set[str] | dict[str, object]): the UIDs to keep
+        """
+        for uid in [uid for uid in self.documents if uid not in uids]:
+            self.remove(uid)
+
+    def matchTerm(self, term: str) -> dict[str, int]:
+        """
+        Args:
+            term (str): a lower-case query term
+
+        Returns:
+            dict[str, int]: the score of each todo matching the term
+        """
+        scores: dict[str, int] = {}
+        for uid, weight in self.postings.get(term, {}).items():
+            scores[uid] = EXACT * weight
+        low = bisect.bisect_left(self.vocabulary, term)
+        high = bisect.bisect_left(self.vocabulary, term + "\U0010ffff")
+        for word in self.vocabulary[low:high]:
+            for uid, weight in self.postings[word].items():
+                scores[uid] = max(scores.get(uid, 0), PREFIX * weight)
+        if len(term) >= 3:
+            postings = sorted((self.trigrams.get(trigram, set()) for trigram in trigrams(term)), key=len)
+            for uid in set.intersection(*postings) if postings else ():
+                if uid in scores:
+                    continue
+                weights = [FIELD_WEIGHTS[field] for field, text in self.documents[uid].items() if term in text]
+                if weights:
+                    scores[uid] = SUBSTRING * max(weights)
+        return scores
+
+    def search(self, query: str, limit: int | None = None) -> list[tuple[str, int]]:
+        """Finds the todos matching all terms of the query, best matches first.
+
+        Args:
+            query (str): the search query, e.g. "groc shop" for "Grocery shopping"
+            limit (int | None, optional): the largest number of results. Defaults to no limit.
+
+        Returns:
+            list[tuple[str, int]]: the UID and score of each matching todo, by decreasing score, then by UID
+        """
+        terms = tokenise(query)
+        if not terms:
+            return [(uid, 0) for uid in self.documents][:limit]
+        scores: dict[str, int] | None = None
+        for term in sorted(set(terms), key=len, reverse=True):  # long terms match fewer todos, start with them
+            termScores = self.matchTerm(term)
+            if scores is None:
+                scores = termScores
+            else:
+                scores = {uid: score + termScores[uid] for uid, score in scores.items() if uid in termScores}
+            if not scores:
+                return []
+        assert scores is not None
+        return sorted(scores.items(), key=lambda result: (-result[1], result[0]))[:limit]
+
+    def save(self, path: str | os.PathLike) -> None:
+        """Stores the index as JSON.
+
+        Args:
+            path (str | os.PathLike): the file to write
+        """
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "documents": self.documents,
+                    "postings": self.postings,
+                    "trigrams": {trigram: sorted(uids) for trigram, uids in self.trigrams.items()},
+                },
+                f,
+            )
+
+    @staticmethod
+    def load(path: str | os.PathLike) -> "SearchIndex":
+        """Loads an index stored by save().
+
+        Args:
+            path (str | os.PathLike): the file to read
+
+        Returns:
+            SearchIndex: the index
+        """
+        with open(path) as f:
+            data = json.load(f)
+        index = SearchIndex()
+        index.documents = data["documents"]
+        index.postings = data["postings"]
+        index.trigrams = {trigram: set(uids) for trigram, uids in data["trigrams"].items()}
+        index.vocabulary = sorted(index.postings)
+        return index
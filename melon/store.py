@@ -0,0 +1,211 @@
+"""This module contains the LocalStore, Melon's SQLite copy of the calendars on the server."""
+
+import contextlib
+import dataclasses
+import os
+import sqlite3
+from typing import Iterable, Iterator, Mapping
+
+from caldav.elements import dav
+
+from .calendar import Calendar
+from .index import TaskIndex
+from .todo import Todo
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendars (
+    name TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    token TEXT
+);
+CREATE TABLE IF NOT EXISTS objects (
+    url TEXT PRIMARY KEY,
+    calendar TEXT NOT NULL,
+    uid TEXT,
+    etag TEXT,
+    ics TEXT NOT NULL,
+    component TEXT NOT NULL,
+    summary TEXT,
+    due TEXT,
+    priority INTEGER,
+    status TEXT,
+    incomplete INTEGER
+);
+CREATE INDEX IF NOT EXISTS objectsByCalendar ON objects (calendar);
+CREATE INDEX IF NOT EXISTS objectsByUid ON objects (uid);
+CREATE INDEX IF NOT EXISTS objectsByDue ON objects (due);
+"""
+
+
+@dataclasses.dataclass
+class StoredObject:
+    """Slim struct holding a row of the objects table: the raw iCalendar data of an object and columns extracted from
+    it, which can be queried without parsing the iCalendar data.
+    """
+
+    url: str
+    calendar: str
+    uid: str | None
+    etag: str | None
+    ics: str
+    component: str  # "VTODO", or e.g. "VEVENT" for events
+    summary: str | None = None  # the remaining columns are only extracted from todos
+    due: str | None = None  # ISO format, naive local time
+    priority: int | None = None
+    status: str | None = None
+    incomplete: bool | None = None
+
+    @staticmethod
+    def fromObject(calendarName: str, todo: Todo) -> "StoredObject":
+        """
+        Args:
+            calendarName (str): the name of the calendar of the object
+            todo (Todo): the object, a todo or any other calendar object
+
+        Returns:
+            StoredObject: the row of the object
+        """
+        etag = todo.props.get(dav.GetEtag.tag) if todo.props else None
+        data = todo.data
+        stored = StoredObject(str(todo.url), calendarName, todo.uid, etag, data, "VEVENT")
+        if todo.isTodo():  # the columns are scanned from the raw data of todos that were not edited
+            due = TaskIndex.dueKey(todo)
+            stored.component = "VTODO"
+            stored.summary = todo.searchFields.get("summary")
+            stored.due = due.isoformat() if due is not None else None
+            stored.priority = todo.priority
+            stored.status = todo.status
+            stored.incomplete = todo.isIncomplete()
+        elif "BEGIN:VJOURNAL" in data:
+            stored.component = "VJOURNAL"
+        return stored
+
+    def toObject(self, calendar: Calendar) -> Todo:
+        """
+        Args:
+            calendar (Calendar): the calendar the object belongs to
+
+        Returns:
+            Todo: the object, whose iCalendar data is only parsed when it is edited or uncommon properties are read
+        """
+        props = {dav.GetEtag.tag: self.etag} if self.etag is not None else {}
+        return Todo.fromRawData(calendar.client, self.url, self.ics, calendar, props, self.calendar)
+
+
+class LocalStore:
+    """Transactional SQLite store of all calendars, holding one row per calendar object and the sync token of each
+    calendar. Changes are staged as they happen, and only the staged objects are written by commit(), in a single
+    transaction, so that storing after a sync that touched three todos costs three row writes.
+    """
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        """Initialises the store. The database file and its tables are created when it is first written to.
+
+        Args:
+            path (str | os.PathLike): the database file
+        """
+        self.path = path
+        self.staged: dict[str, tuple[str, Todo]] = {}  # URL to calendar name and object, written by commit()
+        self.deleted: set[str] = set()  # URLs of objects deleted since the last commit
+        self.replaced: set[str] = set()  # calendars whose rows are all replaced, as they were fetched in full
+        self.calendars: set[str] = set()  # calendars whose URL or sync token changed
+
+    @contextlib.contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """Opens a connection to the database, creating its tables if needed, committing on success and rolling back
+        on failure.
+
+        Yields:
+            sqlite3.Connection: the connection
+        """
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.executescript(SCHEMA)
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def exists(self) -> bool:
+        """
+        Returns:
+            bool: whether any calendar was stored
+        """
+        return os.path.exists(self.path) and len(self.storedCalendars()) > 0
+
+    def stageCalendar(self, calendar: Calendar) -> None:
+        """Stages all objects of a calendar that was fetched or loaded in full, replacing its stored objects.
+
+        Args:
+            calendar (Calendar): the calendar
+        """
+        assert calendar.name is not None and calendar.syncable is not None
+        self.replaced.add(calendar.name)
+        self.calendars.add(calendar.name)
+        for url in [url for url, (name, _) in self.staged.items() if name == calendar.name]:
+            del self.staged[url]
+        self.stageSync(calendar, calendar.syncable.objects, [])
+
+    def stageSync(self, calendar: Calendar, updated: Iterable[Todo], deleted: Iterable[str]) -> None:
+        """Stages the changes of a sync, see Calendar.sync().
+
+        Args:
+            calendar (Calendar): the synced calendar, whose new sync token is staged too
+            updated (Iterable[Todo]): the objects that were updated or created
+            deleted (Iterable[str]): the URLs of the objects that were deleted
+        """
+        assert calendar.name is not None
+        self.calendars.add(calendar.name)
+        for url in deleted:
+            self.staged.pop(url, None)
+            self.deleted.add(url)
+        for todo in updated:
+            self.staged[str(todo.url)] = (calendar.name, todo)
+            self.deleted.discard(str(todo.url))
+
+    def commit(self, calendars: Mapping[str, Calendar]) -> int:
+        """Writes the staged changes in a single transaction.
+
+        Args:
+            calendars (Mapping[str, Calendar]): all calendars, of which those with staged changes are written
+
+        Returns:
+            int: the number of object rows written or deleted
+        """
+        rows = [dataclasses.astuple(StoredObject.fromObject(name, todo)) for name, todo in self.staged.values()]
+        tokens = [
+            (name, str(calendars[name].url), calendars[name].syncable.sync_token)  # type: ignore
+            for name in self.calendars
+            if name in calendars and calendars[name].syncable is not None
+        ]
+        with self.connect() as connection:
+            connection.executemany("DELETE FROM objects WHERE calendar = ?", [(name,) for name in self.replaced])
+            connection.executemany("DELETE FROM objects WHERE url = ?", [(url,) for url in self.deleted])
+            connection.executemany(f"INSERT OR REPLACE INTO objects VALUES ({', '.join('?' * 11)})", rows)
+            connection.executemany("INSERT OR REPLACE INTO calendars VALUES (?, ?, ?)", tokens)
+        written = len(rows) + len(self.deleted)
+        self.staged, self.deleted, self.replaced, self.calendars = {}, set(), set(), set()
+        return written
+
+    def storedCalendars(self) -> list[tuple[str, str, str | None]]:
+        """
+        Returns:
+            list[tuple[str, str, str | None]]: the name, URL and sync token of each stored calendar, by name
+        """
+        with self.connect() as connection:
+            return connection.execute("SELECT name, url, token FROM calendars ORDER BY name").fetchall()
+
+    def query(self, where: str = "1", parameters: tuple = ()) -> list[StoredObject]:
+        """Reads stored objects, selected by their columns, without parsing their iCalendar data.
+
+        Args:
+            where (str, optional): an SQL condition on the columns of StoredObject, e.g. "calendar = ? AND incomplete".
+                Defaults to all objects.
+            parameters (tuple, optional): the parameters of the condition. Defaults to ().
+
+        Returns:
+            list[StoredObject]: the matching objects, in the order they were written
+        """
+        with self.connect() as connection:
+            rows = connection.execute(f"SELECT * FROM objects WHERE {where} ORDER BY rowid", parameters).fetchall()
+        return [StoredObject(*row[:-1], bool(row[-1]) if row[-1] is not None else None) for row in rows]
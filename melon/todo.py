@@ -10,24 +10,150 @@ import caldav.lib.url
 import icalendar.cal
 import icalendar.prop
 import vobject
+import zoneinfo
+from caldav.lib.python_utilities import to_normal_str
 
-from melon.scheduler.base import Task
+from melon.scheduler.base import Locations, Task
 
 NEW_TASK_TEXT = "An exciting new task!"
 MIDNIGHT = datetime.time(0, 0)
+CONTENT_LINE = re.compile(r'([\w-]+)((?:;[\w-]+=(?:"[^"]*"|[^";:,]*)(?:,(?:"[^"]*"|[^";:,]*))*)*):(.*)', re.DOTALL)
+TEXT_ESCAPE = re.compile(r"\\([\\;,nN])")
+
+
+def scanTodo(data: str) -> dict[str, list[tuple[str, str]]] | None:
+    """Scans the properties of the first VTODO in iCalendar data, without parsing their values or building any
+    components. Properties of nested components such as VALARM are skipped.
+
+    Args:
+        data (str): iCalendar data
+
+    Returns:
+        dict[str, list[tuple[str, str]]] | None: the raw parameters (e.g. ";VALUE=DATE") and raw value of each
+            property, by lower-case property name, None if there is no VTODO
+    """
+    begin = re.search(r"^BEGIN:VTODO\r?$", data, re.MULTILINE)
+    if begin is None:
+        return None
+    end = re.compile(r"^END:VTODO\r?$", re.MULTILINE).search(data, begin.end())
+    block = re.sub(r"\r?\n[ \t]", "", data[begin.end() : end.start() if end else len(data)])  # unfolds long lines
+    properties: dict[str, list[tuple[str, str]]] = {}
+    nested = 0
+    for line in block.splitlines():
+        if line.startswith("BEGIN:"):
+            nested += 1
+        elif line.startswith("END:"):
+            nested -= 1
+        elif not nested:
+            match = CONTENT_LINE.match(line)
+            if match:
+                properties.setdefault(match.group(1).lower(), []).append((match.group(2), match.group(3)))
+    return properties
+
+
+def unescapeText(value: str) -> str:
+    """
+    Args:
+        value (str): the raw value of a TEXT property, as in RFC 5545
+
+    Returns:
+        str: the text, with escaped backslashes, semicolons, commas and newlines replaced
+    """
+    return TEXT_ESCAPE.sub(lambda match: "\n" if match.group(1) in "nN" else match.group(1), value)
+
+
+def parseDateOrDateTime(parameters: str, value: str) -> datetime.date | datetime.datetime | None:
+    """
+    Args:
+        parameters (str): the raw parameters of a DATE or DATE-TIME property
+        value (str): its raw value, e.g. "20240304T120000Z"
+
+    Returns:
+        datetime.date | datetime.datetime | None: the value, None if only a full parse can interpret it (such as a
+            time zone that is not in the tz database, defined by a VTIMEZONE of the calendar)
+    """
+    try:
+        date = datetime.date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+        if "VALUE=DATE" in parameters.upper() and len(value) == 8:
+            return date
+        if len(value) not in (15, 16) or value[8] != "T":
+            return None
+        time = datetime.time(int(value[9:11]), int(value[11:13]), int(value[13:15]))
+    except ValueError:
+        return None
+    if value.endswith("Z"):
+        return datetime.datetime.combine(date, time, datetime.timezone.utc)
+    if len(value) == 16:
+        return None
+    tzid = re.search(r';TZID="?([^";:]+)', parameters)
+    if tzid is None:
+        return datetime.datetime.combine(date, time)
+    try:
+        return datetime.datetime.combine(date, time, zoneinfo.ZoneInfo(tzid.group(1)))
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return None
 
 
 class Todo(caldav.Todo):
-    """A class representing todos (= tasks), subclassing the caldav.Todo object which in turn stores VTODO data."""
+    """A class representing todos (= tasks), subclassing the caldav.Todo object which in turn stores VTODO data.
+
+    Todos are parsed lazily: as long as a todo holds raw iCalendar data, its UID, summary, due date, priority, status
+    and searched text are scanned from the raw data. The vobject or icalendar components are only built when they are
+    accessed, to edit the todo or to read any other property, after which the raw data is serialised from them.
+    """
 
     vobject_instance: vobject.base.Component  # fast access
     icalendar_component: icalendar.cal.Todo  # slow access, but does more checks
 
     def __init__(self, *args, calendarName: str | None = None, **kwargs):
         """Initialises the base class"""
+        self._scannedData: str | None = None  # the raw data that _scannedProperties were scanned from
+        self._scannedProperties: dict[str, list[tuple[str, str]]] | None = None
         super().__init__(*args, **kwargs)
         self.calendarName = calendarName
 
+    @staticmethod
+    def fromRawData(
+        client: caldav.DAVClient | None,
+        url: str | caldav.lib.url.URL | None,
+        data: str,
+        parent: caldav.Calendar | None,
+        props: dict | None = None,
+        calendarName: str | None = None,
+    ) -> "Todo":
+        """Constructs a todo from raw data that went through caldav's compatibility fixes before, i.e. data stored by
+        Melon, which is neither fixed nor parsed again.
+
+        Args:
+            client (caldav.DAVClient | None): the client
+            url (str | caldav.lib.url.URL | None): the URL of the object
+            data (str): iCalendar data
+            parent (caldav.Calendar | None): the calendar
+            props (dict | None, optional): WebDAV properties such as the etag. Defaults to None.
+            calendarName (str | None, optional): the name of the calendar. Defaults to None.
+
+        Returns:
+            Todo: the todo
+        """
+        todo = Todo(client, url, None, parent, props=props, calendarName=calendarName)
+        todo._data = data
+        return todo
+
+    @property
+    def _scanned(self) -> dict[str, list[tuple[str, str]]] | None:
+        """
+        Returns:
+            dict[str, list[tuple[str, str]]] | None: the properties of the VTODO scanned from the raw data, see
+                scanTodo(), None if the data was parsed (then the components are authoritative) or is not a VTODO
+        """
+        data = self._data
+        if not data:
+            return None
+        if data is not self._scannedData:
+            self._scannedProperties = scanTodo(to_normal_str(data))
+            self._scannedData = data
+        return self._scannedProperties
+
     @staticmethod
     def upgrade(todo: caldav.Todo, calendarName: str) -> "Todo":
         """A copy constructor constructing a melon.Todo from a caldav.Todo
@@ -53,6 +179,9 @@ class Todo(caldav.Todo):
         Returns:
             (str):
         """
+        scanned = self._scanned
+        if scanned is not None:
+            return unescapeText(scanned["summary"][0][1])
         return self.vtodo.contents["summary"][0].value  # type: ignore
 
     @summary.setter
@@ -63,17 +192,32 @@ class Todo(caldav.Todo):
         """
         self.vtodo.contents["summary"][0].value = value  # type: ignore
 
+    @property
+    def _due(self) -> datetime.date | datetime.datetime | None:
+        """
+        Returns:
+            datetime.date | datetime.datetime | None: the value of the DUE property, None if there is none
+        """
+        scanned = self._scanned
+        if scanned is not None:
+            if "due" not in scanned:
+                return None
+            due = parseDateOrDateTime(*scanned["due"][0])
+            if due is not None:
+                return due
+        if "due" in self.vtodo.contents:
+            return self.vtodo.contents["due"][0].value  # type: ignore
+
     @property
     def dueDate(self) -> datetime.date | None:
         """
         Returns:
             (datetime.date | None):
         """
-        if "due" in self.vtodo.contents:
-            due = self.vtodo.contents["due"][0].value  # type: ignore
-            if isinstance(due, datetime.datetime):
-                return due.date()
-            return due  # otherwise, this value is already a datetime.date
+        due = self._due
+        if isinstance(due, datetime.datetime):
+            return due.date()
+        return due  # otherwise, this value is already a datetime.date or None
 
     @dueDate.setter
     def dueDate(self, value: datetime.date | None) -> None:
@@ -93,10 +237,9 @@ class Todo(caldav.Todo):
         Returns:
             (datetime.time | None):
         """
-        if "due" in self.vtodo.contents:
-            due = self.vtodo.contents["due"][0].value  # type: ignore
-            if isinstance(due, datetime.datetime):
-                return due.time()
+        due = self._due
+        if isinstance(due, datetime.datetime):
+            return due.time()
 
     @property
     def dueDateTime(self) -> datetime.datetime | None:
@@ -104,11 +247,10 @@ class Todo(caldav.Todo):
         Returns:
             (datetime.datetime | None):
         """
-        if "due" in self.vtodo.contents:
-            due = self.vtodo.contents["due"][0].value  # type: ignore
-            if isinstance(due, datetime.date):
-                return datetime.datetime.combine(due, datetime.time())
-            return due
+        due = self._due
+        if isinstance(due, datetime.date):
+            return datetime.datetime.combine(due, datetime.time())
+        return due
 
     @property
     def uid(self) -> str | None:
@@ -118,6 +260,9 @@ class Todo(caldav.Todo):
         Returns:
             (Union[str, None]):
         """
+        scanned = self._scanned
+        if scanned is not None:
+            return scanned["uid"][0][1] if "uid" in scanned else None
         try:
             return self._vobject_instance.contents["vtodo"][0].contents["uid"][0].value  # type: ignore
         except AttributeError:
@@ -132,9 +277,99 @@ class Todo(caldav.Todo):
             int: the priority of the task, an integer between 1 and 9,
                  where 1 corresponds to the highest and 9 to the lowest priority
         """
+        scanned = self._scanned
+        if scanned is not None:
+            return int(scanned["priority"][0][1]) if "priority" in scanned else 9
         value = self.vtodo.contents.get("priority")
         return int(value[0].value) if value is not None else 9  # type: ignore
 
+    @property
+    def status(self) -> str | None:
+        """
+        Returns:
+            str | None: the STATUS property, e.g. "NEEDS-ACTION", "COMPLETED" or "CANCELLED", None if there is none
+        """
+        scanned = self._scanned
+        if scanned is not None:
+            return scanned["status"][0][1] if "status" in scanned else None
+        value = self.vtodo.contents.get("status")
+        return str(value[0].value) if value is not None else None  # type: ignore
+
+    @property
+    def site(self) -> str | None:
+        """The site at which this todo is done: its LOCATION, else the first category starting with "@" (such as
+        "@office"), else its GEO coordinates, else "home" or "work" if the summary mentions it.
+
+        Returns:
+            str | None: name of the site, None if the todo can be done from anywhere
+        """
+        contents = self.vtodo.contents
+        if "location" in contents and str(contents["location"][0].value).strip():
+            return str(contents["location"][0].value).strip()
+        for line in contents.get("categories", []):
+            for category in line.value if isinstance(line.value, list) else [line.value]:
+                if category.strip().startswith("@") and len(category.strip()) > 1:
+                    return category.strip()[1:]
+        if self.coordinates is not None:
+            return "{:.5f};{:.5f}".format(*self.coordinates)
+        for keyword in ("home", "work"):
+            if keyword in self.summary:
+                return keyword
+        return None
+
+    @property
+    def coordinates(self) -> tuple[float, float] | None:
+        """
+        Returns:
+            tuple[float, float] | None: latitude and longitude of the GEO property in degrees, None if there is none
+        """
+        line = self.vtodo.contents.get("geo")
+        if line is None:
+            return None
+        try:
+            latitude, longitude = re.split(r"[;,]", str(line[0].value))
+            return float(latitude), float(longitude)
+        except ValueError:
+            logging.warning(f"Ignoring the malformed GEO property of {self.uid}.")
+            return None
+
+    @property
+    def relations(self) -> list[tuple[str, str]]:
+        """The RELATED-TO properties of this todo. As in RFC 5545, a relation without RELTYPE parameter is a PARENT
+        relation, and RFC 9253 adds DEPENDS-ON.
+
+        Returns:
+            list[tuple[str, str]]: the relation type (e.g. "PARENT", "CHILD" or "DEPENDS-ON") and UID of each
+                related todo
+        """
+        return [
+            (line.params.get("RELTYPE", ["PARENT"])[0].upper(), line.value)
+            for line in self.vtodo.contents.get("related-to", [])
+        ]
+
+    @property
+    def searchFields(self) -> dict[str, str]:
+        """The text of the properties searched by Melon.findTask(), see melon.search.FIELD_WEIGHTS.
+
+        Returns:
+            dict[str, str]: the text of each of SUMMARY, DESCRIPTION, CATEGORIES and LOCATION that this todo has
+        """
+        scanned = self._scanned
+        fields = {}
+        for name in ("summary", "description", "categories", "location"):
+            values = []
+            if scanned is not None:
+                for _, value in scanned.get(name, []):
+                    if name == "categories":  # a list of texts, separated by unescaped commas
+                        values.extend(unescapeText(text) for text in re.findall(r"(?:\\.|[^\\,])+", value))
+                    else:
+                        values.append(unescapeText(value))
+            for line in self.vtodo.contents.get(name, []) if scanned is None else []:
+                values.extend(line.value if isinstance(line.value, list) else [line.value])
+            if values:
+                fields[name] = " ".join(str(value) for value in values)
+        return fields
+
     def isIncomplete(self) -> bool:
         """
         Returns:
@@ -176,23 +411,27 @@ class Todo(caldav.Todo):
         Returns:
             bool: whether this object is a VTODO or not (i.e. an event or journal).
         """
+        if self._data:
+            return self._scanned is not None
         return "vtodo" in self.vobject_instance.contents
 
-    def toTask(self) -> Task:
+    def toTask(self, locations: Locations | None = None) -> Task:
         """Converts this Todo into the scheduler-compatible Task struct.
 
+        Args:
+            locations (Locations | None, optional): the registry interning the site of this todo, shared by all todos
+                of a scheduler run. Defaults to a new registry, in which only "home" and "work" have fixed locations.
+
         Returns:
             Task: a melon.scheduler.Task
         """
         assert self.uid is not None
-        location = 0
-        if "home" in self.summary:
-            location = 1
-        elif "work" in self.summary:
-            location = 2
+        locations = locations if locations is not None else Locations()
+        location = locations.intern(self.site, self.coordinates)
         match = re.search(r"\b([\d\,\.])+h\b", self.summary)
         hours = float(match.group(1)) if match else 1.0
-        return Task(self.uid, hours, self.priority, location, self.dueDateTime)
+        dependsOn = tuple(uid for reltype, uid in self.relations if reltype in ("DEPENDS-ON", "CHILD"))
+        return Task(self.uid, hours, self.priority, location, self.dueDateTime, dependsOn)
 
     def __lt__(self, other: "Todo") -> bool:
         """Compares two todos in terms of ordering
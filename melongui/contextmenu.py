@@ -2,14 +2,16 @@ import logging
 
 from PySide6 import QtCore, QtWidgets
 
+from melon.melon import Melon
 from melon.todo import Todo
 
 
 class TaskContextMenu(QtWidgets.QMenu):
     dueDateChanged = QtCore.Signal()
 
-    def __init__(self, todo: Todo):
+    def __init__(self, melon: Melon, todo: Todo):
         super().__init__()
+        self.melon = melon
         self.todo = todo
 
     def buildUI(self):
@@ -24,5 +26,6 @@ class TaskContextMenu(QtWidgets.QMenu):
         date = self.calendarWidget.selectedDate()
         self.todo.dueDate = date.toPython()
         self.todo.save()
+        self.melon.addOrUpdateTask(self.todo)  # re-index the todo under its new due date
         logging.info(f"Changed due date: {self.todo.dueDate}")
         self.dueDateChanged.emit()
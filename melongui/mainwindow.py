@@ -5,11 +5,14 @@ from PySide6.QtCore import Qt, QThreadPool, Slot
 from PySide6.QtGui import QCloseEvent, QIcon, QKeyEvent
 
 from melon.melon import Melon
+from melon.scheduler.base import CancelToken
 from melon.todo import Todo
 
 from .calendarlist import CalendarListView
 from .tasklist import TaskListView, UserRole
 
+SCHEDULE_TIME_BUDGET = 5.0  # seconds after which the best schedule found so far is exported
+
 
 class GuiMelon(Melon):
     """Subclasses the `Melon` main object, adding a handler for changes within the data."""
@@ -24,6 +27,7 @@ class GuiMelon(Melon):
         Args:
             todo (Todo): Argument
         """
+        super().addOrUpdateTask(todo)
         assert self.tasklistView is not None
         uid = todo.uid
         assert uid is not None
@@ -41,6 +45,18 @@ class GuiMelon(Melon):
         if todo.isIncomplete():
             self.tasklistView.addTask(todo)
 
+    def removeTask(self, uid: str):
+        """
+        Args:
+            uid (str): Argument
+        """
+        super().removeTask(uid)
+        assert self.tasklistView is not None
+        for row in range(self.tasklistView.count()):
+            if getattr(self.tasklistView.item(row).data(UserRole), "uid", None) == uid:
+                self.tasklistView.takeItem(row)
+                return
+
 
 class MainWindow(QtWidgets.QWidget):
     """Main Window class that defines most of the UI."""
@@ -50,6 +66,7 @@ class MainWindow(QtWidgets.QWidget):
         super().__init__()
         self.melon = GuiMelon()
         self.threadPool = QThreadPool()
+        self.scheduleToken = CancelToken()
         self.setWindowTitle("Melon UI")
 
     def buildUI(self):
@@ -62,6 +79,8 @@ class MainWindow(QtWidgets.QWidget):
         self.calendarlistView.currentItemChanged.connect(self.calendarListClicked)
         self.searchWidget = QtWidgets.QLineEdit()
         self.searchWidget.setPlaceholderText("Search tasks...")
+        self.searchWidget.setClearButtonEnabled(True)
+        self.searchWidget.textChanged.connect(self.tasklistView.setSearchFilter)
         self.messageLabel = QtWidgets.QLabel(self)
         self.messageLabel.setHidden(True)
         self.messageLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -72,9 +91,9 @@ class MainWindow(QtWidgets.QWidget):
         splitter.addWidget(self.tasklistView)
 
         layout = QtWidgets.QGridLayout(self)
-        layout.addWidget(self.messageLabel, 0, 0)
-        # layout.addWidget(self.searchWidget, 0, 1, 1, 2)
-        layout.addWidget(splitter, 1, 0)
+        layout.addWidget(self.searchWidget, 0, 0)
+        layout.addWidget(self.messageLabel, 1, 0)
+        layout.addWidget(splitter, 2, 0)
         self.setLayout(layout)
 
         self.sysTrayIcon = QtWidgets.QSystemTrayIcon(QIcon.fromTheme("edit-select-all"))
@@ -127,6 +146,7 @@ class MainWindow(QtWidgets.QWidget):
 
     def quit(self):
         """Quits the entire application."""
+        self.scheduleToken.cancel()
         QtWidgets.QApplication.quit()
 
     def calendarListClicked(self, item: QtWidgets.QListWidgetItem):
@@ -152,14 +172,26 @@ class MainWindow(QtWidgets.QWidget):
                 self.quit()
             elif event.key() == Qt.Key.Key_S:
                 self.sync()
+            elif event.key() == Qt.Key.Key_F:
+                self.searchWidget.setFocus()
             elif event.key() == Qt.Key.Key_H:
                 self.calendarlistView.setCurrentRow(0)
             elif event.key() == Qt.Key.Key_Plus:
                 self.tasklistView.addEmptyTask()
             elif event.key() == Qt.Key.Key_Return:
-                self.threadPool.start(lambda: self.melon.scheduleAllAndExport("task-schedule.ics"))
+                self.schedule()
         return super().keyPressEvent(event)
 
+    def schedule(self):
+        """Schedules all tasks in the background within SCHEDULE_TIME_BUDGET, cancelling a still running schedule."""
+        self.scheduleToken.cancel()
+        token = self.scheduleToken = CancelToken()
+        self.threadPool.start(
+            lambda: self.melon.scheduleAllAndExport(
+                "task-schedule.ics", timeBudget=SCHEDULE_TIME_BUDGET, cancelToken=token
+            )
+        )
+
     def showInfoMessage(self, msg: str):
         """
         Args:
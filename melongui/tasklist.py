@@ -33,6 +33,7 @@ class TaskListView(QtWidgets.QListWidget):
         self.setVerticalScrollMode(QtWidgets.QListWidget.ScrollMode.ScrollPerPixel)
         self.itemChanged.connect(self.onItemChange)
         self._currentCalendarName = None
+        self._searchMatches: set[str] | None = None  # UIDs matching the search query, None if there is none
         self.addAddButton()
         self.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.customContextMenuRequested.connect(self.openContextMenu)
@@ -40,7 +41,7 @@ class TaskListView(QtWidgets.QListWidget):
     def openContextMenu(self, point: QPoint):
         item = self.itemAt(point)
         todo: Todo = item.data(UserRole)
-        menu = TaskContextMenu(todo)
+        menu = TaskContextMenu(self.melon, todo)
         menu.buildUI()
         # menu.dueDateChanged.connect(self.update)
         position = self.mapToGlobal(point)
@@ -102,26 +103,40 @@ class TaskListView(QtWidgets.QListWidget):
         addButton.clicked.connect(self.addEmptyTask)
         self.setItemWidget(self._addTaskItem, addButton)
 
+    def applyFilters(self):
+        """Only shows the tasks of the current calendar that match the current search query."""
+        for i in range(self.count()):
+            item = self.item(i)
+            todo = item.data(UserRole)
+            if todo is None:
+                item.setHidden(False)
+                continue
+            otherCalendar = self._currentCalendarName is not None and todo.calendarName != self._currentCalendarName
+            item.setHidden(otherCalendar or (self._searchMatches is not None and todo.uid not in self._searchMatches))
+
     def setCalendarFilter(self, calendarName):
         """Only shows tasks for the given calendar.
 
         Args:
             calendarName: Argument
         """
-        for i in range(self.count()):
-            item = self.item(i)
-            if calendarName is not None and item.data(UserRole) is not None:
-                item.setHidden(item.data(UserRole).calendarName != calendarName)
-            else:
-                item.setHidden(False)
-        self.sortItems()
         self._currentCalendarName = calendarName
+        self.applyFilters()
+        self.sortItems()
 
     def clearCalendarFilter(self):
         """Clears the calendar filter, hence shows all tasks"""
-        for i in range(self.count()):
-            self.item(i).setHidden(False)
         self._currentCalendarName = None
+        self.applyFilters()
+
+    def setSearchFilter(self, query: str):
+        """Only shows tasks matching the search query, see Melon.findTask(). Called as the user types.
+
+        Args:
+            query (str): the search query, all tasks are shown if it is blank
+        """
+        self._searchMatches = {todo.uid for todo in self.melon.findTask(query)} if query.strip() else None
+        self.applyFilters()
 
     def onItemChange(self, item: QtWidgets.QListWidgetItem):
         """Called when an item's value changes. Handles saving of the underlying object.
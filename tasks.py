@@ -17,6 +17,7 @@ import matplotlib.axes
 import numpy as np
 import requests
 from invoke.context import Context
+from invoke.exceptions import Exit
 from invoke.tasks import task
 from matplotlib import pyplot as plt
 from traitlets.config import Config
@@ -99,6 +100,41 @@ def start_mock_server(ctx: Context):
     melon.store()
 
 
+@task()
+def benchmark_sync(ctx: Context, calendars: int = 25, todos: int = 20, workers: int = 8):
+    """Fills the mock server (see start_mock_server) with synthetic calendars, then compares the time of a sequential
+    and a concurrent fetch and sync of all of them.
+
+    Args:
+        ctx (Context): Invoke Execution Context
+        calendars (int, optional): the number of synthetic calendars. Defaults to 25.
+        todos (int, optional): the number of todos per synthetic calendar. Defaults to 20.
+        workers (int, optional): the number of calendars fetched concurrently. Defaults to 8.
+    """
+    url = "http://localhost:8000/dav/user/calendars/"
+    melon = Melon(url=url)
+    melon.connect()
+    assert melon.principal is not None
+    for k in range(calendars):
+        name = f"synthetic-{k:03d}"
+        if name not in melon.calendars:
+            calendar = melon.principal.make_calendar(name)
+            for i in range(todos):
+                calendar.save_todo(summary=f"Synthetic task {i} of {name}")
+    print(f"The mock server holds {calendars} synthetic calendars with {todos} todos each.")
+    for concurrency in (1, workers):
+        melon = Melon(url=url, workers=concurrency)
+        start = time.perf_counter()
+        melon.fetch()
+        fetched = time.perf_counter()
+        melon.syncAll()
+        synced = time.perf_counter()
+        print(
+            f"{concurrency} workers: fetched {len(melon.calendars)} calendars in {fetched - start:.2f}s, "
+            f"synced in {synced - fetched:.2f}s, {len(melon.errors)} errors."
+        )
+
+
 @task()
 def plot_convergence(ctx: Context, N=40, proportion=0.5):
     """Plots scheduler convergence to a file.
@@ -133,8 +169,15 @@ def compare_runtime(ctx: Context, N=80):
     from melon.scheduler.numba import NumbaMCMCScheduler
     from melon.scheduler.purepython import MCMCScheduler
     from melon.scheduler.rust import RustyMCMCScheduler
-
-    ALL_IMPLEMENTATIONS = (MCMCScheduler, RustyMCMCScheduler, NumbaMCMCScheduler, CppMCMCScheduler)
+    from melon.scheduler.vectorised import NumpyMCMCScheduler
+
+    ALL_IMPLEMENTATIONS = (
+        MCMCScheduler,
+        RustyMCMCScheduler,
+        NumbaMCMCScheduler,
+        CppMCMCScheduler,
+        NumpyMCMCScheduler,
+    )
 
     tasks = generateManyDemoTasks(N)
     start = time.monotonic()
@@ -152,6 +195,76 @@ def compare_runtime(ctx: Context, N=80):
     return runtimes
 
 
+@task()
+def benchmark(ctx: Context, output: str = str(RESULTS / "benchmark.json"), repeats: int = 5, save_baseline=False):
+    """Runs the benchmark suite on all available scheduler implementations and writes the results to a JSON file.
+
+    Args:
+        ctx (Context): Invoke Execution Context
+        output (str): path of the JSON report
+        repeats (int): number of timed runs per implementation and fixture
+        save_baseline (bool): whether to also store the report as the baseline for compare_benchmarks
+    """
+    from benchmarks.suite import BASELINE, runSuite, saveReport
+
+    report = runSuite(repeats=repeats)
+    saveReport(report, pathlib.Path(output))
+    print(f"Wrote benchmark report to {output}.")
+    if save_baseline:
+        saveReport(report, BASELINE)
+        print(f"Stored as baseline in {BASELINE}.")
+
+
+@task()
+def scaling(ctx: Context, output: str = str(RESULTS / "scaling.json"), time_limit: float = 60.0):
+    """Records how runtime and quality grow with the number of tasks, with and without decomposition, up to 2000 tasks.
+
+    Args:
+        ctx (Context): Invoke Execution Context
+        output (str): path of the JSON report
+        time_limit (float): runtime in seconds after which an implementation is not run on more tasks
+    """
+    from benchmarks.suite import saveReport, scalingCurve
+
+    report = scalingCurve(timeLimit=time_limit)
+    saveReport(report, pathlib.Path(output))
+    for point in report["scaling"]:
+        print(f"{point['implementation']:40} N={point['N']:<6} {point['runtime']:.3f}s q={point['quality']:.3f}")
+    print(f"Wrote scaling report to {output}.")
+
+
+@task()
+def compare_benchmarks(ctx: Context, report: str = str(RESULTS / "benchmark.json"), baseline: str = ""):
+    """Compares a benchmark report against the stored baseline and fails if any runtime or quality regressed.
+
+    Args:
+        ctx (Context): Invoke Execution Context
+        report (str): path of the JSON report written by the benchmark task
+        baseline (str): path of the baseline report, defaults to benchmarks/baseline.json
+    """
+    from benchmarks.suite import BASELINE, compareReports, loadReport
+
+    regressions = compareReports(loadReport(pathlib.Path(report)), loadReport(pathlib.Path(baseline or BASELINE)))
+    for regression in regressions:
+        print(regression)
+    if regressions:
+        raise Exit(f"Found {len(regressions)} regressions.", code=1)
+    print("No regressions found.")
+
+
+@task()
+def precompile_numba(ctx: Context):
+    """Compiles the Numba kernels ahead of the first scheduler run and stores them in the on-disk cache, such that
+    later processes only load the machine code. Run this as a deployment step.
+
+    Args:
+        ctx (Context): Invoke Execution Context
+    """
+    start = time.monotonic()
+    ctx.run("python -m melon.scheduler.numba")
+    print(f"Numba pre-compilation took {time.monotonic() - start:.2f} seconds.")
+
+
 @task()
 def plot_runtime_complexity(ctx: Context):
     """Simulates with a varying number of tasks and plots runtime complexity.
@@ -4,13 +4,21 @@ import datetime
 import os
 import random
 import re
+import threading
+import types
 
+import caldav
+import caldav.lib.url
 import pytest
 
+import melon.melon
+from melon.calendar import Calendar, Syncable
 from melon.config import CONFIG_PATH, load_config
 from melon.melon import Melon
-from melon.scheduler.base import Task
+from melon.scheduler.base import Task, TimeSlot
 from melon.scheduler.purepython import AvailabilityManager
+from melon.search import SearchIndex
+from melon.todo import Todo
 
 MAX_CALENDARS = 3
 
@@ -51,6 +59,274 @@ class TestAvailabilityManager:
         assert spread[1][1].timestamp == startOfDay + datetime.timedelta(hours=3.5)
         assert spread[2][1].timestamp == startOfDay + datetime.timedelta(days=1)
 
+    def test_busy_and_excluded_spread(self):
+        """Tests whether tasks are spread around busy times and skip excluded days."""
+        startOfDay = datetime.datetime.combine(datetime.date(2024, 1, 1), datetime.time(10))
+        availability = AvailabilityManager(
+            busy=[TimeSlot(startOfDay + datetime.timedelta(hours=2), 1.5)],
+            exclusions=[datetime.date(2024, 1, 2)],
+        )
+        tasks = [Task("1", 1, 1, 1, None), Task("2", 2, 1, 1, None), Task("3", 11, 1, 1, None)]
+        spread = dict(availability.spreadTasks(tasks, startOfDay))
+        assert spread["1"].timestamp == startOfDay
+        assert spread["2"].timestamp == startOfDay + datetime.timedelta(hours=3.5)  # 1h left before the busy time
+        assert spread["3"].timestamp == startOfDay + datetime.timedelta(days=2)  # 8.5h left, the next day is excluded
+
+    def test_slot_table(self):
+        """Tests whether the slot table subtracts busy times and covers enough slots for the tasks."""
+        startOfDay = datetime.datetime.combine(datetime.date(2024, 1, 1), datetime.time(10))
+        availability = AvailabilityManager(
+            busy=[TimeSlot(startOfDay + datetime.timedelta(hours=4), 2), TimeSlot(startOfDay, 1)]
+        )
+        tasks = [Task(str(i), 3, 1, 1, None) for i in range(4)]
+        slots = availability.slotTable(startOfDay, tasks)
+        assert slots.starts[:3].tolist() == [1, 6, 24]
+        assert slots.ends[:3].tolist() == [4, 14, 38]
+        assert sum(slots.ends - slots.starts >= 3) == len(tasks) + 1
+        with pytest.raises(RuntimeError):
+            availability.slotTable(startOfDay, [Task("long", 15, 1, 1, None)])
+
+
+class TestScheduleStorage:
+    """Tests persisting the last schedule, which is used to warm-start the next scheduler run."""
+
+    def test_store_and_load_schedule(self, tmp_path, monkeypatch):
+        """Stores a schedule and loads its ordering again."""
+        monkeypatch.setattr(melon.melon, "CONFIG_FOLDER", tmp_path)
+        client = Melon()
+        assert client.loadSchedule() == []
+        start = datetime.datetime.combine(datetime.date.today(), datetime.time(10, 0))
+        schedule = {
+            "b": TimeSlot(start + datetime.timedelta(hours=2), 1.0),
+            "a": TimeSlot(start, 2.0),
+            "c": TimeSlot(start + datetime.timedelta(days=1), 3.0),
+        }
+        client.storeSchedule(schedule)
+        assert client.loadSchedule() == ["a", "b", "c"]
+
+
+def makeTodo(uid: str, *properties: str) -> Todo:
+    """Not a test, creates a todo with the given content lines."""
+    lines = "".join(f"{line}\r\n" for line in properties)
+    data = f"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:pytest\r\nBEGIN:VTODO\r\nUID:{uid}\r\nSUMMARY:{uid}\r\n"
+    return Todo(data=data + lines + "END:VTODO\r\nEND:VCALENDAR\r\n", calendarName="pytest")
+
+
+class TestTodoProperties:
+    """Tests reading scheduler inputs from the properties of todos."""
+
+    def test_related_to(self, monkeypatch):
+        """Maps DEPENDS-ON and CHILD relations and the inverse of PARENT relations onto dependencies."""
+        todos = [
+            makeTodo("parent", "RELATED-TO;RELTYPE=CHILD:first"),
+            makeTodo("first", "RELATED-TO:parent"),
+            makeTodo(
+                "second",
+                "RELATED-TO;RELTYPE=PARENT:parent",
+                "RELATED-TO;RELTYPE=DEPENDS-ON:first",
+                "RELATED-TO;RELTYPE=SIBLING:third",
+            ),
+        ]
+        assert todos[2].relations == [("PARENT", "parent"), ("DEPENDS-ON", "first"), ("SIBLING", "third")]
+        client = Melon()
+        monkeypatch.setattr(client, "allIncompleteTasks", lambda: iter(todos))
+        tasks = {task.uid: task for task in client.tasksToSchedule()}
+        assert tasks["parent"].dependsOn == ("first", "second")
+        assert tasks["first"].dependsOn == ()
+        assert tasks["second"].dependsOn == ("first",)
+
+    def test_sites(self, monkeypatch):
+        """Interns the sites named by LOCATION, "@" categories, GEO and the summary, shared by all tasks of a run."""
+        todos = [
+            makeTodo("anywhere"),
+            makeTodo("office", "LOCATION:Office", "GEO:48.137;11.575"),
+            makeTodo("tagged", "CATEGORIES:errand,@office"),
+            makeTodo("geo", "GEO:48.265;11.671"),
+            makeTodo("work from home"),
+        ]
+        assert [todo.site for todo in todos] == [None, "Office", "office", "48.26500;11.67100", "home"]
+        assert todos[1].coordinates == (48.137, 11.575) and todos[0].coordinates is None
+        client = Melon()
+        monkeypatch.setattr(client, "allIncompleteTasks", lambda: iter(todos))
+        monkeypatch.setitem(melon.melon.CONFIG, "travel", {"home": {"office": 0.5}})
+        assert [task.location for task in client.tasksToSchedule()] == [0, 3, 3, 4, 1]
+        travel = client.travelCosts()
+        assert travel.shape == (5, 5) and travel[1, 3] == travel[3, 1] == 15.0 and travel[3, 4] == travel[4, 3] > 0
+
+    def test_lazy_parsing(self):
+        """Scans the hot properties from the raw data as a full parse would read them, and parses only to edit."""
+        properties = [
+            ("DESCRIPTION:Buy milk\\, eggs\\; bread", "DUE;VALUE=DATE:20240304", "PRIORITY:2", "STATUS:NEEDS-ACTION"),
+            ("CATEGORIES:errand,@shop\\,x", "CATEGORIES:two", "DESCRIPTION:a long text that is fol", "  ded here"),
+            ("DUE:20240304T120000Z", "BEGIN:VALARM", "ACTION:DISPLAY", "DESCRIPTION:alarm", "END:VALARM"),
+            ("DUE;TZID=Europe/Berlin:20240304T120000", "STATUS:COMPLETED", "LOCATION:Office"),
+        ]
+        for lines in properties:
+            lazy, parsed = makeTodo("lazy", *lines), makeTodo("lazy", *lines)
+            assert parsed.vobject_instance is not None
+            for name in ("uid", "summary", "dueDate", "dueTime", "dueDateTime", "priority", "status", "searchFields"):
+                assert getattr(lazy, name) == getattr(parsed, name), name
+            assert lazy.isTodo() and lazy.isIncomplete() == parsed.isIncomplete()
+            assert lazy._vobject_instance is None and lazy._icalendar_instance is None
+
+        todo = Todo.fromRawData(None, None, makeTodo("edited").data, None, calendarName="pytest")
+        client = Melon()
+        client.addOrUpdateTask(todo)
+        assert todo._vobject_instance is None
+        todo.summary = "Edited"
+        assert todo.summary == "Edited" and "SUMMARY:Edited" in todo.data
+
+
+class TestTaskIndex:
+    """Tests the index of todos maintained by Melon."""
+
+    def test_index(self):
+        """Adds, updates and removes todos, and queries them by UID, due date, priority and completion status."""
+        client = Melon()
+        todos = [
+            makeTodo("soon", "DUE:20240304T120000", "PRIORITY:1"),
+            makeTodo("later", "DUE;VALUE=DATE:20240310", "PRIORITY:5"),
+            makeTodo("done", "DUE:20240305T090000", "STATUS:COMPLETED"),
+            makeTodo("someday"),
+        ]
+        for todo in todos:
+            client.addOrUpdateTask(todo)
+        assert client.getTask("later") is todos[1] and len(client.index) == 4
+        with pytest.raises(ValueError):
+            client.getTask("missing")
+        assert [todo.uid for todo in client.allIncompleteTasks()] == ["soon", "later", "someday"]
+        week = datetime.datetime(2024, 3, 4), datetime.datetime(2024, 3, 11)
+        assert [todo.uid for todo in client.tasksDueBetween(*week)] == ["soon", "done", "later"]
+        assert [todo.uid for todo in client.index.withPriority(1, 5)] == ["soon", "later"]
+
+        client.addOrUpdateTask(makeTodo("soon", "DUE:20240320T120000", "PRIORITY:1", "STATUS:COMPLETED"))
+        assert [todo.uid for todo in client.tasksDueBetween(*week)] == ["done", "later"]
+        assert [todo.uid for todo in client.allIncompleteTasks()] == ["later", "someday"]
+        client.removeTask("later")
+        assert "later" not in client.index
+        assert [todo.uid for todo in client.index.withPriority()] == ["soon", "done", "someday"]
+        assert list(client.index.ofCalendar("pytest")) == [todos[2], todos[3], client.getTask("soon")]
+        todos[3].url = caldav.lib.url.URL("http://localhost/someday.ics")
+        client.addOrUpdateTask(todos[3])
+        client.index.removeUrl("http://localhost/someday.ics")
+        assert [todo.uid for todo in client.allTasks()] == ["done", "soon"]
+
+
+class TestSearch:
+    """Tests the full-text search over the todos."""
+
+    def test_find_task(self, tmp_path):
+        """Finds todos by whole words, prefixes and substrings of several fields, ranked, and persists the index."""
+        client = Melon()
+        todos = [
+            makeTodo("groceries", "DESCRIPTION:Milk and bread\\, weekly shopping", "CATEGORIES:errand,@shop"),
+            makeTodo("report-on-shopping", "LOCATION:Office"),
+            makeTodo("call-bakery"),
+        ]
+        for todo in todos:
+            client.addOrUpdateTask(todo)
+        assert todos[0].searchFields == {
+            "summary": "groceries",
+            "description": "Milk and bread, weekly shopping",
+            "categories": "errand @shop",
+        }
+
+        def uids(query: str) -> list[str]:
+            return [todo.uid for todo in client.findTask(query)]
+
+        assert uids("shopping") == ["report-on-shopping", "groceries"]  # the summary ranks above the description
+        assert uids("oppi") == ["report-on-shopping", "groceries"]
+        assert uids("BREAD") == ["groceries"] and uids("bake") == ["call-bakery"]
+        assert uids("ak") == []  # substrings need at least three characters, shorter terms match word starts
+        assert uids("report offi") == ["report-on-shopping"] and uids("report bread") == []
+        assert len(uids("")) == 3 and len(client.findTask("shop", limit=1)) == 1
+
+        client.addOrUpdateTask(makeTodo("call-bakery", "DESCRIPTION:moved to the dentist"))
+        assert uids("dent") == ["call-bakery"]
+        client.removeTask("groceries")
+        assert uids("bread") == [] and "milk" not in client.index.search.vocabulary
+
+        client.index.search.save(tmp_path / "search.json")
+        loaded = SearchIndex.load(tmp_path / "search.json")
+        assert loaded.search("dent") == client.index.search.search("dent")
+        loaded.retain({"report-on-shopping"})
+        assert len(loaded) == 1 and loaded.search("dent") == []
+
+
+class TestLocalStore:
+    """Tests storing the calendars in SQLite."""
+
+    def test_store_changes_and_load(self, tmp_path, monkeypatch):
+        """Writes only the objects staged by fetches and syncs, queries their columns and loads them again."""
+        monkeypatch.setattr(melon.melon, "CONFIG_FOLDER", tmp_path)
+        client = Melon()
+        assert not client.localStore.exists()
+        calendar = Calendar(caldav.Calendar(client.client, url="http://localhost/cal/", name="pytest"))
+        todos = [
+            makeTodo("soon", "DUE;VALUE=DATE:20240304", "PRIORITY:1"),
+            makeTodo("done", "STATUS:COMPLETED"),
+            makeTodo("someday"),
+        ]
+        for todo in todos:
+            todo.url = caldav.lib.url.URL(f"http://localhost/cal/{todo.uid}.ics")
+        calendar.syncable = Syncable(calendar, todos, "token-1")
+        client.calendars["pytest"] = calendar
+        client.localStore.stageCalendar(calendar)
+        client._load_syncable_tasks(calendar)
+        assert client.localStore.commit(client.calendars) == 3
+        assert client.localStore.commit(client.calendars) == 0  # nothing changed
+
+        calendar.syncable.sync_token = "token-2"
+        updated = makeTodo("someday", "PRIORITY:9")
+        updated.url = todos[2].url
+        client._applySyncDelta(calendar, [updated], [str(todos[1].url)])
+        assert client.localStore.commit(client.calendars) == 2
+        assert client.localStore.storedCalendars() == [("pytest", str(calendar.url), "token-2")]
+        stored = client.localStore.query("incomplete")
+        assert [(row.uid, row.due, row.priority) for row in stored] == [
+            ("soon", "2024-03-04T00:00:00", 1),
+            ("someday", None, 9),
+        ]
+
+        loaded = Melon()
+        loaded.principal = types.SimpleNamespace(calendar_home_set=None)  # type: ignore
+        loaded.load()
+        assert loaded.calendars["pytest"].syncable.sync_token == "token-2"
+        assert sorted(todo.uid for todo in loaded.allTasks()) == ["someday", "soon"]
+        assert all(todo._vobject_instance is None for todo in loaded.allTasks())  # indexed without a parse
+        assert loaded.getTask("someday").priority == 9
+
+
+class FakeCalendar:
+    """Not a test, stands in for a calendar on a server that answers after all calendars of a barrier asked."""
+
+    def __init__(self, name: str, barrier: threading.Barrier, fails: bool = False) -> None:
+        self.name, self.barrier, self.fails = name, barrier, fails
+        self.syncable = None
+
+    def objects_by_sync_token(self, load_objects: bool) -> caldav.SynchronizableCalendarObjectCollection:
+        """Not a test, waits for the other calendars, so that it only returns when they are fetched concurrently."""
+        self.barrier.wait()
+        if self.fails:
+            raise ConnectionError(f"{self.name} is unreachable")
+        return caldav.SynchronizableCalendarObjectCollection(self, [], f"token-{self.name}")
+
+
+class TestConcurrentFetch:
+    """Tests fetching all calendars on a thread pool."""
+
+    def test_fetch(self):
+        """Fetches calendars concurrently, isolates a failing one and merges the others in order."""
+        client = Melon(workers=3)
+        assert client.client.session.get_adapter("http://localhost")._pool_maxsize == 3
+        barrier = threading.Barrier(3, timeout=10.0)
+        names = ["c", "broken", "a"]
+        client.calendars = {name: FakeCalendar(name, barrier, name == "broken") for name in names}  # type: ignore
+        client.fetch()
+        assert list(client.errors) == ["broken"] and isinstance(client.errors["broken"], ConnectionError)
+        assert client.calendars["broken"].syncable is None
+        assert [client.calendars[name].syncable.sync_token for name in ("c", "a")] == ["token-c", "token-a"]
+
 
 class DoNotTestMelon:
     """Test class containing multiple tests as methods."""
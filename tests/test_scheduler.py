@@ -1,23 +1,65 @@
 """Tests for the scheduler algorithm."""
 
+import asyncio
+import concurrent.futures
 import datetime
+import json
+import math
+import multiprocessing
 import pathlib
 import random
 import tempfile
+import threading
+import time
 from typing import Mapping
 
+import numpy as np
 import pytest
 
+from benchmarks.suite import Fixture, compareReports, runSuite
 from melon.melon import Melon
-from melon.scheduler.base import START_OF_DAY, AbstractScheduler, Task, TimeSlot, generateDemoTasks
+from melon.scheduler.base import (
+    COMMUTE_PENALTY,
+    GREEDY_HEURISTICS,
+    START_OF_DAY,
+    TRAVEL_SPEED,
+    AbstractScheduler,
+    Budget,
+    CancelToken,
+    EnergyEngine,
+    Locations,
+    MoveSet,
+    SlotTable,
+    Snapshot,
+    SplitMix64,
+    Task,
+    TimeSlot,
+    earliestDueDate,
+    flatTravelCosts,
+    generateDemoTasks,
+    generateManyDemoTasks,
+    locationGroupedEarliestDueDate,
+    precedenceClosure,
+    weightedShortestProcessingTime,
+)
 from melon.scheduler.cpp import CppMCMCScheduler
+from melon.scheduler.decomposed import DecomposedScheduler
 from melon.scheduler.numba import NumbaMCMCScheduler
-from melon.scheduler.purepython import MCMCScheduler
+from melon.scheduler.purepython import AvailabilityManager, MCMCScheduler
 from melon.scheduler.rust import RustyMCMCScheduler
+from melon.scheduler.tempering import ParallelTemperingScheduler
+from melon.scheduler.vectorised import NumpyMCMCScheduler, batchEnergy
 from melon.visualise import plotConvergence, radarChart
 
 MAX_CALENDARS = 3
-ALL_IMPLEMENTATIONS = (MCMCScheduler, RustyMCMCScheduler, NumbaMCMCScheduler, CppMCMCScheduler)
+ALL_IMPLEMENTATIONS = (
+    MCMCScheduler,
+    RustyMCMCScheduler,
+    NumbaMCMCScheduler,
+    CppMCMCScheduler,
+    ParallelTemperingScheduler,
+    NumpyMCMCScheduler,
+)
 
 
 class TestScheduler:
@@ -70,6 +112,450 @@ class TestScheduler:
         with pytest.raises((RuntimeError, SystemError)):
             scheduler.schedule()
 
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_optimal_initial_state(self, Scheduler: type[AbstractScheduler]):
+        """Anneals from a state at the energy minimum, e.g. a small window of the DecomposedScheduler."""
+        scheduler = Scheduler([Task("1", 1.0, 1, 0, None), Task("2", 1.0, 1, 0, None)])
+        assert len(scheduler.schedule()) == 2
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_warm_start(self, Scheduler: type[AbstractScheduler]):
+        """Warm-starts from a previous schedule with a deleted and two new tasks, then refines it."""
+        tasks = generateManyDemoTasks(12)
+        previous = [task.uid for task in tasks[:10]] + ["deleted"]
+        random.shuffle(previous)
+        scheduler = Scheduler(tasks)
+        scheduler.warmStart(previous)
+        assert sorted(scheduler.initialState) == list(range(12))
+        kept = [scheduler.table.uids[index] for index in scheduler.initialState if index < 10]
+        assert kept == [uid for uid in previous if uid != "deleted"]
+        assert scheduler.firstSweep > 1
+        result = scheduler.schedule()
+        assert len(result) == len(scheduler.tasks)
+
+    def test_greedy_heuristics(self):
+        """Checks the constructive heuristics on a small, hand-made set of tasks."""
+        now = datetime.datetime.combine(datetime.date.today(), START_OF_DAY)
+        tasks = [
+            Task("late", 1.0, 9, 1, now + datetime.timedelta(hours=50)),
+            Task("none", 6.0, 2, 2, None),
+            Task("soon", 2.0, 1, 2, now + datetime.timedelta(hours=5)),
+            Task("urgent", 1.0, 5, 1, now + datetime.timedelta(hours=5)),
+        ]
+        table = MCMCScheduler(tasks).table
+
+        def uids(ordering: list[int]) -> list[str]:
+            return [table.uids[index] for index in ordering]
+
+        assert uids(earliestDueDate(table)) == ["urgent", "soon", "late", "none"]
+        assert uids(weightedShortestProcessingTime(table)) == ["late", "urgent", "soon", "none"]
+        assert uids(locationGroupedEarliestDueDate(table)) == ["urgent", "late", "soon", "none"]
+        for heuristic in GREEDY_HEURISTICS.values():
+            assert sorted(heuristic(MCMCScheduler(generateManyDemoTasks(50)).table)) == list(range(50))
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_greedy_start(self, Scheduler: type[AbstractScheduler]):
+        """Starts from the best heuristic, which the annealed schedule must not be worse than, and runs the fast mode."""
+        scheduler = Scheduler(generateManyDemoTasks(20))
+        fast = scheduler.scheduleGreedy()
+        assert len(fast) == 20 and scheduler.steps == 0
+        greedyEnergy = scheduler.energy(scheduler.initialState)
+        assert greedyEnergy <= min(scheduler.energy(h(scheduler.table)) for h in GREEDY_HEURISTICS.values())
+        result = scheduler.schedule(greedy=True)
+        ordering = [scheduler.table.uids.index(uid) for uid in sorted(result, key=lambda uid: result[uid].timestamp)]
+        assert scheduler.energy(ordering) <= greedyEnergy
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_swap_delta(self, Scheduler: type[AbstractScheduler]):
+        """Checks the incremental energy of swap proposals against a full recomputation on random states."""
+        for N in (2, 5, 30):
+            tasks = generateManyDemoTasks(N)
+            reference = MCMCScheduler(tasks)
+            scheduler = Scheduler(tasks)
+            for _ in range(20):
+                state = random.sample(range(N), N)
+                indexA, indexB = random.randrange(N), random.randrange(N)
+                swapped = list(state)
+                swapped[indexA], swapped[indexB] = state[indexB], state[indexA]
+                expected = reference.computeEnergy(tuple(swapped)) - reference.computeEnergy(tuple(state))
+                assert scheduler.swapDelta(state, indexA, indexB) == pytest.approx(expected, abs=1e-4)
+
+    def test_precedence_closure(self):
+        """Checks the transitive closure of the dependencies, the rejection of cycles and the repair of orderings."""
+        tasks = [Task(str(i), 1.0, 5, 0, None) for i in range(70)]
+        tasks[3].dependsOn, tasks[65].dependsOn, tasks[0].dependsOn = ("65",), ("1", "unknown"), ("3",)
+        closure = precedenceClosure(tasks)
+        assert closure.shape == (70, 2) and closure.dtype == np.uint64
+        table = MCMCScheduler(tasks).table
+        assert set(zip(*np.nonzero(table.precedence()))) == {(65, 1), (3, 65), (3, 1), (0, 3), (0, 65), (0, 1)}
+        assert table.constrained.sum() == 4
+        ordering = table.feasibleOrder(range(70))
+        assert ordering[:4] == [1, 2, 4, 5] and ordering.index(65) < ordering.index(3) < ordering.index(0)
+        tasks[1].dependsOn = ("0",)
+        with pytest.raises(ValueError):
+            precedenceClosure(tasks)
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_dependencies(self, Scheduler: type[AbstractScheduler]):
+        """Schedules a chain of dependencies against the priorities and rejects swaps that would break it."""
+        tasks = generateManyDemoTasks(12)
+        for task, dependency in zip(tasks[:4], tasks[1:5]):
+            task.priority, task.dependsOn = 1, (dependency.uid,)
+        scheduler = Scheduler(tasks)
+        state = scheduler.initialState
+        position = {index: state.index(index) for index in range(5)}
+        assert position[4] < position[3] < position[2] < position[1] < position[0]
+        assert scheduler.swapDelta(state, position[4], position[0]) == math.inf
+        assert scheduler.swapDelta(state, position[1], position[0]) == math.inf
+        result = scheduler.schedule()
+        starts = [result[task.uid].timestamp for task in tasks[:5]]
+        assert starts == sorted(starts, reverse=True)
+
+    def test_locations(self):
+        """Interns sites and builds the travel cost matrix from known times, coordinates and the one hour default."""
+        locations = Locations()
+        assert locations.intern(None) == 0 and locations.intern(" ") == 0 and locations.intern("Home") == 1
+        assert locations.intern("office", (48.137, 11.575)) == 3 and locations.intern("OFFICE ") == 3
+        assert locations.intern("lab", (48.265, 11.671)) == 4 and locations.intern("depot") == 5
+        travel = locations.travelCosts({"Office": {"home": 0.5}, "lab": {"office": 2.0}, "office": {"lab": 1.0}})
+        assert travel.shape == (6, 6) and not travel[0].any() and not travel[:, 0].any() and not travel.diagonal().any()
+        assert travel[1, 3] == travel[3, 1] == 0.5 * COMMUTE_PENALTY
+        assert travel[3, 4] == COMMUTE_PENALTY and travel[4, 3] == 2 * COMMUTE_PENALTY
+        assert travel[1, 5] == travel[2, 1] == COMMUTE_PENALTY
+        locations.intern("garage", (48.137, 11.675))  # 7.4 km east of the office
+        assert locations.travelCosts()[3, 6] == pytest.approx(7.42 / TRAVEL_SPEED * COMMUTE_PENALTY, rel=1e-3)
+        assert np.array_equal(flatTravelCosts(3), Locations().travelCosts())
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_travel_costs(self, Scheduler: type[AbstractScheduler]):
+        """Checks the incremental energy of swaps against a full recomputation under a custom travel cost matrix."""
+        tasks = generateManyDemoTasks(25)
+        for task in tasks:
+            task.location = random.randrange(6)
+        travel = np.random.default_rng(1).uniform(0, 80, (6, 6))
+        travel[0, :] = travel[:, 0] = 0
+        reference, scheduler = MCMCScheduler(tasks), Scheduler(tasks)
+        for instance in (reference, scheduler):
+            instance.setTravelCosts(travel)
+        with pytest.raises(ValueError):
+            scheduler.setTravelCosts(travel[:5, :5])
+        for _ in range(20):
+            state = random.sample(range(25), 25)
+            indexA, indexB = random.randrange(25), random.randrange(25)
+            swapped = list(state)
+            swapped[indexA], swapped[indexB] = state[indexB], state[indexA]
+            expected = reference.computeEnergy(tuple(swapped)) - reference.computeEnergy(tuple(state))
+            assert scheduler.swapDelta(state, indexA, indexB) == pytest.approx(expected, abs=1e-4)
+        assert len(scheduler.schedule()) == 25
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_busy_times(self, Scheduler: type[AbstractScheduler]):
+        """Schedules around busy times and a day off, checking swap deltas and that no task overlaps a busy time."""
+        N = 15
+        tasks = generateManyDemoTasks(N)
+        start = datetime.datetime.combine(datetime.date.today(), START_OF_DAY)
+        busy = [TimeSlot(start + datetime.timedelta(days=day, hours=random.uniform(0, 12)), 2.5) for day in range(N)]
+        availability = AvailabilityManager(busy=busy, exclusions=[start.date() + datetime.timedelta(days=1)])
+        reference, scheduler = MCMCScheduler(tasks), Scheduler(tasks)
+        reference.setAvailability(availability)
+        scheduler.setAvailability(availability)
+        for _ in range(20):
+            state = random.sample(range(N), N)
+            indexA, indexB = random.randrange(N), random.randrange(N)
+            swapped = list(state)
+            swapped[indexA], swapped[indexB] = state[indexB], state[indexA]
+            expected = reference.computeEnergy(tuple(swapped)) - reference.computeEnergy(tuple(state))
+            assert scheduler.swapDelta(state, indexA, indexB) == pytest.approx(expected, abs=1e-4)
+        result = scheduler.schedule()
+        assert len(result) == N
+        for slot in result.values():
+            assert slot.timestamp >= start and slot.timestamp.date() != start.date() + datetime.timedelta(days=1)
+            assert all(slot.end <= other.timestamp or other.end <= slot.timestamp for other in busy)
+
+    def test_slot_table_lookup(self):
+        """Checks the binary lifting lookup of the slot table against a linear scan, one task at a time and batched."""
+        gaps, lengths = np.random.uniform(0, 3, 200), np.random.uniform(0, 8, 200)
+        starts = np.cumsum(gaps + lengths) - lengths
+        slots = SlotTable(starts, starts + lengths)
+        stamps, durations = np.random.uniform(0, starts[100], 100), np.random.uniform(0, 7.5, 100)
+        batched = slots.nextSlots(stamps, durations)
+        for k, (stamp, duration) in enumerate(zip(stamps, durations)):
+            expected = next(
+                (max(stamp, a), b) for a, b in zip(slots.starts, slots.ends) if max(stamp, a) + duration <= b
+            )
+            assert slots.nextSlot(stamp, duration) == expected
+            assert (batched[0][k], batched[1][k]) == expected
+
+    def test_move_deltas(self):
+        """Checks the incremental energy of insertion, block move and reversal proposals against a full evaluation."""
+        N = 25
+        table = MCMCScheduler(generateManyDemoTasks(N)).table
+        engine, reference = EnergyEngine.fromTable(table), EnergyEngine.fromTable(table)
+        energy = engine.reset(random.sample(range(N), N))
+        for _ in range(300):
+            length = random.randint(1, 5)
+            delta = random.choice(
+                (
+                    lambda: engine.insertionDelta(random.randrange(N), random.randrange(N)),
+                    lambda: engine.blockMoveDelta(
+                        random.randrange(N - length + 1), length, random.randrange(N - length + 1)
+                    ),
+                    lambda: engine.reversalDelta(random.randrange(N), random.randrange(N)),
+                    lambda: engine.swapDelta(random.randrange(N), random.randrange(N)),
+                )
+            )()
+            engine.accept()
+            energy += delta
+            assert sorted(engine.state) == list(range(N))
+            assert reference.reset(engine.state) == pytest.approx(energy)
+            assert reference.ends == pytest.approx(engine.ends)
+
+    def test_move_set_statistics(self):
+        """Runs the pure Python scheduler with all move types and checks the per-move statistics."""
+        moves = MoveSet(swap=0.4, insertion=0.2, blockMove=0.2, reversal=0.2)
+        scheduler = MCMCScheduler(generateManyDemoTasks(15), moves=moves)
+        result = scheduler.schedule()
+        assert len(result) == len(scheduler.tasks)
+        assert set(scheduler.moveStats) == {"swap", "insertion", "blockMove", "reversal"}
+        assert sum(stats.proposedSteps for stats in scheduler.moveStats.values()) == 15 * 15**2
+        for stats in scheduler.moveStats.values():
+            assert stats.proposedSteps > 0
+            assert 0 < stats.acceptanceRate <= 1
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_supported_moves(self, Scheduler: type[AbstractScheduler]):
+        """Proposes every move type of a move set on each scheduler, and rejects moves that a scheduler excludes."""
+        tasks = generateManyDemoTasks(8)
+        assert Scheduler(tasks, moves=MoveSet()).moves == MoveSet()
+        moves = MoveSet(swap=0.4, insertion=0.2, blockMove=0.2, reversal=0.2)
+        scheduler = Scheduler(tasks, moves=moves)
+        assert len(scheduler.schedule(maxSteps=400)) == len(tasks)
+        assert set(scheduler.moveStats) == {"swap", "insertion", "blockMove", "reversal"}
+        assert all(stats.proposedSteps > 0 for stats in scheduler.moveStats.values())
+
+        class SwapScheduler(Scheduler):
+            supportedMoves = ("swap",)
+
+        with pytest.raises(ValueError, match="insertion"):
+            SwapScheduler(tasks, moves=moves)
+        with pytest.raises(ValueError, match="insertion"):
+            DecomposedScheduler(tasks, SwapScheduler, moves=moves)
+        assert DecomposedScheduler(tasks, CppMCMCScheduler, moves=moves).windowScheduler([0, 1], 0.0).moves == moves
+
+    def test_adaptive_annealing(self):
+        """Checks that the adaptive schedule keeps cooling and stops after at most maxSweeps sweeps."""
+        assert MCMCScheduler(generateManyDemoTasks(3), 42).seed == 42  # the seed comes second, as in every scheduler
+        with pytest.raises(TypeError):
+            MCMCScheduler(generateManyDemoTasks(3), None, None, True)  # type: ignore[misc]
+        scheduler = MCMCScheduler(generateManyDemoTasks(20), seed=3, adaptive=True, maxSweeps=25)
+        result = scheduler.schedule()
+        assert len(result) == len(scheduler.tasks)
+        temperatures = [temperature for temperature, _, _ in scheduler.energyLog]
+        assert 2 <= len(temperatures) <= 25
+        assert temperatures == sorted(temperatures, reverse=True)
+        assert len(scheduler.acceptanceLog) == len(scheduler.energyLog)
+        assert scheduler.schedule() == MCMCScheduler(scheduler.tasks, seed=3, adaptive=True, maxSweeps=25).schedule()
+        assert len(scheduler.energyLog) == len(temperatures)  # a second run starts its own logs
+        scheduler.energyLog = [(0.01, 100.0, 0.25), (0.005, 100.5, 0.25)]
+        scheduler.acceptanceLog = [0.02, 0.015]
+        assert scheduler.hasConverged()
+        scheduler.energyLog[-1] = (0.005, 100.5, 400.0)  # still fluctuating, so not frozen yet
+        assert not scheduler.hasConverged()
+
+    def test_batch_energy(self):
+        """Compares the batched NumPy energy kernel with the energy engine, row by row."""
+        scheduler = NumpyMCMCScheduler(generateManyDemoTasks(40))
+        orderings = np.array([random.sample(range(40), 40) for _ in range(16)])
+        engine = EnergyEngine.fromTable(scheduler.table)
+        expected = [engine.reset(ordering) for ordering in orderings.tolist()]
+        assert batchEnergy(scheduler.table, orderings) == pytest.approx(expected)
+
+    def test_batched_metropolis(self):
+        """Runs the batched NumPy scheduler in the mode that tests every proposal of a batch."""
+        scheduler = NumpyMCMCScheduler(generateManyDemoTasks(12), batchSize=8, bestOfBatch=False)
+        result = scheduler.schedule()
+        assert len(result) == len(scheduler.tasks)
+        assert len(scheduler.energyLog) == 15
+        scheduler.schedule(maxSteps=13)  # the second batch is cut down to the five steps left
+        assert (scheduler.steps, scheduler.stopReason) == (13, "maxSteps")
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_multiple_chains(self, Scheduler: type[AbstractScheduler]):
+        """Runs several independently seeded chains on a pool and checks that the best of them is returned."""
+        scheduler = Scheduler(generateManyDemoTasks(10))
+        result = scheduler.schedule(chains=3, workers=2)
+        assert len(result) == len(scheduler.tasks)
+        assert len(scheduler.chainEnergies) == 3
+        ordering = [scheduler.table.uids.index(uid) for uid in sorted(result, key=lambda uid: result[uid].timestamp)]
+        assert scheduler.energy(ordering) == pytest.approx(min(scheduler.chainEnergies))
+        assert scheduler.energySpread == pytest.approx(max(scheduler.chainEnergies) - min(scheduler.chainEnergies))
+
+    @pytest.mark.parametrize("Scheduler", (RustyMCMCScheduler, NumbaMCMCScheduler, CppMCMCScheduler))
+    def test_trajectory(self, Scheduler: type[AbstractScheduler]):
+        """Checks that a seed determines the trajectory, which is the same in every backend as in pure Python."""
+        for N in (2, 7, 20):
+            tasks = generateManyDemoTasks(N)
+            for seed in (0, 1, 2**62 + 12345):
+                expected = MCMCScheduler(tasks).runChain(seed)
+                result = Scheduler(tasks).runChain(seed)
+                assert result.ordering == expected.ordering
+                assert result.starts == pytest.approx(expected.starts)
+            budget = Budget(maxSteps=3 * N**2 + 5)
+            expected, result = MCMCScheduler(tasks).runChain(3, budget), Scheduler(tasks).runChain(3, budget)
+            assert (result.ordering, result.steps, result.stopReason) == (expected.ordering, 3 * N**2 + 5, "maxSteps")
+        equal = [Task(str(i), 1.0, 1, 0, None) for i in range(4)]  # starts at the energy minimum, where swaps are free
+        for seed in range(4):
+            assert Scheduler(equal).runChain(seed).ordering == MCMCScheduler(equal).runChain(seed).ordering
+        first, second = Scheduler(tasks, seed=7).schedule(chains=2), Scheduler(tasks, seed=7).schedule(chains=2)
+        assert first == second
+        moveSets = (
+            MoveSet(swap=0.4, insertion=0.2, blockMove=0.2, reversal=0.2),
+            MoveSet(swap=0.0, insertion=1.0),
+            MoveSet(swap=0.0, blockMove=1.0, maxBlockLength=3),
+            MoveSet(swap=0.0, reversal=1.0),
+        )
+        for N in (3, 20):
+            tasks = generateManyDemoTasks(N)
+            for moves in moveSets:
+                reference, scheduler = MCMCScheduler(tasks, moves=moves), Scheduler(tasks, moves=moves)
+                assert scheduler.runChain(5).ordering == reference.runChain(5).ordering
+                assert scheduler.moveStats == reference.moveStats
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_anytime_budget(self, Scheduler: type[AbstractScheduler]):
+        """Stops the schedulers by step limit, time budget and cancel token, and checks the reported stop reason."""
+        N = 12
+        scheduler = Scheduler(generateManyDemoTasks(N))
+        assert len(scheduler.schedule()) == N
+        assert scheduler.stopReason == "finished"
+        assert len(scheduler.schedule(maxSteps=300)) == N
+        assert scheduler.stopReason == "maxSteps"
+        assert scheduler.steps <= 300 + N**2 * 8  # parallel tempering checks between rounds of all replicas
+        assert len(scheduler.schedule(timeBudget=0.0)) == N
+        assert (scheduler.stopReason, scheduler.steps) == ("timeBudget", 0)
+        token = CancelToken()
+        token.cancel()
+        assert len(scheduler.schedule(cancelToken=token)) == N
+        assert (scheduler.stopReason, scheduler.steps) == ("cancelled", 0)
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_iterate(self, Scheduler: type[AbstractScheduler]):
+        """Iterates over the snapshots of a chain, synchronously and asynchronously, and stops one early."""
+        N = 12
+        scheduler = Scheduler(generateManyDemoTasks(N), seed=3)
+        snapshots = list(scheduler.iterate())
+        assert snapshots and scheduler.stopReason == "finished"
+        assert [snapshot.steps for snapshot in snapshots] == sorted({snapshot.steps for snapshot in snapshots})
+        assert snapshots[-1].steps == scheduler.steps
+        assert all(0 <= snapshot.acceptanceRate <= 1 for snapshot in snapshots)
+        assert snapshots[-1].bestEnergy == pytest.approx(scheduler.energy(snapshots[-1].bestOrdering))
+        assert len(scheduler.timeSlots(snapshots[-1].bestOrdering, snapshots[-1].bestStarts)) == N
+
+        iterator = scheduler.iterate()
+        first = next(iterator)
+        iterator.close()
+        assert first.sweep == 1 and first.steps > 0
+
+        async def collect() -> list[Snapshot]:
+            return [snapshot async for snapshot in scheduler.aschedule(maxSteps=2 * N**2)]
+
+        snapshots = asyncio.run(collect())
+        assert snapshots and scheduler.stopReason == "maxSteps"
+
+    @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
+    def test_stats(self, Scheduler: type[AbstractScheduler], tmp_path: pathlib.Path):
+        """Collects the statistics of a run, including the energy terms, and appends them to a JSON lines file."""
+        N = 12
+        scheduler = Scheduler(generateManyDemoTasks(N), seed=3)
+        scheduler.schedule()
+        assert scheduler.stats is None
+
+        scheduler.enableStats(tmp_path / "stats.jsonl")
+        result = scheduler.schedule()
+        stats = scheduler.stats
+        assert stats.implementation == Scheduler.__name__ and stats.tasks == N
+        assert stats.steps == scheduler.steps > 0 and stats.stopReason == "finished"
+        assert stats.sweeps and stats.sweeps[-1].steps == stats.steps
+        assert stats.respreads is None or stats.respreads > 0
+        ordering = sorted(range(N), key=lambda index: result[scheduler.table.uids[index]].timestamp)
+        assert stats.energy.total == pytest.approx(scheduler.energy(ordering))
+        assert stats.energy.total == pytest.approx(scheduler.chainEnergies[0])
+
+        list(scheduler.iterate(maxSteps=2 * N**2))
+        assert scheduler.stats.stopReason == "maxSteps"
+        records = [json.loads(line) for line in (tmp_path / "stats.jsonl").read_text().splitlines()]
+        assert [record["stopReason"] for record in records] == ["finished", "maxSteps"]
+        assert records[0]["energy"]["total"] == pytest.approx(stats.energy.total)
+
+    @pytest.mark.parametrize(
+        "Scheduler, N", ((MCMCScheduler, 300), (RustyMCMCScheduler, 2000), (CppMCMCScheduler, 2000))
+    )
+    def test_cancel_from_thread(self, Scheduler: type[AbstractScheduler], N: int):
+        """Cancels a long-running schedule from another thread and checks that it returns promptly."""
+        token = CancelToken()
+        scheduler = Scheduler(generateManyDemoTasks(N, 0.0))
+        timer = threading.Timer(0.2, token.cancel)
+        timer.start()
+        start = time.monotonic()
+        result = scheduler.schedule(timeBudget=30.0, cancelToken=token)
+        assert time.monotonic() - start < 5.0
+        assert len(result) == len(scheduler.tasks)
+        assert scheduler.stopReason == "cancelled"
+
+    @pytest.mark.parametrize("delay", (0.0, 0.5))
+    def test_cancel_worker_processes(self, delay: float):
+        """Cancels chains running in worker processes, before and after they started, without waiting for them."""
+        N = 200
+        token = CancelToken()
+        scheduler = MCMCScheduler(generateManyDemoTasks(N, 0.0))
+        timer = threading.Timer(delay, token.cancel)
+        timer.start()
+        start = time.monotonic()
+        result = scheduler.schedule(chains=2, workers=2, cancelToken=token)
+        assert time.monotonic() - start < delay + 5.0
+        assert len(result) == N and scheduler.stopReason == "cancelled"
+        while multiprocessing.active_children():  # the abandoned chains stop, and their workers exit
+            assert time.monotonic() - start < delay + 10.0
+            time.sleep(0.05)
+
+    def test_cancel_numba_sweep(self):
+        """Cancels from another thread while the Numba kernel runs a single long sweep, which releases the GIL."""
+        N = 1500
+        token = CancelToken()
+        scheduler = NumbaMCMCScheduler(generateManyDemoTasks(N, 0.0))
+        timer = threading.Timer(0.2, token.cancel)
+        timer.start()
+        start = time.monotonic()
+        scheduler.schedule(timeBudget=60.0, cancelToken=token)
+        assert time.monotonic() - start < 5.0
+        assert scheduler.stopReason == "cancelled" and scheduler.steps < N**2  # stopped within the first sweep
+
+    def test_split_mix(self):
+        """Checks the stream of the shared random number generator against reference values of SplitMix64."""
+        rng = SplitMix64(1234567)
+        expected = (6457827717110365317, 3203168211198807973, 9817491932198370423)
+        assert [rng.random() for _ in range(3)] == [value // 2**11 / 2**53 for value in expected]
+        assert 0 <= rng.randrange(10) < 10
+
+    @pytest.mark.parametrize("Scheduler", (RustyMCMCScheduler, CppMCMCScheduler))
+    def test_native_threads(self, Scheduler: type[AbstractScheduler]):
+        """Runs several native schedules concurrently on threads, and multiple chains on a thread pool."""
+        assert Scheduler.releasesGIL
+        schedulers = [Scheduler(generateManyDemoTasks(20)) for _ in range(3)]
+        with concurrent.futures.ThreadPoolExecutor(3) as executor:
+            results = list(executor.map(lambda scheduler: scheduler.schedule(), schedulers))
+        for scheduler, result in zip(schedulers, results):
+            assert len(result) == len(scheduler.tasks)
+        result = schedulers[0].schedule(chains=3)
+        assert len(result) == len(schedulers[0].tasks)
+
+    def test_chain_time_budget(self):
+        """Checks that an exhausted time budget still returns the result of at least one chain."""
+        scheduler = MCMCScheduler(generateManyDemoTasks(30))
+        result = scheduler.schedule(chains=4, workers=1, timeBudget=0.0)
+        assert len(result) == len(scheduler.tasks)
+        assert 1 <= len(scheduler.chainEnergies) <= 4
+
     @pytest.mark.parametrize("Scheduler", ALL_IMPLEMENTATIONS)
     def do_not_test_real_data_scheduling(self, Scheduler: type[AbstractScheduler]):
         """Schedules based on what autoInit() gives us."""
@@ -87,11 +573,73 @@ class TestScheduler:
         outFolder = pathlib.Path(tempfile.gettempdir())
         melon.scheduleAllAndExport(str(outFolder / "schedule.ics"), Scheduler=Scheduler)
 
+    def test_parallel_tempering_statistics(self):
+        """Checks the per-replica statistics collected by the parallel tempering scheduler."""
+        scheduler = ParallelTemperingScheduler(generateManyDemoTasks(20), replicas=4, rounds=6, workers=2)
+        result = scheduler.schedule()
+        assert len(result) == len(scheduler.tasks)
+        assert scheduler.ladder == sorted(scheduler.ladder)
+        assert max(scheduler.temperatures()) == pytest.approx(scheduler.ladder[-1])  # the inherited schedule
+        assert scheduler.bestEnergy == pytest.approx(
+            scheduler.engine.reset(scheduler.state) - scheduler.constantEnergyMinimum
+        )
+        for stats in scheduler.replicaStats:
+            assert stats.proposedSteps == 6 * 20**2
+            assert 0 <= stats.acceptanceRate <= 1
+        assert sum(stats.attemptedExchanges for stats in scheduler.replicaStats) == 6 * 3 // 2
+
+    def test_table_window(self):
+        """Checks that a window of the task table spreads its tasks exactly like the tail of the full ordering."""
+        N = 30
+        table = MCMCScheduler(generateManyDemoTasks(N)).table
+        engine = EnergyEngine.fromTable(table)
+        state = random.sample(range(N), N)
+        engine.reset(state)
+        for position in (1, 10, 29):
+            offset = engine.ends[position - 1]
+            window = EnergyEngine.fromTable(table.window(state[position:], offset))
+            window.reset(list(range(N - position)))
+            assert np.allclose(np.array(window.ends) + offset, engine.ends[position:])
+            assert np.array_equal(np.array(window.dues) == 0, table.due[state[position:]] == 0)
+
+    @pytest.mark.parametrize("Backend", (MCMCScheduler, NumpyMCMCScheduler, CppMCMCScheduler))
+    @pytest.mark.parametrize("horizon", (None, 40.0))
+    def test_decomposed_scheduler(self, Backend: type[AbstractScheduler], horizon: float | None):
+        """Anneals a larger task set in windows and checks the stitched schedule against the greedy ordering."""
+        tasks = generateManyDemoTasks(60)
+        scheduler = DecomposedScheduler(tasks, Backend, windowSize=15, horizon=horizon, repairSize=4, workers=2)
+        assert all(len(window) <= 15 for window in scheduler.partition(list(range(60))))
+        assert scheduler.respreads == 0  # counted from construction on, also by repairEdge() outside of runChain()
+        snapshots = []
+        ordering = scheduler.runChain(1, progress=snapshots.append).ordering
+        assert sorted(ordering) == list(range(60))
+        assert len(snapshots) >= len(scheduler.windowEnergies)
+        result = scheduler.schedule()
+        assert len(result) == 60 and scheduler.steps > 0
+        ordering = [scheduler.table.uids.index(uid) for uid in sorted(result, key=lambda uid: result[uid].timestamp)]
+        assert scheduler.energy(ordering) == pytest.approx(scheduler.chainEnergies[0])
+        initial = scheduler.initialState if horizon is None else earliestDueDate(scheduler.table)
+        assert scheduler.chainEnergies[0] <= scheduler.energy(initial)
+
+    def test_benchmark_suite(self):
+        """Runs a tiny benchmark and checks that the comparison flags slower and worse results as regressions."""
+        report = runSuite({"MCMCScheduler": MCMCScheduler}, [Fixture(8, 0.5, seed=1)], repeats=2)
+        assert report["metadata"]["python"]
+        (result,) = report["results"]
+        assert result["runtimeMedian"] > 0
+        assert 0 < result["quality"] <= 1
+        assert result["coldStart"] > 0
+        assert compareReports(report, report) == []
+        baseline = {"results": [dict(result, runtimeMedian=result["runtimeMedian"] / 10, runtimeIQR=0.0)]}
+        assert len(compareReports(report, baseline)) == 1
+        baseline["results"][0]["quality"] = result["quality"] + 0.1
+        assert len(compareReports(report, baseline)) == 2
+        baseline["results"][0]["coldStart"] = result["coldStart"] / 10
+        assert len(compareReports(report, baseline)) == 3
+
     @pytest.mark.filterwarnings("ignore:Enum:DeprecationWarning")
     def test_purepython_convergence_plot(self):
         """Plots the MCMC convergence."""
-        import numpy as np
-
         scheduler = MCMCScheduler(generateDemoTasks())
         scheduler.schedule()
         plotConvergence(np.array([scheduler.energyLog]), ["label"], filename=None)